@@ -0,0 +1,178 @@
+"""
+Контроль допуска обновлений к обработчикам
+
+Outer middleware диспетчера решает до фильтров и обработчика, стоит ли
+вообще обрабатывать обновление. По порядку проверок:
+- скользящее окно на пользователя: не больше user_limit обновлений
+  за user_window секунд (спам /timer и кнопками таймеров);
+- скользящее окно на чат: то же для группы целиком;
+- задержка цикла событий: если цикл отстает больше lag_threshold,
+  обновление сбрасывается без обработки;
+- предел одновременно работающих обработчиков.
+
+Отброшенное обновление стоит одной проверки словаря: вместо обработки
+чат получает заранее готовый короткий ответ. На превышение лимита
+отвечается не чаще раза в окно, чтобы ответы на спам сами не стали
+нагрузкой; при перегрузке ответ получает каждое отброшенное обновление,
+их число уже ограничено лимитами. Что и почему отброшено,
+считается в метрике timer_bot_updates_shed_total.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from aiogram.types import CallbackQuery, Message
+
+from metrics import UPDATES_SHED
+from rendering import OVERLOADED_TEXT, RATE_LIMITED_TEXT
+from runtime import LoopLagMonitor
+from sender import OutboundQueue
+
+logger = logging.getLogger(__name__)
+
+# Причины отказа (значения метки reason)
+SHED_USER = 'user'
+SHED_CHAT = 'chat'
+SHED_LAG = 'lag'
+SHED_CONCURRENCY = 'concurrency'
+SHED_REASONS = (SHED_USER, SHED_CHAT, SHED_LAG, SHED_CONCURRENCY)
+
+
+class SlidingWindowLimiter:
+    """
+    Не больше limit событий на ключ за последние window секунд
+    limit <= 0 - без ограничений
+
+    На ключ хранится не больше limit отметок времени; ключи без событий
+    в окне удаляются раз в window секунд.
+    """
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+        self._events: Dict[Hashable, Deque[float]] = {}
+        self._next_purge = 0.0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def allow(self, key: Hashable, now: float) -> bool:
+        """Учитывает событие и возвращает True, если оно укладывается в лимит"""
+        if self.limit <= 0:
+            return True
+        if now >= self._next_purge:
+            self._purge(now)
+
+        events = self._events.get(key)
+        if events is None:
+            events = self._events[key] = deque()
+        horizon = now - self.window
+        while events and events[0] <= horizon:
+            events.popleft()
+        # Отказы не занимают окно: после паузы ключ снова проходит
+        if len(events) >= self.limit:
+            return False
+        events.append(now)
+        return True
+
+    def _purge(self, now: float) -> None:
+        horizon = now - self.window
+        stale = [key for key, events in self._events.items() if not events or events[-1] <= horizon]
+        for key in stale:
+            del self._events[key]
+        self._next_purge = now + self.window
+
+
+class AdmissionMiddleware:
+    """
+    Outer middleware aiogram для сообщений и нажатий кнопок
+
+    Пользователь и чат берутся из event_from_user и event_chat, которые
+    заполняет aiogram до outer middleware событий.
+    """
+
+    def __init__(
+        self,
+        outbound: OutboundQueue,
+        lag_monitor: LoopLagMonitor,
+        user_limit: int = 20,
+        user_window: float = 10.0,
+        chat_limit: int = 60,
+        chat_window: float = 10.0,
+        max_in_flight: int = 2048,
+        lag_threshold: float = 0.5,
+    ):
+        self._outbound = outbound
+        self._lag_monitor = lag_monitor
+        self._users = SlidingWindowLimiter(user_limit, user_window)
+        self._chats = SlidingWindowLimiter(chat_limit, chat_window)
+        # Ответ об отказе по лимиту - не чаще раза в окно пользователя на чат
+        self._notices = SlidingWindowLimiter(1, user_window)
+        self._max_in_flight = max_in_flight
+        self._lag_threshold = lag_threshold
+        self._in_flight = 0
+        self._shed = {reason: UPDATES_SHED.labels(reason) for reason in SHED_REASONS}
+        self._shed_counts = dict.fromkeys(SHED_REASONS, 0)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def _check(self, user_id: Optional[int], chat_id: Optional[int], now: float) -> Optional[str]:
+        """Причина отказа или None, если обновление можно обрабатывать"""
+        if user_id is not None and not self._users.allow(user_id, now):
+            return SHED_USER
+        # В личном чате окно пользователя уже проверено
+        if chat_id is not None and chat_id != user_id and not self._chats.allow(chat_id, now):
+            return SHED_CHAT
+        if self._lag_threshold > 0 and self._lag_monitor.lag > self._lag_threshold:
+            return SHED_LAG
+        if 0 < self._max_in_flight <= self._in_flight:
+            return SHED_CONCURRENCY
+        return None
+
+    async def _refuse(self, event: Any, chat_id: Optional[int], reason: str, now: float) -> None:
+        self._shed[reason].inc()
+        self._shed_counts[reason] += 1
+        if self._shed_counts[reason] == 1:
+            logger.warning("Контроль допуска начал отбрасывать обновления: %s", reason)
+        if chat_id is None:
+            return
+        # При перегрузке отказ получает каждый: эти обновления уже прошли лимиты
+        limited = reason in (SHED_USER, SHED_CHAT)
+        if limited and not self._notices.allow(chat_id, now):
+            return
+
+        text = RATE_LIMITED_TEXT if limited else OVERLOADED_TEXT
+        if isinstance(event, CallbackQuery):
+            # Ответ на нажатие нужен, чтобы у кнопки пропали часики
+            try:
+                await event.answer(text)
+            except Exception as e:
+                logger.debug("Не удалось ответить на отброшенное нажатие: %s", e)
+        elif isinstance(event, Message):
+            self._outbound.submit(chat_id, text)
+
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        user = data.get('event_from_user')
+        chat = data.get('event_chat')
+        user_id = user.id if user else None
+        chat_id = chat.id if chat else None
+
+        now = time.monotonic()
+        reason = self._check(user_id, chat_id, now)
+        if reason is not None:
+            await self._refuse(event, chat_id, reason, now)
+            return None
+
+        self._in_flight += 1
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> Dict[str, int]:
+        """Число отброшенных обновлений по причинам"""
+        return dict(self._shed_counts)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Задержка для обычных пользователей во время спама
+
+Обычные пользователи по замкнутому циклу шлют /timer (следующая команда -
+после ответа и паузы). Одновременно несколько скриптов заваливают бота
+командами /timer с частотой --abuse-rate обновлений в секунду на скрипт:
+каждая такая команда отменяет и пересоздает таймер.
+
+Бот запускается дважды: с выключенным контролем допуска и с настройками
+по умолчанию. Отчет для каждого запуска:
+- задержка ответа обычным пользователям (p50/p90/p99/max);
+- сколько команд спамеров дошло до обработчика и сколько получили
+  готовый ответ об отказе.
+
+Запуск: python benchmarks/bench_admission.py [--users 200] [--abusers 5] [--abuse-rate 200] [--duration 10]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_message_update  # noqa: E402
+from harness import ADMISSION_DISABLED, BotProcess, describe  # noqa: E402
+
+FIRST_USER_ID = 60_000_000
+FIRST_ABUSER_ID = 61_000_000
+RESPONSE_TIMEOUT = 15.0
+REFUSAL_MARK = '⏳'
+
+
+class Collector:
+    """Ответы обычным пользователям и спамерам"""
+
+    def __init__(self, fake: FakeTelegram):
+        self.waiters: Dict[int, asyncio.Future] = {}
+        self.latencies: List[float] = []
+        self.timeouts = 0
+        self.refused = 0
+        self.abuse_handled = 0
+        self.abuse_refused = 0
+        fake.on_sent = self._on_sent
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method != 'sendMessage':
+            return
+        if message.chat_id >= FIRST_ABUSER_ID:
+            if message.text.startswith(REFUSAL_MARK):
+                self.abuse_refused += 1
+            else:
+                self.abuse_handled += 1
+            return
+        if message.text.startswith(REFUSAL_MARK):
+            self.refused += 1
+        waiter = self.waiters.pop(message.chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message.at)
+
+
+async def user(fake: FakeTelegram, collector: Collector, ids, chat_id: int, until: float, think: float) -> None:
+    loop = asyncio.get_running_loop()
+    while time.monotonic() < until:
+        waiter = collector.waiters[chat_id] = loop.create_future()
+        started = time.monotonic()
+        fake.push_update(make_message_update(next(ids), chat_id, chat_id, f'/timer {random.randint(600, 3600)}s'))
+        try:
+            collector.latencies.append(await asyncio.wait_for(waiter, RESPONSE_TIMEOUT) - started)
+        except asyncio.TimeoutError:
+            collector.waiters.pop(chat_id, None)
+            collector.timeouts += 1
+        await asyncio.sleep(random.expovariate(1 / think))
+
+
+async def abuser(fake: FakeTelegram, ids, chat_id: int, until: float, rate: float) -> int:
+    """Шлет команды пачками раз в 10 мс, не дожидаясь ответов"""
+    sent = 0
+    started = time.monotonic()
+    while time.monotonic() < until:
+        due = int((time.monotonic() - started) * rate)
+        for _ in range(due - sent):
+            fake.push_update(make_message_update(next(ids), chat_id, chat_id, f'/timer {random.randint(1, 3600)}s'))
+        sent = max(sent, due)
+        await asyncio.sleep(0.01)
+    return sent
+
+
+async def scenario(args, title: str, env: Dict[str, str]) -> None:
+    fake = FakeTelegram(latency=args.latency)
+    api_url = await fake.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = BotProcess(api_url, workdir, env)
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            await asyncio.sleep(0.5)
+            collector = Collector(fake)
+            ids = itertools.count(1)
+            until = time.monotonic() + args.duration
+
+            results = await asyncio.gather(
+                *(abuser(fake, ids, FIRST_ABUSER_ID + i, until, args.abuse_rate) for i in range(args.abusers)),
+                *(user(fake, collector, ids, FIRST_USER_ID + i, until, args.think) for i in range(args.users)),
+            )
+            # Ответы на последние команды спамеров
+            await asyncio.sleep(2)
+            pushed = sum(results[:args.abusers])
+
+            print(f"{title}:")
+            print(f"  обычные пользователи: ответов {len(collector.latencies)}, без ответа {collector.timeouts}, "
+                  f"отказов {collector.refused}, мс: {describe(collector.latencies)}")
+            print(f"  спам: отправлено {pushed}, обработано {collector.abuse_handled}, "
+                  f"готовых отказов {collector.abuse_refused}")
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+async def run(args) -> None:
+    print(f"пользователей {args.users}, спамеров {args.abusers} по {args.abuse_rate:.0f} обн./с, "
+          f"{args.duration:.0f} с")
+    await scenario(args, "без контроля допуска", ADMISSION_DISABLED)
+    await scenario(args, "с контролем допуска", {})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--abusers', type=int, default=5)
+    parser.add_argument('--abuse-rate', type=float, default=200.0, help='обновлений в секунду на спамера')
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--think', type=float, default=2.0, help='средняя пауза пользователя, с (чаще - уже упрется в лимит)')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа fake API, с')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Массовое срабатывание таймеров: объединение уведомлений и опоздание
+
+Как при нажатии одной и той же кнопки многими пользователями: за долю
+секунды запускаются таймеры одинаковой длительности в P личных чатах и
+в G группах по U участников. Все они истекают почти в одном тике.
+
+Отчет:
+- сколько сообщений "Время вышло!" отправлено на сколько таймеров
+  (в группе таймеры одного тика уходят одним сообщением с упоминаниями);
+- опоздание каждого уведомления относительно дедлайна его таймера;
+- пиковая частота отправки в окне 1 с и 0.1 с - всплеск должен уходить
+  равномерно, не быстрее глобального лимита;
+- оценка худшего опоздания без объединения для сравнения.
+
+Контроль допуска выключен; с --admission бот работает с лимитами по
+умолчанию - так проверяется, что они пропускают такой всплеск.
+
+С --workers N бот запускается в режиме шардов: срабатывания группы
+должны по-прежнему уходить одним сообщением, хотя таймеры раскиданы
+по N воркерам (глобальный лимит у каждого воркера свой).
+
+Запуск: python benchmarks/bench_burst.py [--private 300] [--groups 10] [--members 30] [--duration 5] [--workers 0] [--admission]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import re
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_message_update  # noqa: E402
+from harness import ADMISSION_DISABLED, BotProcess, describe, peak_rate  # noqa: E402
+
+FIRE_MARKS = ('⏰ Время вышло!', '🔔 Напоминание')
+MENTION = re.compile(r'tg://user\?id=(\d+)')
+FIRST_CHAT_ID = 40_000_000
+FIRST_GROUP_ID = -1_000_000_000
+START_TIMEOUT = 30.0
+
+
+class BurstCollector:
+    """Сопоставляет уведомления с дедлайнами запущенных таймеров"""
+
+    def __init__(self, fake: FakeTelegram):
+        # (chat_id, user_id) -> ожидаемое время срабатывания (monotonic)
+        self.expected: Dict[Tuple[int, int], float] = {}
+        self.durations: Dict[Tuple[int, int], int] = {}
+        self.replies = 0
+        self.replied = asyncio.Event()
+        self.awaiting_replies = 0
+        self.fire_times: List[float] = []
+        self.group_messages = 0
+        self.lateness: List[float] = []
+        self.notified = 0
+        self.unmatched = 0
+        self._pending_starts: Dict[int, List[int]] = {}
+        fake.on_sent = self._on_sent
+
+    def started(self, chat_id: int, user_id: int, duration: int) -> None:
+        self._pending_starts.setdefault(chat_id, []).append(user_id)
+        self.durations[(chat_id, user_id)] = duration
+        self.awaiting_replies += 1
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method != 'sendMessage':
+            return
+        if message.text.startswith(FIRE_MARKS):
+            self.fire_times.append(message.at)
+            if message.chat_id <= FIRST_GROUP_ID:
+                self.group_messages += 1
+            for line in message.text.split('\n'):
+                mention = MENTION.search(line)
+                user_id = int(mention.group(1)) if mention else message.chat_id
+                expected = self.expected.pop((message.chat_id, user_id), None)
+                if expected is None:
+                    self.unmatched += 1
+                else:
+                    self.notified += 1
+                    self.lateness.append(message.at - expected)
+            return
+
+        # Ответ о запуске: ответы в чате приходят в порядке команд
+        users = self._pending_starts.get(message.chat_id)
+        if users:
+            key = (message.chat_id, users.pop(0))
+            self.expected[key] = message.at + self.durations[key]
+            self.replies += 1
+            if self.replies == self.awaiting_replies:
+                self.replied.set()
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency)
+    api_url = await fake.start()
+    env = {} if args.admission else dict(ADMISSION_DISABLED)
+    env['OUTBOUND_GLOBAL_RATE'] = str(args.rate)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.workers:
+            env.update({
+                'SHARD_WORKERS': str(args.workers),
+                'SHARD_SOCKET': os.path.join(workdir, 'shards.sock'),
+                'SHARD_DIR': os.path.join(workdir, 'shards'),
+                'HANDOFF_SOCKET': '',
+            })
+        bot = BotProcess(api_url, workdir, env)
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            # Воркерам нужно время, чтобы подключиться к фронту и разобрать шарды
+            await asyncio.sleep(3.0 if args.workers else 0.5)
+            collector = BurstCollector(fake)
+            ids = itertools.count(1)
+
+            # Все таймеры запускаются одной пачкой обновлений
+            text = f'/timer {args.duration}s'
+            for i in range(args.private):
+                chat_id = FIRST_CHAT_ID + i
+                collector.started(chat_id, chat_id, args.duration)
+                fake.push_update(make_message_update(next(ids), chat_id, chat_id, text))
+            for g in range(args.groups):
+                chat_id = FIRST_GROUP_ID - g
+                for m in range(args.members):
+                    user_id = FIRST_CHAT_ID + 1_000_000 + g * args.members + m
+                    collector.started(chat_id, user_id, args.duration)
+                    fake.push_update(make_message_update(next(ids), chat_id, user_id, text, 'supergroup'))
+            await asyncio.wait_for(collector.replied.wait(), START_TIMEOUT)
+            fake.sent.clear()
+
+            timers = len(collector.expected)
+            deadline = time.monotonic() + args.duration + args.wait
+            while collector.expected and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+
+            messages = len(collector.fire_times)
+            mode = f", воркеров {args.workers}" if args.workers else ''
+            print(f"таймеров: {timers} (личных {args.private}, групп {args.groups} x {args.members}), "
+                  f"глобальный лимит {args.rate:.0f}/с{mode}")
+            print(f"уведомлено: {collector.notified}, не дождались: {len(collector.expected)}, "
+                  f"лишних: {collector.unmatched}")
+            print(f"сообщений о срабатывании: {messages} "
+                  f"({timers / messages if messages else 0:.1f} таймеров на сообщение)")
+            if args.groups:
+                print(f"из них в группы: {collector.group_messages} на {args.groups} групп")
+            print(f"опоздание относительно дедлайна, мс: {describe(collector.lateness)}")
+            print(f"пиковая частота отправки: {peak_rate(collector.fire_times, 1.0):.0f}/с в окне 1 с, "
+                  f"{peak_rate(collector.fire_times, 0.1):.0f}/с в окне 0.1 с")
+            print(f"оценка худшего опоздания: с объединением {messages / args.rate:.1f} с, "
+                  f"без объединения {max(timers / args.rate, (args.members - 3) * 3 if args.groups else 0):.1f} с")
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--private', type=int, default=300, help='личных чатов с таймером')
+    parser.add_argument('--groups', type=int, default=10)
+    parser.add_argument('--members', type=int, default=30, help='участников с таймером в каждой группе')
+    parser.add_argument('--duration', type=int, default=5, help='длительность таймеров, с')
+    parser.add_argument('--rate', type=float, default=30.0, help='OUTBOUND_GLOBAL_RATE бота')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа fake API, с')
+    parser.add_argument('--wait', type=float, default=60.0, help='сколько ждать уведомлений после дедлайна, с')
+    parser.add_argument('--workers', type=int, default=0, help='SHARD_WORKERS бота (0 - без шардов)')
+    parser.add_argument('--admission', action='store_true', help='контроль допуска с лимитами по умолчанию')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Живой отсчет: частота правок при многих видимых отсчетах
+
+В N личных чатах почти одновременно нажимается кнопка таймера, и под
+каждым сообщением идет отсчет. Наивная схема правила бы каждое
+сообщение раз в секунду - N правок в секунду; MessageEditor обновляет
+отсчет шагами и пропускает правки сверх MESSAGE_EDIT_RATE.
+
+Отчет:
+- число правок против наивной оценки;
+- пиковая частота правок в окне 1 с - не выше MESSAGE_EDIT_RATE плюс
+  запас корзины токенов (еще rate правок разом после простоя);
+- в скольких сообщениях в итоге показано "Время вышло!" и насколько
+  позже дедлайна.
+
+Контроль допуска выключен: меряются правки, а не отказы.
+
+Запуск: python benchmarks/bench_countdown.py [--chats 20] [--button timer_30s] [--rate 5]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_callback_update  # noqa: E402
+from harness import ADMISSION_DISABLED, BotProcess, describe, peak_rate  # noqa: E402
+
+FIRST_CHAT_ID = 50_000_000
+FINAL_MARK = '⏰ Время вышло!'
+
+
+class EditCollector:
+    """Время правок и финальных текстов по чатам"""
+
+    def __init__(self, fake: FakeTelegram):
+        self.edit_times: List[float] = []
+        self.first_edit: Dict[int, float] = {}
+        self.finished: Dict[int, float] = {}
+        fake.on_sent = self._on_sent
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method != 'editMessageText':
+            return
+        self.edit_times.append(message.at)
+        self.first_edit.setdefault(message.chat_id, message.at)
+        if FINAL_MARK in message.text:
+            self.finished.setdefault(message.chat_id, message.at)
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency)
+    api_url = await fake.start()
+    env = dict(ADMISSION_DISABLED, LIVE_COUNTDOWN='1', MESSAGE_EDIT_RATE=str(args.rate))
+    duration = int(args.duration)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = BotProcess(api_url, workdir, env)
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            await asyncio.sleep(0.5)
+            collector = EditCollector(fake)
+
+            for i in range(args.chats):
+                chat_id = FIRST_CHAT_ID + i
+                fake.push_update(make_callback_update(i + 1, chat_id, chat_id, args.button))
+
+            deadline = time.monotonic() + duration + args.wait
+            while len(collector.finished) < args.chats and time.monotonic() < deadline:
+                await asyncio.sleep(0.2)
+
+            # Дедлайн таймера - первая правка (запуск) плюс длительность
+            lateness = [
+                at - (collector.first_edit[chat_id] + duration)
+                for chat_id, at in collector.finished.items()
+            ]
+            edits = len(collector.edit_times)
+            print(f"отсчетов: {args.chats}, кнопка {args.button}, лимит правок {args.rate:.0f}/с")
+            print(f"правок: {edits}, наивно (раз в секунду): {args.chats * (duration + 1)}")
+            print(f"пиковая частота правок: {peak_rate(collector.edit_times, 1.0):.0f}/с в окне 1 с")
+            print(f"\"Время вышло!\" показано: {len(collector.finished)} из {args.chats}")
+            print(f"опоздание финальной правки, мс: {describe(lateness)}")
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--button', default='timer_30s')
+    parser.add_argument('--duration', type=float, default=30.0, help='длительность кнопки, с')
+    parser.add_argument('--rate', type=float, default=5.0, help='MESSAGE_EDIT_RATE')
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--wait', type=float, default=30.0, help='сколько ждать правок после дедлайна, с')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
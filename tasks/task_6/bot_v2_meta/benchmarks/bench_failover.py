@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Отказоустойчивость: смена лидера среди реплик
+
+Две реплики работают с общей базой координации (HA_BACKEND). Лидер A
+принимает обновления и запускает таймеры, реплика B в резерве читает
+журнал. Пользователи запускают таймеры с дедлайнами на --spread секунд
+вперед и все время шлют /status.
+
+- через --crash-at секунд лидер A падает (SIGKILL): B забирает аренду
+  после ее истечения;
+- A перезапускается и уходит в резерв;
+- через --stop-at секунд лидер B плавно останавливается (SIGTERM): он
+  отпускает аренду, и A забирает ее, не дожидаясь истечения.
+
+Отчет: сколько таймеров сработало, потеряно и продублировано; опоздание
+срабатываний по фазам; сколько после каждой смены лидера не было
+ответа на /status.
+
+Запуск: python benchmarks/bench_failover.py [--timers 300] [--spread 20] [--ttl 5]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_message_update  # noqa: E402
+from harness import BotProcess, describe  # noqa: E402
+
+FIRE_TEXT = '⏰ Время вышло!'
+FIRST_CHAT_ID = 80_000_000
+FIRST_PROBE_CHAT_ID = 89_000_000
+# Пробы /status по кругу из разных чатов, чтобы не упираться в лимит на пользователя
+PROBE_CHATS = 100
+RESPONSE_TIMEOUT = 30.0
+# Команды /timer шлются волнами, чтобы не упираться в предел одновременных обработчиков
+WAVE = 50
+
+
+class FailoverCollector:
+    """Срабатывания по чатам, ответы на /status и запуски таймеров"""
+
+    def __init__(self, fake: FakeTelegram):
+        self.expected: Dict[int, float] = {}
+        self.fires: Dict[int, List[float]] = {}
+        self.started: Dict[int, asyncio.Future] = {}
+        self.replies: List[float] = []
+        fake.on_sent = self._on_sent
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method != 'sendMessage':
+            return
+        if message.chat_id >= FIRST_PROBE_CHAT_ID:
+            self.replies.append(message.at)
+        elif message.text.startswith(FIRE_TEXT):
+            self.fires.setdefault(message.chat_id, []).append(message.at)
+        else:
+            waiter = self.started.get(message.chat_id)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(message.at)
+
+    def first_reply_after(self, moment: float) -> float:
+        """Через сколько после moment пришел первый ответ на /status"""
+        later = [at for at in self.replies if at > moment]
+        return min(later) - moment if later else float('inf')
+
+
+async def probe(fake: FakeTelegram, ids, until: float) -> None:
+    """Шлет /status раз в 0.1 с, не дожидаясь ответов"""
+    chats = itertools.cycle(range(FIRST_PROBE_CHAT_ID, FIRST_PROBE_CHAT_ID + PROBE_CHATS))
+    while time.monotonic() < until:
+        chat_id = next(chats)
+        fake.push_update(make_message_update(next(ids), chat_id, chat_id, '/status'))
+        await asyncio.sleep(0.1)
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency)
+    api_url = await fake.start()
+    # Общий лимит отправки поднят: опоздание - от смены лидера, а не от очереди отправки
+    env = {'HA_BACKEND': 'sqlite:bot_ha.db', 'HA_LEASE_TTL': str(args.ttl), 'OUTBOUND_GLOBAL_RATE': '1000'}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        first = BotProcess(api_url, workdir, dict(env, HA_NODE_ID='a'))
+        second = BotProcess(api_url, workdir, dict(env, HA_NODE_ID='b'))
+        restarted = BotProcess(api_url, workdir, dict(env, HA_NODE_ID='a2'))
+        first.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            second.start()
+            await asyncio.sleep(1.0)
+            collector = FailoverCollector(fake)
+            ids = itertools.count(1)
+            loop = asyncio.get_running_loop()
+
+            # Дедлайн отсчитывается от отправки команды - опоздание оценивается сверху
+            for i in range(args.timers):
+                if i and i % WAVE == 0:
+                    await asyncio.wait_for(asyncio.gather(*collector.started.values()), RESPONSE_TIMEOUT)
+                chat_id = FIRST_CHAT_ID + i
+                duration = 1 + round(i * (args.spread - 1) / max(1, args.timers - 1))
+                collector.started[chat_id] = loop.create_future()
+                collector.expected[chat_id] = time.monotonic() + duration
+                fake.push_update(make_message_update(next(ids), chat_id, chat_id, f'/timer {duration}s'))
+            await asyncio.wait_for(asyncio.gather(*collector.started.values()), RESPONSE_TIMEOUT)
+            began = time.monotonic()
+            last_deadline = max(collector.expected.values())
+            probes = asyncio.create_task(probe(fake, ids, last_deadline + 2))
+
+            await asyncio.sleep(max(0.0, began + args.crash_at - time.monotonic()))
+            crashed = time.monotonic()
+            first.kill()
+            restarted.start()
+
+            await asyncio.sleep(max(0.0, began + args.stop_at - time.monotonic()))
+            stopped = time.monotonic()
+            await second.stop()
+
+            await probes
+            await asyncio.sleep(max(0.0, last_deadline + 3 - time.monotonic()))
+
+            lost = [chat_id for chat_id in collector.expected if chat_id not in collector.fires]
+            doubled = [chat_id for chat_id, fires in collector.fires.items() if len(fires) > 1]
+            phases: Dict[str, List[float]] = {'до падения': [], 'после падения': [], 'после остановки': []}
+            for chat_id, fires in collector.fires.items():
+                deadline = collector.expected[chat_id]
+                phase = 'до падения' if deadline < crashed else 'после падения' if deadline < stopped else 'после остановки'
+                phases[phase].append(fires[0] - deadline)
+
+            print(f"таймеров: {args.timers} на {args.spread:.0f} с, аренда {args.ttl:.1f} с, "
+                  f"падение через {args.crash_at:.0f} с, остановка через {args.stop_at:.0f} с")
+            print(f"сработало: {len(collector.fires)}, потеряно: {len(lost)}, дважды: {len(doubled)}")
+            for phase, drifts in phases.items():
+                print(f"  опоздание {phase:<15} n={len(drifts):<5} мс: {describe(drifts)}")
+            print(f"без ответа на /status: после падения лидера {collector.first_reply_after(crashed):.2f} с, "
+                  f"после плавной остановки {collector.first_reply_after(stopped):.2f} с")
+        finally:
+            for replica in (first, second, restarted):
+                await replica.stop()
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, default=300)
+    parser.add_argument('--spread', type=float, default=20.0, help='дедлайны через 1..spread секунд')
+    parser.add_argument('--ttl', type=float, default=5.0, help='HA_LEASE_TTL, с')
+    parser.add_argument('--crash-at', type=float, default=4.0, help='когда убить лидера, с')
+    parser.add_argument('--stop-at', type=float, default=13.0, help='когда плавно остановить нового лидера, с')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа fake API, с')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Перезапуск без простоя: передача таймеров новому экземпляру
+
+Сценарий выкатки: работает экземпляр A, пользователи запускают таймеры
+с дедлайнами, разбросанными на --spread секунд вперед, и все время шлют
+/status. Через --switch-at секунд в том же каталоге запускается
+экземпляр B: он забирает таймеры у A через сокет передачи работы, A
+дописывает уведомления и завершается.
+
+Проверяется:
+- каждый таймер сработал ровно один раз (не потерян и не продублирован);
+- опоздание срабатываний до, во время и после передачи;
+- задержка ответов на /status вокруг переключения (окно без приема);
+- A завершился сам, B остался работать.
+
+Запуск: python benchmarks/bench_handoff.py [--timers 300] [--spread 12] [--switch-at 4]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_message_update  # noqa: E402
+from harness import BotProcess, describe  # noqa: E402
+
+FIRE_TEXT = '⏰ Время вышло!'
+FIRST_CHAT_ID = 70_000_000
+FIRST_PROBE_CHAT_ID = 79_000_000
+# Пробы /status по кругу из разных чатов, чтобы не упираться в лимит на пользователя
+PROBE_CHATS = 100
+RESPONSE_TIMEOUT = 30.0
+# Команды /timer шлются волнами, чтобы не упираться в предел одновременных обработчиков
+WAVE = 50
+# Общий лимит отправки поднят: опоздание срабатываний - от планировщика и передачи,
+# а не от очереди 30 сообщений в секунду
+ENV = {'OUTBOUND_GLOBAL_RATE': '1000'}
+
+
+class HandoffCollector:
+    """Срабатывания по чатам и ответы на /status"""
+
+    def __init__(self, fake: FakeTelegram):
+        self.expected: Dict[int, float] = {}
+        self.fires: Dict[int, List[float]] = {}
+        self.started: Dict[int, asyncio.Future] = {}
+        self.probe: asyncio.Future = asyncio.get_running_loop().create_future()
+        fake.on_sent = self._on_sent
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method != 'sendMessage':
+            return
+        if message.chat_id >= FIRST_PROBE_CHAT_ID:
+            if not self.probe.done():
+                self.probe.set_result(message.at)
+        elif message.text.startswith(FIRE_TEXT):
+            self.fires.setdefault(message.chat_id, []).append(message.at)
+        else:
+            waiter = self.started.get(message.chat_id)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(message.at)
+
+
+async def probe_replies(fake: FakeTelegram, collector: HandoffCollector, ids, until: float) -> List[Tuple[float, float]]:
+    """Шлет /status по одному и меряет задержку ответа: (время отправки, задержка)"""
+    samples = []
+    loop = asyncio.get_running_loop()
+    chats = itertools.cycle(range(FIRST_PROBE_CHAT_ID, FIRST_PROBE_CHAT_ID + PROBE_CHATS))
+    while time.monotonic() < until:
+        collector.probe = loop.create_future()
+        started = time.monotonic()
+        chat_id = next(chats)
+        fake.push_update(make_message_update(next(ids), chat_id, chat_id, '/status'))
+        try:
+            samples.append((started, await asyncio.wait_for(collector.probe, RESPONSE_TIMEOUT) - started))
+        except asyncio.TimeoutError:
+            samples.append((started, RESPONSE_TIMEOUT))
+        await asyncio.sleep(0.1)
+    return samples
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency)
+    api_url = await fake.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        old = BotProcess(api_url, workdir, ENV)
+        new = BotProcess(api_url, workdir, ENV)
+        old.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            await asyncio.sleep(0.5)
+            collector = HandoffCollector(fake)
+            ids = itertools.count(1)
+            loop = asyncio.get_running_loop()
+
+            # Таймеры с дедлайнами через 1..spread секунд, равномерно; дедлайн
+            # отсчитывается от отправки команды - опоздание оценивается сверху
+            for i in range(args.timers):
+                if i and i % WAVE == 0:
+                    await asyncio.wait_for(asyncio.gather(*collector.started.values()), RESPONSE_TIMEOUT)
+                chat_id = FIRST_CHAT_ID + i
+                duration = 1 + round(i * (args.spread - 1) / max(1, args.timers - 1))
+                collector.started[chat_id] = loop.create_future()
+                collector.expected[chat_id] = time.monotonic() + duration
+                fake.push_update(make_message_update(next(ids), chat_id, chat_id, f'/timer {duration}s'))
+            await asyncio.wait_for(asyncio.gather(*collector.started.values()), RESPONSE_TIMEOUT)
+            began = time.monotonic()
+
+            probes = asyncio.create_task(probe_replies(fake, collector, ids, began + args.spread + 2))
+            await asyncio.sleep(max(0.0, began + args.switch_at - time.monotonic()))
+            switched = time.monotonic()
+            new.start()
+            while old.running and time.monotonic() < switched + 60:
+                await asyncio.sleep(0.1)
+            old_exited = time.monotonic() - switched
+            samples = await probes
+            await asyncio.sleep(max(0.0, max(collector.expected.values()) + 3 - time.monotonic()))
+
+            lost = [chat_id for chat_id in collector.expected if chat_id not in collector.fires]
+            doubled = [chat_id for chat_id, fires in collector.fires.items() if len(fires) > 1]
+            phases: Dict[str, List[float]] = {'до': [], 'во время': [], 'после': []}
+            for chat_id, fires in collector.fires.items():
+                deadline = collector.expected[chat_id]
+                phase = 'до' if deadline < switched else 'во время' if deadline < switched + old_exited else 'после'
+                phases[phase].append(fires[0] - deadline)
+
+            print(f"таймеров: {args.timers} на {args.spread} с, переключение через {args.switch_at} с")
+            print(f"сработало: {len(collector.fires)}, потеряно: {len(lost)}, дважды: {len(doubled)}")
+            for phase, drifts in phases.items():
+                print(f"  опоздание {phase:<9} n={len(drifts):<5} мс: {describe(drifts)}")
+            around = [latency for at, latency in samples if switched - 1 <= at <= switched + old_exited + 1]
+            print(f"старый экземпляр завершился через {old_exited:.1f} с, новый работает: {new.running}")
+            print(f"ответ на /status вокруг переключения, мс: {describe(around)}; "
+                  f"все время, мс: {describe([latency for _, latency in samples])}")
+        finally:
+            await old.stop()
+            await new.stop()
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, default=300)
+    parser.add_argument('--spread', type=float, default=12.0, help='дедлайны через 1..spread секунд')
+    parser.add_argument('--switch-at', type=float, default=4.0, help='когда запускать новый экземпляр, с')
+    parser.add_argument('--latency', type=float, default=0.02, help='задержка ответа fake API, с')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Стоимость операций индекса таймеров в зависимости от его размера
+
+Заполняет TimerIndex N таймерами (по несколько на пользователя плюс
+большая группа) и меряет время add/get/list/remove/pop_all для одного
+пользователя и проверки квоты чата. Время не должно расти с N.
+
+Запуск: python benchmarks/bench_index.py [--sizes 10000 100000 1000000] [--per-user 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import SOURCE_COMMAND  # noqa: E402
+from timers import TimerIndex, TimerRecord  # noqa: E402
+
+GROUP_CHAT_ID = -100
+GROUP_USERS = 5000
+
+
+def fill(size: int, per_user: int) -> TimerIndex:
+    index = TimerIndex()
+    now = time.monotonic()
+    for i in range(size // per_user):
+        # Часть пользователей сидит в одной большой группе
+        if i < GROUP_USERS:
+            key, chat_id = (GROUP_CHAT_ID, i), GROUP_CHAT_ID
+        else:
+            key, chat_id = (i, i), i
+        for n in range(per_user):
+            index.add(TimerRecord(key, chat_id, 60, now + random.uniform(1, 86400), SOURCE_COMMAND, 0.0, None, f't{n}'))
+    return index
+
+
+def per_call_us(statement, number: int = 20000) -> float:
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e6
+
+
+def bench(size: int, per_user: int) -> None:
+    index = fill(size, per_user)
+    key = (GROUP_CHAT_ID, 1)
+    now = time.monotonic()
+    extra = TimerRecord(key, GROUP_CHAT_ID, 60, now + 30, SOURCE_COMMAND, 0.0, None, 'extra')
+
+    def add_remove():
+        index.add(extra)
+        index.remove(key, 'extra')
+
+    def pop_restore():
+        for record in index.pop_all(key):
+            index.add(record)
+
+    results = {
+        'add+remove': per_call_us(add_remove),
+        'get': per_call_us(lambda: index.get(key, 't1')),
+        'list': per_call_us(lambda: index.list(key)),
+        'квота': per_call_us(lambda: (index.count_for_key(key), index.count_for_chat(GROUP_CHAT_ID))),
+        'pop_all': per_call_us(pop_restore),
+    }
+    print(f"N={len(index):>8}: " + ', '.join(f"{name} {value:.2f} мкс" for name, value in results.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--per-user', type=int, default=5)
+    args = parser.parse_args()
+    for size in args.sizes:
+        bench(size, args.per_user)
+
+
+if __name__ == '__main__':
+    main()
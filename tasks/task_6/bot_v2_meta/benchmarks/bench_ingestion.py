@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Сравнение приема обновлений через polling и webhook
+
+Запускает бота отдельным процессом против локального fake API,
+подает N команд /status (каждую от своего пользователя) и меряет
+пропускную способность и задержку от отправки обновления до ответа.
+Контроль допуска выключен: меряется прием, а не отказы.
+
+Запуск: python benchmarks/bench_ingestion.py [--updates 2000] [--rate 0] [--mode both]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, make_message_update  # noqa: E402
+from harness import ADMISSION_DISABLED, BotProcess, describe, free_port, latencies_by_chat, wait_for_sent  # noqa: E402
+
+FIRST_CHAT_ID = 10_000_000
+
+
+async def run_mode(mode: str, updates: int, rate: float) -> None:
+    fake = FakeTelegram()
+    api_url = await fake.start()
+    webhook_port = free_port()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = BotProcess(api_url, workdir, {
+            **ADMISSION_DISABLED,
+            'BOT_MODE': mode,
+            'WEBHOOK_URL': f'http://127.0.0.1:{webhook_port}',
+            'WEBHOOK_HOST': '127.0.0.1',
+            'WEBHOOK_PORT': str(webhook_port),
+            'WEBHOOK_SECRET': 'benchmark-secret',
+        })
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            # Даем боту закончить запуск после первого обращения к API
+            await asyncio.sleep(0.5)
+
+            injected = {}
+            started = time.monotonic()
+            for i in range(updates):
+                chat_id = FIRST_CHAT_ID + i
+                injected[chat_id] = time.monotonic()
+                fake.push_update(make_message_update(i + 1, chat_id, chat_id, '/status'))
+                if rate:
+                    await asyncio.sleep(max(0.0, started + (i + 1) / rate - time.monotonic()))
+
+            complete = await wait_for_sent(fake, updates, timeout=120)
+            elapsed = (fake.sent[-1].at if fake.sent else time.monotonic()) - started
+            latencies = latencies_by_chat(injected, fake.sent)
+
+            print(f"[{mode}] ответов {len(latencies)}/{updates}{'' if complete else ' (таймаут)'}")
+            print(f"[{mode}] пропускная способность: {len(latencies) / elapsed:.0f} обновлений/с")
+            print(f"[{mode}] задержка, мс: {describe(latencies)}")
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0, help='обновлений в секунду (0 - все сразу)')
+    parser.add_argument('--mode', choices=('polling', 'webhook', 'both'), default='both')
+    args = parser.parse_args()
+
+    modes = ('polling', 'webhook') if args.mode == 'both' else (args.mode,)
+    for mode in modes:
+        asyncio.run(run_mode(mode, args.updates, args.rate))
+
+
+if __name__ == '__main__':
+    main()
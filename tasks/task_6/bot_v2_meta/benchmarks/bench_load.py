@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест бота против локального fake Bot API
+
+Виртуальные пользователи (каждый в своем приватном чате) по замкнутому
+циклу шлют смесь /timer, /cancel, /status и нажатий inline-кнопок: следующее
+действие пользователь делает только после ответа бота на предыдущее.
+
+Отчет:
+- пропускная способность (обработанных обновлений в секунду);
+- задержка обработчиков: от отправки обновления до ответа бота;
+- точность срабатывания: фактическое время "Время вышло!" минус
+  запланированное (ответ бота о запуске + длительность);
+- рядом - задержка цикла событий бота по его /metrics: перцентили
+  пульса, опоздание срабатываний по часам бота и число остановок цикла
+  дольше SLOW_CALLBACK_THRESHOLD. Цикл событий бота выбирается --loop,
+  чтобы сравнить asyncio и uvloop на одной нагрузке;
+- прирост RSS процесса бота в пересчете на 100 тыс. активных таймеров.
+
+Контроль допуска выключен: его лимиты отказывали бы быстрым
+пользователям и занижали бы пропускную способность.
+
+Запуск: python benchmarks/bench_load.py [--users 500] [--duration 30] [--error-rate 0.01] [--loop uvloop]
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_callback_update, make_message_update  # noqa: E402
+from harness import ADMISSION_DISABLED, BotProcess, describe, describe_quantiles, free_port, rss_bytes, scrape_metrics  # noqa: E402
+
+FIRE_TEXT = '⏰ Время вышло!'
+FIRST_CHAT_ID = 20_000_000
+RESPONSE_TIMEOUT = 15.0
+
+# Кнопки, которые нажимают виртуальные пользователи, и длительность их таймеров
+BUTTONS = {'timer_30s': 30, 'status_timer': None, 'cancel_timer': None}
+
+
+class LoadGenerator:
+    """Замкнутая нагрузка и сбор метрик по ответам fake API"""
+
+    def __init__(self, fake: FakeTelegram, mix: Dict[str, float], timer_range: Tuple[int, int], think: float):
+        self._fake = fake
+        self._actions = list(mix)
+        self._weights = [mix[action] for action in self._actions]
+        self._timer_range = timer_range
+        self._think = think
+        self._ids = itertools.count(1)
+        # (chat_id, метод) или ('cb', id нажатия) -> ожидание ответа
+        self._waiters: Dict[Tuple, asyncio.Future] = {}
+        # Чат -> ожидаемое время срабатывания таймера (monotonic)
+        self.expected: Dict[int, float] = {}
+
+        self.latencies: Dict[str, List[float]] = {action: [] for action in self._actions}
+        self.drifts: List[float] = []
+        self.unexpected_fires = 0
+        self.completed = 0
+        self.timeouts = 0
+        fake.on_sent = self._on_sent
+
+    def _on_sent(self, message: SentMessage) -> None:
+        if message.method == 'sendMessage' and message.text.startswith(FIRE_TEXT):
+            expected = self.expected.pop(message.chat_id, None)
+            if expected is None:
+                self.unexpected_fires += 1
+            else:
+                self.drifts.append(message.at - expected)
+            return
+
+        if message.method == 'answerCallbackQuery':
+            key = ('cb', message.callback_id)
+        else:
+            key = (message.chat_id, message.method)
+        waiter = self._waiters.pop(key, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(message)
+
+    async def request(self, chat_id: int, action: str, duration: Optional[int] = None) -> Optional[SentMessage]:
+        """Отправляет одно обновление и ждет ответа бота"""
+        update_id = next(self._ids)
+        if action == 'button':
+            data = random.choice(list(BUTTONS))
+            duration = BUTTONS[data]
+            update = make_callback_update(update_id, chat_id, chat_id, data)
+            key = ('cb', str(update_id))
+            cancels = data == 'cancel_timer'
+        else:
+            if action == 'timer':
+                duration = duration or random.randint(*self._timer_range)
+                text = f'/timer {duration}s'
+            else:
+                text = f'/{action}'
+            update = make_message_update(update_id, chat_id, chat_id, text)
+            key = (chat_id, 'sendMessage')
+            cancels = action == 'cancel'
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[key] = waiter
+        started = time.monotonic()
+        self._fake.push_update(update)
+        try:
+            reply = await asyncio.wait_for(waiter, RESPONSE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self._waiters.pop(key, None)
+            self.timeouts += 1
+            return None
+
+        self.latencies[action].append(reply.at - started)
+        self.completed += 1
+        if duration:
+            self.expected[chat_id] = reply.at + duration
+        elif cancels:
+            self.expected.pop(chat_id, None)
+        return reply
+
+    async def user(self, chat_id: int, until: float) -> None:
+        """Один виртуальный пользователь"""
+        while time.monotonic() < until:
+            action = random.choices(self._actions, self._weights)[0]
+            await self.request(chat_id, action)
+            if self._think:
+                await asyncio.sleep(random.expovariate(1 / self._think))
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+async def run(args) -> None:
+    fake = FakeTelegram(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, retry_after=args.retry_after)
+    api_url = await fake.start()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        metrics_port = free_port()
+        env = dict(ADMISSION_DISABLED, EVENT_LOOP=args.loop, METRICS_PORT=str(metrics_port))
+        bot = BotProcess(api_url, workdir, env)
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 30)
+            await asyncio.sleep(0.5)
+            generator = LoadGenerator(fake, parse_mix(args.mix), tuple(args.timer_range), args.think)
+
+            # Нагрузка
+            started = time.monotonic()
+            until = started + args.duration
+            await asyncio.gather(*(generator.user(FIRST_CHAT_ID + i, until) for i in range(args.users)))
+            elapsed = time.monotonic() - started
+
+            # Дожидаемся таймеров, запущенных во время нагрузки
+            horizon = time.monotonic() + args.timer_range[1] + 1
+            while time.monotonic() < horizon + 5 and any(
+                expected <= horizon for expected in generator.expected.values()
+            ):
+                await asyncio.sleep(0.5)
+            pending = len(generator.expected)
+
+            print(f"цикл событий {args.loop}, пользователей {args.users}, длительность {elapsed:.1f} с, "
+                  f"задержка API {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} мс, 429: {fake.throttled}")
+            print(f"обработано обновлений: {generator.completed} ({generator.completed / elapsed:.0f}/с), "
+                  f"без ответа: {generator.timeouts}")
+            everything: List[float] = []
+            for action, values in generator.latencies.items():
+                everything.extend(values)
+                print(f"  {action:<7} n={len(values):<6} мс: {describe(values)}")
+            print(f"  {'всего':<7} n={len(everything):<6} мс: {describe(everything)}")
+            print(f"срабатываний: {len(generator.drifts)}, лишних: {generator.unexpected_fires}, "
+                  f"не дождались (длинные таймеры): {pending}")
+            print(f"  отклонение от дедлайна, мс: {describe(generator.drifts)}")
+            metrics = await scrape_metrics(metrics_port)
+            print(f"  опоздание по часам бота, мс: "
+                  f"{describe_quantiles(metrics, 'timer_bot_fire_drift_quantile_seconds')}")
+            print(f"  задержка цикла событий, мс: {describe_quantiles(metrics, 'timer_bot_loop_lag_quantile_seconds')}, "
+                  f"остановок цикла: {metrics.get('timer_bot_slow_callbacks_total', 0):.0f}")
+
+            if args.rss_timers:
+                await measure_rss(fake, generator, bot.pid, args.rss_timers)
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+async def measure_rss(fake: FakeTelegram, generator: LoadGenerator, pid: int, count: int) -> None:
+    """Запускает count часовых таймеров и меряет прирост RSS процесса бота"""
+    base = rss_bytes(pid)
+    semaphore = asyncio.Semaphore(200)
+    first_chat = FIRST_CHAT_ID + 1_000_000
+
+    async def start(i: int) -> None:
+        async with semaphore:
+            await generator.request(first_chat + i, 'timer', duration=3600)
+
+    await asyncio.gather(*(start(i) for i in range(count)))
+    await asyncio.sleep(1)
+    grown = rss_bytes(pid) - base
+    print(f"RSS: +{grown / 2 ** 20:.1f} МБ на {count} таймеров, "
+          f"~{grown / count * 100_000 / 2 ** 20:.1f} МБ на 100 тыс. активных таймеров")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--think', type=float, default=0.2, help='средняя пауза пользователя между действиями, с')
+    parser.add_argument('--mix', default='timer=4,cancel=1,status=2,button=3')
+    parser.add_argument('--timer-range', type=int, nargs=2, default=(1, 10), metavar=('MIN', 'MAX'),
+                        help='длительность /timer в секундах')
+    parser.add_argument('--latency', type=float, default=0.0, help='задержка ответа fake API, с')
+    parser.add_argument('--jitter', type=float, default=0.0, help='случайная добавка к задержке, с')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429')
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--rss-timers', type=int, default=20000, help='таймеров для замера памяти (0 - пропустить)')
+    parser.add_argument('--loop', choices=('asyncio', 'uvloop'), default='asyncio', help='EVENT_LOOP бота')
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
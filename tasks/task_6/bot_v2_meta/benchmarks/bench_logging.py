@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Задержка event loop при всплеске логов
+
+Имитирует массовое срабатывание таймеров: за один проход цикла пишется
+N записей уровня INFO (как при отмене/запуске таймеров). Сравнивает
+прямую запись в файл (как было с logging.basicConfig) и очередь с
+фоновым потоком из logging_setup. Для каждого варианта печатает время
+на одну запись в потоке loop и максимальное опоздание heartbeat-задачи,
+которая просыпается каждую миллисекунду.
+
+Запуск: python benchmarks/bench_logging.py [--records 20000] [--bursts 10]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from logging_setup import TEXT_FORMAT, setup_logging, stop_logging  # noqa: E402
+
+HEARTBEAT = 0.001
+
+
+async def heartbeat(lags: list, stop: asyncio.Event) -> None:
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + HEARTBEAT
+        await asyncio.sleep(HEARTBEAT)
+        lags.append(loop.time() - expected)
+
+
+async def burst(logger: logging.Logger, records: int, bursts: int) -> float:
+    """Пишет bursts всплесков по records записей, возвращает время на запись в loop"""
+    spent = 0.0
+    for _ in range(bursts):
+        started = time.perf_counter()
+        for i in range(records):
+            logger.info("Таймер отменен для ключа %s в чате %s", (i, i), i)
+        spent += time.perf_counter() - started
+        # Отдаем управление heartbeat между всплесками
+        await asyncio.sleep(0.05)
+    return spent / (records * bursts)
+
+
+async def run_variant(name: str, records: int, bursts: int) -> None:
+    lags: list = []
+    stop = asyncio.Event()
+    beat = asyncio.create_task(heartbeat(lags, stop))
+    await asyncio.sleep(0.05)
+    per_record = await burst(logging.getLogger('bench'), records, bursts)
+    stop.set()
+    await beat
+    lags.sort()
+    print(f"{name:<10} запись: {per_record * 1e6:6.1f} мкс, "
+          f"опоздание heartbeat p99 {lags[int(len(lags) * 0.99)] * 1000:7.1f} мс, "
+          f"макс. {lags[-1] * 1000:7.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20_000)
+    parser.add_argument('--bursts', type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # stdout не участвует в сравнении - пишем только в файл
+        root = logging.getLogger()
+        handler = logging.FileHandler(os.path.join(workdir, 'direct.log'), encoding='utf-8')
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        asyncio.run(run_variant('напрямую', args.records, args.bursts))
+        root.removeHandler(handler)
+        handler.close()
+
+        listener = setup_logging('INFO', os.path.join(workdir, 'queued.log'), 10 * 2 ** 20, 3)
+        listener.handlers = listener.handlers[:1]
+        asyncio.run(run_variant('очередь', args.records, args.bursts))
+        started = time.perf_counter()
+        stop_logging(listener)
+        print(f"           дозапись очереди при остановке: {time.perf_counter() - started:.2f} с")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Память на один активный таймер
+
+"до" - прежняя схема: на каждый таймер asyncio.Task с корутиной
+timer_task, которая держит объект Message из aiogram до срабатывания.
+"после" - TimerRecord в active_timers и в корзине планировщика.
+
+Память считается через tracemalloc как прирост после создания N таймеров.
+
+Запуск: python benchmarks/bench_memory.py [--timers 100000]
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aiogram.types import Message, Update  # noqa: E402
+
+from fake_telegram import make_message_update  # noqa: E402
+from metrics import SOURCE_COMMAND  # noqa: E402
+from scheduler import TimerScheduler  # noqa: E402
+from timers import TimerRecord  # noqa: E402
+
+FIRST_CHAT_ID = 30_000_000
+
+
+async def timer_task(message: Message, duration: int):
+    """Задача таймера в прежней схеме (без обработки ошибок - она не влияет на память)"""
+    await asyncio.sleep(duration)
+    await message.answer("⏰ Время вышло!")
+
+
+def parse_messages(count: int):
+    return [
+        Update.model_validate(make_message_update(i, FIRST_CHAT_ID + i, FIRST_CHAT_ID + i, '/timer 1h')).message
+        for i in range(count)
+    ]
+
+
+def start_tracing() -> int:
+    gc.collect()
+    tracemalloc.start()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def stop_tracing(before: int) -> int:
+    gc.collect()
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return grown
+
+
+async def bench_tasks(count: int) -> int:
+    """
+    Прежняя схема: Message и Task на таймер
+    Разбор сообщения входит в замер - объект жил, пока жил таймер
+    """
+    active = {}
+    before = start_tracing()
+    for message in parse_messages(count):
+        key = (message.from_user.id, message.from_user.id)
+        active[key] = asyncio.create_task(timer_task(message, 3600))
+    # Корутины доходят до sleep и заводят TimerHandle в loop
+    await asyncio.sleep(0)
+    grown = stop_tracing(before)
+
+    for task in active.values():
+        task.cancel()
+    await asyncio.gather(*active.values(), return_exceptions=True)
+    return grown
+
+
+async def bench_records(count: int) -> int:
+    """Новая схема: TimerRecord в словаре и в корзине планировщика"""
+    scheduler = TimerScheduler(lambda records: None)
+    active = {}
+
+    before = start_tracing()
+    now = time.monotonic()
+    created_at = time.time()
+    for i in range(count):
+        chat_id = FIRST_CHAT_ID + i
+        key = (chat_id, chat_id)
+        record = TimerRecord(key, chat_id, 3600, now + 3600 + i % 600, SOURCE_COMMAND, created_at, i)
+        scheduler.schedule(record)
+        active[key] = record
+    return stop_tracing(before)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, default=100_000)
+    args = parser.parse_args()
+
+    before = asyncio.run(bench_tasks(args.timers))
+    after = asyncio.run(bench_records(args.timers))
+    print(f"таймеров: {args.timers}")
+    print(f"до (Task + Message):  {before / args.timers:7.0f} байт на таймер")
+    print(f"после (TimerRecord):  {after / args.timers:7.0f} байт на таймер")
+    print(f"экономия: в {before / after:.1f} раза")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Накладные расходы метрик
+
+Меряет стоимость отдельных операций (инкремент счетчика, наблюдение
+в гистограмму, рендер /metrics) и добавку MetricsMiddleware к вызову
+обработчика: без middleware, с middleware и с профилированием каждого
+N-го вызова.
+
+Запуск: python benchmarks/bench_metrics.py [--calls 200000] [--sample-every 100]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import (  # noqa: E402
+    Counter, Histogram, HandlerProfiler, MetricsMiddleware, Registry,
+)
+
+
+def per_call_ns(statement, number: int) -> float:
+    """Лучшее из трех время одного вызова, наносекунды"""
+    return min(timeit.repeat(statement, number=number, repeat=3)) / number * 1e9
+
+
+def bench_primitives(number: int) -> None:
+    registry = Registry()
+    counter = registry.register(Counter('bench_total', 'Счетчик', ['source']))
+    histogram = registry.register(Histogram('bench_seconds', 'Гистограмма', ['handler']))
+    child_counter = counter.labels('command')
+    child_histogram = histogram.labels('status_command')
+    for i in range(100):
+        histogram.labels(f'handler_{i}').observe(i / 1000)
+
+    print(f"counter.labels().inc():  {per_call_ns(lambda: counter.labels('command').inc(), number):7.0f} нс")
+    print(f"child.inc():             {per_call_ns(child_counter.inc, number):7.0f} нс")
+    print(f"child.observe():         {per_call_ns(lambda: child_histogram.observe(0.003), number):7.0f} нс")
+    print(f"render (101 гистограмма): {per_call_ns(registry.render, 200) / 1e6:6.2f} мс")
+
+
+async def handler(event, data):
+    """Обработчик-заглушка: немного работы без ввода-вывода"""
+    return sum(range(50))
+
+
+async def status_command(event, data):
+    return await handler(event, data)
+
+
+async def measure(call, calls: int) -> float:
+    """Среднее время одного await call(), наносекунды"""
+    started = time.perf_counter()
+    for _ in range(calls):
+        await call()
+    return (time.perf_counter() - started) / calls * 1e9
+
+
+async def bench_middleware(calls: int, sample_every: int) -> None:
+    data = {'handler': SimpleNamespace(callback=status_command)}
+    event = object()
+    plain = MetricsMiddleware()
+    profiled = MetricsMiddleware(HandlerProfiler(sample_every))
+
+    direct = await measure(lambda: status_command(event, data), calls)
+    measured = await measure(lambda: plain(status_command, event, data), calls)
+    sampled = await measure(lambda: profiled(status_command, event, data), calls)
+
+    print(f"обработчик напрямую:     {direct:7.0f} нс")
+    print(f"с MetricsMiddleware:     {measured:7.0f} нс (+{measured - direct:.0f} нс)")
+    print(f"с профилированием 1/{sample_every}: {sampled:7.0f} нс (+{sampled - direct:.0f} нс)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200_000)
+    parser.add_argument('--sample-every', type=int, default=100)
+    args = parser.parse_args()
+
+    bench_primitives(args.calls)
+    asyncio.run(bench_middleware(args.calls, args.sample_every))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Стоимость разбора длительностей и callback_data
+
+Сравнивает прежний parse_time_duration (регулярное выражение по строке
+шаблона на каждый вызов, lower().strip()) с parsing.parse_duration на
+трех наборах входов:
+- корректные: частые формы из команд и кнопок;
+- некорректные: опечатки, лишние символы, неверный порядок единиц;
+- враждебные: очень длинные строки цифр и пробелов.
+
+Отдельно - нажатие кнопки: прежний разбор "timer_5m" против поиска
+в таблице build_callback_table.
+
+Запуск: python benchmarks/bench_parsing.py [--number 20000] [--digits 100000]
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from parsing import OVERSIZED, build_callback_table, callback_duration, parse_duration  # noqa: E402
+
+CALLBACKS = ['timer_30s', 'timer_1m', 'timer_5m', 'timer_10m', 'timer_30m', 'timer_1h']
+VALID = ['30s', '5m', '1h', '1h30m', '2m30s', '10m', '1 H 30 M', '90 s']
+INVALID = ['abc', '5', 'm', '5m1h', '1h1h', '5 минут', '1h 30', '-5m']
+# Длинные числа и ведущие нули: сверх MAX_DIGITS значащих цифр - OVERSIZED, иначе как прежде
+LONG_NUMBERS = {
+    '1234567s': OVERSIZED,
+    '99999999999h': OVERSIZED,
+    '1' * 70 + 's': OVERSIZED,
+    '999999h': 999999 * 3600,
+    '0000005m': 300,
+    '1h0000000030m': 5400,
+    ' ' * 100 + '5m': 300,
+}
+
+
+def legacy_parse(time_str: str) -> Optional[int]:
+    """Прежний разбор из bot.py"""
+    if not time_str:
+        return None
+    pattern = r'^\s*(?:(\d+)\s*h\s*)?(?:(\d+)\s*m\s*)?(?:(\d+)\s*s\s*)?$'
+    match = re.match(pattern, time_str.lower().strip())
+    if not match:
+        return None
+    hours, minutes, seconds = match.groups()
+    total_seconds = 0
+    if hours:
+        total_seconds += int(hours) * 3600
+    if minutes:
+        total_seconds += int(minutes) * 60
+    if seconds:
+        total_seconds += int(seconds)
+    return total_seconds if total_seconds > 0 else None
+
+
+def per_call_us(func, inputs, number: int) -> float:
+    def run():
+        for text in inputs:
+            func(text)
+    return min(timeit.repeat(run, number=number, repeat=3)) / (number * len(inputs)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--number', type=int, default=20_000)
+    parser.add_argument('--digits', type=int, default=100_000, help='длина враждебной строки цифр')
+    args = parser.parse_args()
+
+    # Прежний разбор должен принимать то же подмножество, что и новый
+    for text in VALID + INVALID:
+        assert legacy_parse(text) == parse_duration(text), text
+    # Слишком большое число - ошибка границ, а не формата, как у прежнего разбора
+    for text, expected in LONG_NUMBERS.items():
+        assert parse_duration(text) == expected, text
+        assert expected == OVERSIZED or legacy_parse(text) == expected, text
+
+    adversarial = [
+        '9' * args.digits + 's',
+        '1' * args.digits,
+        ' ' * args.digits + '5m',
+        '1h' + ' ' * args.digits + 'x',
+    ]
+    hostile_number = max(1, args.number // 1000)
+    print(f"{'вход':<28}{'прежний, мкс':>14}{'новый, мкс':>14}")
+    for title, inputs, number in (
+        ('корректные', VALID, args.number),
+        ('некорректные', INVALID, args.number),
+        (f'враждебные ({args.digits} симв.)', adversarial, hostile_number),
+    ):
+        try:
+            legacy = f"{per_call_us(legacy_parse, inputs, number):14.2f}"
+        except ValueError:
+            # int() от строки длиннее sys.get_int_max_str_digits()
+            legacy = f"{'ValueError':>14}"
+        print(f"{title:<28}{legacy}{per_call_us(parse_duration, inputs, number):14.2f}")
+
+    table = build_callback_table(CALLBACKS)
+    print(f"{'кнопка таймера':<28}"
+          f"{per_call_us(lambda data: legacy_parse(data.replace('timer_', '')), CALLBACKS, args.number):14.2f}"
+          f"{per_call_us(lambda data: callback_duration(data, table), CALLBACKS, args.number):14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк восстановления таймеров из хранилища
+
+Заполняет временную базу N таймерами и замеряет время чтения
+и повторного планирования, как это делает restore_timers() при старте.
+
+Запуск: python benchmarks/bench_recovery.py [--timers 1000000]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from scheduler import TimerScheduler  # noqa: E402
+from storage import COLUMNS, TimerStore, apply_migrations, rows_to_records  # noqa: E402
+from timers import TimerIndex  # noqa: E402
+
+
+def fill_store(path: str, count: int, overdue_share: float) -> None:
+    """Заполняет базу таймерами, часть из которых уже истекла"""
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    apply_migrations(conn)
+    now = time.time()
+    rows = (
+        (
+            -(1000000 + i // 10), i, '', -(1000000 + i // 10),
+            now + (-random.uniform(1, 600) if random.random() < overdue_share else random.uniform(1, 86400)),
+            random.randint(1, 86400),
+            'command',
+            now,
+            i,
+            None,
+            '',
+        )
+        for i in range(count)
+    )
+    with conn:
+        conn.executemany(f'INSERT INTO timers ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    conn.close()
+
+
+async def recover(path: str) -> None:
+    store = TimerStore(path)
+    scheduler = TimerScheduler(lambda records: None)
+
+    started = time.perf_counter()
+    await store.open()
+    opened = time.perf_counter()
+    rows = await store.load()
+    loaded = time.perf_counter()
+
+    records = rows_to_records(rows, 'UTC')
+    active = TimerIndex()
+    active.update(records)
+    scheduler.schedule_many(records)
+    scheduled = time.perf_counter()
+
+    await store.close()
+
+    print(f"таймеров:          {len(rows)}")
+    print(f"открытие базы:     {opened - started:.3f} с")
+    print(f"чтение строк:      {loaded - opened:.3f} с")
+    print(f"планирование:      {scheduled - loaded:.3f} с ({len(active)} в индексе)")
+    print(f"итого:             {scheduled - started:.3f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, default=1000000)
+    parser.add_argument('--overdue', type=float, default=0.01, help='доля таймеров, истекших за время простоя')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'timers.db')
+        started = time.perf_counter()
+        fill_store(path, args.timers, args.overdue)
+        print(f"подготовка базы:   {time.perf_counter() - started:.3f} с")
+        asyncio.run(recover(path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Пересчет следующих срабатываний повторяющихся таймеров
+
+Создает N повторяющихся таймеров (интервальные, ежедневные в случайное
+время и несколько cron-выражений) с дедлайнами в прошлом, как после
+перезапуска, и меряет:
+- next_deadlines() - пачкой, календарь считается раз на расписание;
+- наивный вариант - next_after() отдельно для каждого таймера;
+- полный путь восстановления: next_deadlines + schedule_many.
+
+Запуск: python benchmarks/bench_recurring.py [--timers 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from metrics import SOURCE_COMMAND  # noqa: E402
+from recurrence import CronRecurrence, IntervalRecurrence, from_spec, next_deadlines  # noqa: E402
+from scheduler import TimerScheduler  # noqa: E402
+from timers import TimerRecord  # noqa: E402
+
+TIMEZONE = 'Europe/Moscow'
+CRON_SPECS = [
+    'cron */15 9-18 * * 1-5',
+    'cron 0 9 * * 1',
+    'cron 30 8,13,19 * * *',
+    'cron 0 0 1 * *',
+    'cron */5 * * * *',
+]
+
+
+# День месяца и день недели: если ограничены оба, подходит любой из них (как в cron).
+# Поле ограничено, если не покрывает весь диапазон, - в том числе */N
+# (расписание, время отсчета в TIMEZONE) -> ожидаемые даты срабатываний
+DAY_MATCHING = {
+    ('cron 0 9 */2 * 1', datetime(2026, 6, 1, 12)): ['2026-06-03', '2026-06-05', '2026-06-07', '2026-06-08', '2026-06-09'],
+    ('cron 0 9 1-31 * 1', datetime(2026, 6, 1, 12)): ['2026-06-08', '2026-06-15', '2026-06-22', '2026-06-29', '2026-07-06'],
+    ('cron 0 9 */2 * *', datetime(2026, 6, 1, 12)): ['2026-06-03', '2026-06-05', '2026-06-07', '2026-06-09', '2026-06-11'],
+    ('cron 0 9 * * */3', datetime(2026, 6, 1, 12)): ['2026-06-03', '2026-06-06', '2026-06-07', '2026-06-10', '2026-06-13'],
+    ('cron 0 9 13 * 5', datetime(2026, 6, 1, 12)): ['2026-06-05', '2026-06-12', '2026-06-13', '2026-06-19', '2026-06-26'],
+}
+
+
+def check_day_matching() -> None:
+    tz = ZoneInfo(TIMEZONE)
+    for (spec, start), expected in DAY_MATCHING.items():
+        recurrence = from_spec(spec, TIMEZONE)
+        assert isinstance(recurrence, CronRecurrence), spec
+        moment = start.replace(tzinfo=tz).timestamp()
+        dates = []
+        for _ in expected:
+            moment = recurrence.next_after(moment)
+            dates.append(datetime.fromtimestamp(moment, tz).date().isoformat())
+        assert dates == expected, (spec, dates)
+
+
+def make_records(count: int):
+    now = time.monotonic()
+    records = []
+    for i in range(count):
+        kind = random.random()
+        if kind < 0.5:
+            spec = f'every {random.choice((60, 300, 900, 1500, 3600))}'
+        elif kind < 0.9:
+            spec = f'daily {random.randrange(24):02d}:{random.randrange(60):02d}'
+        else:
+            spec = random.choice(CRON_SPECS)
+        key = (i, i)
+        records.append(TimerRecord(
+            key, i, 0, now - random.uniform(0, 86400), SOURCE_COMMAND, 0.0, None, '', from_spec(spec, TIMEZONE)
+        ))
+    return records
+
+
+def naive(records, now: float, now_monotonic: float):
+    deadlines = []
+    for record in records:
+        recurrence = record.recurrence
+        if isinstance(recurrence, IntervalRecurrence):
+            deadline = record.deadline
+            while deadline <= now_monotonic:
+                deadline += recurrence.interval
+            deadlines.append(deadline)
+        else:
+            deadlines.append(now_monotonic + (recurrence.next_after(now) - now))
+    return deadlines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, default=100_000)
+    args = parser.parse_args()
+
+    check_day_matching()
+    records = make_records(args.timers)
+    specs = len({record.recurrence.spec for record in records})
+    print(f"таймеров: {args.timers}, различных расписаний: {specs}")
+
+    now, now_monotonic = time.time(), time.monotonic()
+    started = time.perf_counter()
+    batched = next_deadlines(records, now, now_monotonic)
+    batched_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    expected = naive(records, now, now_monotonic)
+    naive_time = time.perf_counter() - started
+    mismatches = sum(1 for a, b in zip(batched, expected) if abs(a - b) > 1e-6)
+
+    scheduler = TimerScheduler(lambda fired: None)
+    started = time.perf_counter()
+    for record, deadline in zip(records, next_deadlines(records, time.time(), time.monotonic())):
+        record.deadline = deadline
+    scheduler.schedule_many(records)
+    restore_time = time.perf_counter() - started
+
+    print(f"next_deadlines пачкой:       {batched_time * 1000:8.1f} мс")
+    print(f"по одному таймеру:           {naive_time * 1000:8.1f} мс")
+    print(f"пересчет + schedule_many:    {restore_time * 1000:8.1f} мс")
+    print(f"расхождений с наивным расчетом: {mismatches}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Память и время на подготовку ответа одного обновления
+
+"до" - прежняя схема из bot.py: клавиатура create_main_keyboard() строится
+на каждый ответ, справка - f-строка в обработчике, описание длительности
+считает склонения ветвлениями на каждый вызов.
+"после" - rendering: клавиатура и справка собраны один раз, описание
+длительности - из таблиц частей и кеша.
+
+Смесь обновлений как у кнопочного интерфейса: нажатия кнопок таймеров,
+«Статус», /start и /help. Ответы держатся до конца замера (как до
+отправки в API), поэтому считается все, что выделено на обновление:
+байты и блоки памяти по tracemalloc, и время подготовки.
+
+Запуск: python benchmarks/bench_rendering.py [--updates 20000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+
+from rendering import (  # noqa: E402
+    HELP_TEMPLATE, TIMER_BUTTONS, WELCOME_TEXT, format_time_description, help_text, main_keyboard,
+)
+
+MAX_TIMERS = 10
+DURATIONS = [30, 60, 300, 600, 1800, 3600]
+
+
+def legacy_description(seconds: int) -> str:
+    """Прежний format_time_description"""
+    hours = seconds // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    parts = []
+    if hours > 0:
+        if hours == 1:
+            parts.append("1 час")
+        elif hours < 5:
+            parts.append(f"{hours} часа")
+        else:
+            parts.append(f"{hours} часов")
+    if minutes > 0:
+        if minutes == 1:
+            parts.append("1 минуту")
+        elif minutes < 5:
+            parts.append(f"{minutes} минуты")
+        else:
+            parts.append(f"{minutes} минут")
+    if secs > 0:
+        if secs == 1:
+            parts.append("1 секунду")
+        elif secs < 5:
+            parts.append(f"{secs} секунды")
+        else:
+            parts.append(f"{secs} секунд")
+    return " ".join(parts)
+
+
+def legacy_keyboard() -> InlineKeyboardMarkup:
+    """Прежний create_main_keyboard"""
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [
+            InlineKeyboardButton(text=text, callback_data=data) for text, data in TIMER_BUTTONS[i:i + 2]
+        ]
+        for i in range(0, len(TIMER_BUTTONS), 2)
+    ] + [
+        [
+            InlineKeyboardButton(text="🛑 Отменить", callback_data="cancel_timer"),
+            InlineKeyboardButton(text="📊 Статус", callback_data="status_timer"),
+        ],
+        [
+            InlineKeyboardButton(text="❓ Помощь", callback_data="help_info"),
+        ]
+    ])
+
+
+def legacy_render(kind: str, duration: int):
+    if kind == 'button':
+        return f"👉 Таймер на {legacy_description(duration)} запущен!", legacy_keyboard()
+    if kind == 'status':
+        return "⏱️ Нет активных таймеров.", legacy_keyboard()
+    if kind == 'start':
+        return WELCOME_TEXT, legacy_keyboard()
+    # f-строка справки собиралась заново в обработчике
+    return HELP_TEMPLATE.replace('{max_timers}', str(MAX_TIMERS)), None
+
+
+def cached_render(kind: str, duration: int):
+    if kind == 'button':
+        return f"👉 Таймер на {format_time_description(duration)} запущен!", main_keyboard()
+    if kind == 'status':
+        return "⏱️ Нет активных таймеров.", main_keyboard()
+    if kind == 'start':
+        return WELCOME_TEXT, main_keyboard()
+    return help_text(MAX_TIMERS), None
+
+
+def make_updates(count: int):
+    kinds = random.choices(['button', 'status', 'start', 'help'], weights=[6, 2, 1, 1], k=count)
+    return [(kind, random.choice(DURATIONS)) for kind in kinds]
+
+
+def measure(render, updates):
+    # Прогрев: кеши заполняются до замера, как в работающем боте
+    for kind, duration in updates[:100]:
+        render(kind, duration)
+    gc.collect()
+    tracemalloc.start()
+    before_bytes = tracemalloc.get_traced_memory()[0]
+    before_blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics('filename'))
+    replies = [render(kind, duration) for kind, duration in updates]
+    grown_bytes = tracemalloc.get_traced_memory()[0] - before_bytes
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    grown_blocks = sum(stat.count for stat in snapshot.statistics('filename')) - before_blocks
+    count = len(replies)
+    return grown_bytes / count, grown_blocks / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--updates', type=int, default=20_000)
+    args = parser.parse_args()
+
+    # Описание длительности не изменилось для длительностей кнопок
+    for duration in DURATIONS:
+        assert legacy_description(duration) == format_time_description(duration), duration
+
+    updates = make_updates(args.updates)
+    # Время меряется отдельно от tracemalloc, который замедляет выделения
+    print(f"обновлений: {args.updates}")
+    for title, render in (('до', legacy_render), ('после', cached_render)):
+        per_bytes, per_blocks = measure(render, updates)
+        started = time.perf_counter()
+        for kind, duration in updates:
+            render(kind, duration)
+        per_us = (time.perf_counter() - started) / len(updates) * 1e6
+        print(f"{title:<6} {per_bytes:8.0f} байт, {per_blocks:6.1f} блоков, {per_us:7.2f} мкс на обновление")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Время запуска бота
+
+Отчет:
+- время импорта bot.py в чистом процессе (медиана из --repeats запусков);
+- для каждого N из --timers: база заранее заполнена N таймерами, а в
+  fake API уже лежит /status. Меряется от запуска процесса (медиана
+  из --repeats запусков):
+  - до первого getUpdates (бот готов принимать обновления);
+  - до ответа на /status (первое обработанное обновление);
+  - время восстановления таймеров по логу бота.
+
+Запуск: python benchmarks/bench_startup.py [--timers 0 10000 100000] [--repeats 5]
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, SentMessage, make_message_update  # noqa: E402
+from harness import BOT_DIR, FAKE_TOKEN, BotProcess  # noqa: E402
+
+sys.path.insert(0, BOT_DIR)
+
+from storage import COLUMNS, apply_migrations  # noqa: E402
+
+PROBE_CHAT_ID = 90_000_000
+RESTORED_PATTERN = re.compile(r'Восстановлено (\d+) таймеров .* за ([\d.]+) с')
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import bot; print(time.perf_counter() - started)"
+)
+
+
+def measure_import(repeats: int) -> float:
+    """Медиана времени импорта bot.py, секунды"""
+    env = dict(os.environ, TELEGRAM_BOT_TOKEN=FAKE_TOKEN, PYTHONPATH=BOT_DIR)
+    samples = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(repeats):
+            output = subprocess.run(
+                [sys.executable, '-c', IMPORT_SNIPPET], cwd=workdir, env=env,
+                capture_output=True, text=True, check=True,
+            ).stdout
+            samples.append(float(output.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def populate(path: str, count: int) -> None:
+    """Заполняет базу count таймерами с дедлайнами через час"""
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+    now = time.time()
+    with conn:
+        conn.executemany(
+            f'INSERT INTO timers ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (
+                (chat_id, chat_id, '', chat_id, now + 3600, 3600, 'command', now, None, None, '')
+                for chat_id in range(1, count + 1)
+            ),
+        )
+    conn.close()
+
+
+def restore_time(log_path: str) -> Optional[float]:
+    try:
+        with open(log_path, encoding='utf-8') as log:
+            for line in log:
+                match = RESTORED_PATTERN.search(line)
+                if match:
+                    return float(match.group(2))
+    except FileNotFoundError:
+        pass
+    return None
+
+
+async def measure_start(count: int, latency: float, rtt: float) -> Tuple[float, float, float]:
+    """(до первого getUpdates, до ответа на /status, восстановление по логу), секунды"""
+    fake = FakeTelegram(latency=latency, control_latency=rtt)
+    api_url = await fake.start()
+    replied = asyncio.get_running_loop().create_future()
+
+    def on_sent(message: SentMessage) -> None:
+        if message.chat_id == PROBE_CHAT_ID and not replied.done():
+            replied.set_result(message.at)
+
+    fake.on_sent = on_sent
+    with tempfile.TemporaryDirectory() as workdir:
+        populate(os.path.join(workdir, 'timers.db'), count)
+        log_path = os.path.join(workdir, 'bot.log')
+        bot = BotProcess(api_url, workdir, {'LOG_LEVEL': 'INFO', 'LOG_FILE': log_path})
+        fake.push_update(make_message_update(1, PROBE_CHAT_ID, PROBE_CHAT_ID, '/status'))
+        started = time.monotonic()
+        bot.start()
+        try:
+            await asyncio.wait_for(fake.ready.wait(), 120)
+            ready = time.monotonic() - started
+            first_reply = await asyncio.wait_for(replied, 120) - started
+            await asyncio.sleep(0.5)
+            restored = restore_time(log_path)
+            return ready, first_reply, restored if restored is not None else float('nan')
+        finally:
+            await bot.stop()
+            await fake.stop()
+
+
+async def run(args) -> None:
+    print(f"импорт bot.py: {measure_import(args.repeats):.3f} с (медиана из {args.repeats})")
+    for count in args.timers:
+        samples = [await measure_start(count, args.latency, args.rtt) for _ in range(args.repeats)]
+        ready, first_reply, restored = (statistics.median(column) for column in zip(*samples))
+        print(f"таймеров {count:>7}: до getUpdates {ready:.3f} с, до ответа {first_reply:.3f} с, "
+              f"восстановление {restored:.3f} с")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--timers', type=int, nargs='+', default=[0, 10000, 100000])
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа fake API, с')
+    parser.add_argument('--rtt', type=float, default=0.1, help='задержка getMe и deleteWebhook, с')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
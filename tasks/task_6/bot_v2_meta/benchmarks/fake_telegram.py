@@ -0,0 +1,270 @@
+"""
+Локальная замена Telegram Bot API для офлайн-бенчмарков
+
+Сервер отвечает на методы, которыми пользуется бот, отдает обновления
+через getUpdates или доставляет их на webhook и запоминает все
+отправленные ботом сообщения с временем получения. Задержку ответов
+и долю ответов 429 можно настроить, чтобы проверить пути отправки
+под нагрузкой.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import ClientSession, web
+
+# Методы, на которые действуют задержка и инъекция 429
+SEND_METHODS = ('sendMessage', 'editMessageText', 'answerCallbackQuery')
+CONTROL_METHODS = ('getMe', 'deleteWebhook', 'setWebhook')
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_timer_bot'}
+
+
+def make_message_update(update_id: int, chat_id: int, user_id: int, text: str, chat_type: str = 'private') -> Dict[str, Any]:
+    """Собирает обновление с текстовым сообщением пользователя"""
+    message: Dict[str, Any] = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': {'id': chat_id, 'type': chat_type},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+        'text': text,
+    }
+    if text.startswith('/'):
+        command = text.split()[0]
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(command)}]
+    return {'update_id': update_id, 'message': message}
+
+
+def make_callback_update(update_id: int, chat_id: int, user_id: int, data: str, chat_type: str = 'private') -> Dict[str, Any]:
+    """Собирает обновление с нажатием inline-кнопки под сообщением бота"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f'User{user_id}'},
+            'chat_instance': str(chat_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': {'id': chat_id, 'type': chat_type},
+                'from': BOT_USER,
+                'text': '🕒 Добро пожаловать в бота-таймер!',
+            },
+        },
+    }
+
+
+class SentMessage:
+    """Сообщение, которое бот отправил через fake API"""
+
+    __slots__ = ('at', 'method', 'chat_id', 'text', 'callback_id')
+
+    def __init__(self, at: float, method: str, chat_id: int, text: str, callback_id: Optional[str] = None):
+        self.at = at
+        self.method = method
+        self.chat_id = chat_id
+        self.text = text
+        self.callback_id = callback_id
+
+
+class FakeTelegram:
+    """
+    Минимальный Bot API: getMe, getUpdates, setWebhook, deleteWebhook,
+    sendMessage, editMessageText, answerCallbackQuery
+
+    latency и jitter задают задержку ответа на методы отправки в секундах,
+    error_rate - долю ответов 429 с параметром retry_after.
+    control_latency - задержка служебных методов (getMe, deleteWebhook,
+    setWebhook): сетевая задержка до Telegram при запуске бота.
+    """
+
+    def __init__(
+        self,
+        webhook_connections: int = 40,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        retry_after: int = 1,
+        control_latency: float = 0.0,
+    ):
+        self.latency = latency
+        self.control_latency = control_latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self._updates: List[Dict[str, Any]] = []
+        self._new_updates = asyncio.Event()
+        self._webhook_queue: asyncio.Queue = asyncio.Queue()
+        self._webhook_connections = webhook_connections
+        self._webhook_tasks: List[asyncio.Task] = []
+        self._message_ids = itertools.count(1)
+        self._runner: Optional[web.AppRunner] = None
+        self._client: Optional[ClientSession] = None
+
+        self.webhook_url: Optional[str] = None
+        self.webhook_secret: Optional[str] = None
+        self.sent: List[SentMessage] = []
+        self.sent_changed = asyncio.Event()
+        # Вызывается для каждого принятого сообщения бота
+        self.on_sent: Optional[Callable[[SentMessage], None]] = None
+        # id нажатия -> чат, чтобы привязать answerCallbackQuery к чату
+        self._callback_chats: Dict[str, int] = {}
+        self.throttled = 0
+        # Бот вышел на связь: вызвал getUpdates или setWebhook
+        self.ready = asyncio.Event()
+
+    # --- Обновления ---
+
+    def push_update(self, update: Dict[str, Any]) -> None:
+        """Отдает обновление боту: через webhook, если он установлен, иначе через getUpdates"""
+        callback = update.get('callback_query')
+        if callback is not None:
+            self._callback_chats[callback['id']] = callback['message']['chat']['id']
+
+        if self.webhook_url:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self._updates.append(update)
+            self._new_updates.set()
+
+    async def _deliver_webhook(self) -> None:
+        """Доставляет обновления на webhook, как это делает Telegram"""
+        while True:
+            update = await self._webhook_queue.get()
+            headers = {'X-Telegram-Bot-Api-Secret-Token': self.webhook_secret} if self.webhook_secret else {}
+            while True:
+                try:
+                    async with self._client.post(self.webhook_url, json=update, headers=headers) as response:
+                        if response.status == 200:
+                            break
+                except Exception:
+                    pass
+                await asyncio.sleep(0.1)
+
+    # --- Методы API ---
+
+    async def _get_me(self, params: Dict[str, Any]) -> Any:
+        return BOT_USER
+
+    async def _get_updates(self, params: Dict[str, Any]) -> Any:
+        self.ready.set()
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 100))
+        timeout = float(params.get('timeout', 0))
+
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:limit]
+
+    async def _set_webhook(self, params: Dict[str, Any]) -> Any:
+        self.webhook_url = params['url']
+        self.webhook_secret = params.get('secret_token')
+        self.ready.set()
+        return True
+
+    async def _delete_webhook(self, params: Dict[str, Any]) -> Any:
+        self.webhook_url = None
+        return True
+
+    def _record(self, method: str, chat_id: int, text: str, callback_id: Optional[str] = None) -> SentMessage:
+        sent = SentMessage(time.monotonic(), method, chat_id, text, callback_id)
+        self.sent.append(sent)
+        self.sent_changed.set()
+        if self.on_sent is not None:
+            self.on_sent(sent)
+        return sent
+
+    def _message_result(self, chat_id: int, text: str, message_id: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            'message_id': message_id or next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id > 0 else 'group'},
+            'from': BOT_USER,
+            'text': text,
+        }
+
+    async def _send_message(self, params: Dict[str, Any]) -> Any:
+        sent = self._record('sendMessage', int(params['chat_id']), params.get('text', ''))
+        return self._message_result(sent.chat_id, sent.text)
+
+    async def _edit_message_text(self, params: Dict[str, Any]) -> Any:
+        sent = self._record('editMessageText', int(params['chat_id']), params.get('text', ''))
+        return self._message_result(sent.chat_id, sent.text, int(params.get('message_id', 1)))
+
+    async def _answer_callback_query(self, params: Dict[str, Any]) -> Any:
+        callback_id = params['callback_query_id']
+        chat_id = self._callback_chats.pop(callback_id, 0)
+        self._record('answerCallbackQuery', chat_id, params.get('text', ''), callback_id)
+        return True
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method in SEND_METHODS:
+            delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+            if delay:
+                await asyncio.sleep(delay)
+            if self.error_rate and random.random() < self.error_rate:
+                self.throttled += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f'Too Many Requests: retry after {self.retry_after}',
+                    'parameters': {'retry_after': self.retry_after},
+                }, status=429)
+        elif method in CONTROL_METHODS and self.control_latency:
+            await asyncio.sleep(self.control_latency)
+
+        handler = {
+            'getMe': self._get_me,
+            'getUpdates': self._get_updates,
+            'setWebhook': self._set_webhook,
+            'deleteWebhook': self._delete_webhook,
+            'sendMessage': self._send_message,
+            'editMessageText': self._edit_message_text,
+            'answerCallbackQuery': self._answer_callback_query,
+        }.get(method)
+        if handler is None:
+            return web.json_response({'ok': False, 'error_code': 404, 'description': 'Not Found'}, status=404)
+
+        result = await handler(params)
+        return web.json_response({'ok': True, 'result': result})
+
+    # --- Запуск ---
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0) -> str:
+        """Запускает сервер и возвращает базовый адрес для TELEGRAM_API_URL"""
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+
+        self._client = ClientSession(json_serialize=json.dumps)
+        self._webhook_tasks = [asyncio.create_task(self._deliver_webhook()) for _ in range(self._webhook_connections)]
+        return f'http://{host}:{port}'
+
+    async def stop(self) -> None:
+        for task in self._webhook_tasks:
+            task.cancel()
+        await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        if self._client is not None:
+            await self._client.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,181 @@
+"""
+Общие части офлайн-бенчмарков: запуск бота против fake API и статистика
+"""
+
+import asyncio
+import os
+import signal
+import socket
+import subprocess
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import aiohttp
+
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BOT_SCRIPT = os.path.join(BOT_DIR, 'bot.py')
+
+# Токен в формате Telegram, который принимает aiogram
+FAKE_TOKEN = '123456:fake-token-for-benchmarks'
+
+# Контроль допуска выключен: все лимиты в ноль
+# С ним запускаются бенчмарки, которые сами создают поток на пределе одной
+# подсистемы (bench_load, bench_burst, bench_countdown, bench_ingestion):
+# отказы допуска смешались бы с тем, что они меряют. Сценарии перезапуска
+# (bench_failover, bench_handoff, bench_startup) идут с лимитами по умолчанию:
+# их трафик рассчитан на эти лимиты и проверяет бота в рабочей настройке.
+# bench_admission сравнивает оба варианта.
+ADMISSION_DISABLED = {
+    'ADMISSION_USER_LIMIT': '0',
+    'ADMISSION_CHAT_LIMIT': '0',
+    'ADMISSION_MAX_IN_FLIGHT': '0',
+    'ADMISSION_LAG_THRESHOLD': '0',
+}
+
+
+def free_port() -> int:
+    """Возвращает свободный TCP-порт на localhost"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: Sequence[float], q: float) -> float:
+    """Перцентиль q (0..100) по отсортированной копии значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def describe(values: Sequence[float], unit: float = 1000.0) -> str:
+    """Строка p50/p90/p99/max (по умолчанию в миллисекундах)"""
+    return ' '.join(
+        f"{name}={percentile(values, q) * unit:.1f}"
+        for name, q in (('p50', 50), ('p90', 90), ('p99', 99), ('max', 100))
+    )
+
+
+def describe_quantiles(metrics: Dict[str, float], name: str, unit: float = 1000.0) -> str:
+    """Строка p50/p90/p99/max из метрики бота с меткой quantile"""
+    parts = []
+    for label, quantile in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99'), ('max', '1')):
+        value = metrics.get(name + '{quantile="' + quantile + '"}', float('nan'))
+        parts.append(f"{label}={value * unit:.1f}")
+    return ' '.join(parts)
+
+
+async def scrape_metrics(port: int) -> Dict[str, float]:
+    """Отсчеты /metrics бота: 'имя{метки}' -> значение"""
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+            text = await response.text()
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, _, value = line.rpartition(' ')
+            samples[name] = float(value)
+    return samples
+
+
+def peak_rate(times: List[float], window: float) -> float:
+    """Наибольшее число отправок в скользящем окне window, в пересчете на секунду"""
+    times = sorted(times)
+    best = 0
+    start = 0
+    for end, at in enumerate(times):
+        while at - times[start] > window:
+            start += 1
+        best = max(best, end - start + 1)
+    return best / window
+
+
+def rss_bytes(pid: int) -> int:
+    """Резидентная память процесса (Linux, /proc)"""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+class BotProcess:
+    """Бот, запущенный отдельным процессом против fake API"""
+
+    def __init__(self, api_url: str, workdir: str, env: Optional[Dict[str, str]] = None):
+        self._api_url = api_url
+        self._workdir = workdir
+        self._env = env or {}
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        env = dict(os.environ)
+        env.update({
+            'TELEGRAM_BOT_TOKEN': FAKE_TOKEN,
+            'TELEGRAM_API_URL': self._api_url,
+            'TIMERS_DB_PATH': os.path.join(self._workdir, 'timers.db'),
+            'LOG_LEVEL': 'WARNING',
+        })
+        env.update(self._env)
+        # bot.log и база таймеров создаются в рабочем каталоге
+        self._process = subprocess.Popen(
+            [sys.executable, BOT_SCRIPT],
+            cwd=self._workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    @property
+    def pid(self) -> Optional[int]:
+        return self._process.pid if self._process else None
+
+    @property
+    def running(self) -> bool:
+        return self._process is not None and self._process.poll() is None
+
+    def kill(self) -> None:
+        """Аварийное завершение без плавной остановки (SIGKILL)"""
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        if self._process is None or self._process.poll() is not None:
+            return
+        self._process.send_signal(signal.SIGTERM)
+        for _ in range(int(timeout * 10)):
+            if self._process.poll() is not None:
+                return
+            await asyncio.sleep(0.1)
+        self._process.kill()
+        self._process.wait()
+
+
+async def wait_for_sent(fake, count: int, timeout: float) -> bool:
+    """Ждет, пока бот отправит в fake API не меньше count сообщений"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while len(fake.sent) < count:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return False
+        fake.sent_changed.clear()
+        try:
+            await asyncio.wait_for(fake.sent_changed.wait(), remaining)
+        except asyncio.TimeoutError:
+            return False
+    return True
+
+
+def latencies_by_chat(injected: Dict[int, float], sent: List) -> List[float]:
+    """Задержка от отправки обновления до первого ответа в тот же чат"""
+    result = []
+    seen = set()
+    for message in sent:
+        started = injected.get(message.chat_id)
+        if started is not None and message.chat_id not in seen:
+            seen.add(message.chat_id)
+            result.append(message.at - started)
+    return result
@@ -5,192 +5,387 @@ Telegram-бот для управления таймерами
 """
 
 import asyncio
+import functools
+import html
 import logging
+import os
 import re
 import signal
+import socket
 import sys
-from typing import Dict, Optional, Tuple
+import time
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
 
-from aiogram import Bot, Dispatcher
+from aiogram import Bot, Dispatcher, Router
 from aiogram.exceptions import TelegramAPIError
 from aiogram.filters import Command
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
+from aiogram.types import Message, CallbackQuery, Update, User
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
+from admission import AdmissionMiddleware
 from config import Config
+from countdown import MessageEditor
+from logging_setup import setup_logging, stop_logging
+from metrics import (
+    ACTIVE_TIMERS, FIRE_DRIFT, HANDLERS_IN_FLIGHT, OUTBOUND_QUEUED, SOURCE_CALLBACK, SOURCE_COMMAND,
+    TIMERS_CANCELLED, TIMERS_FIRED, TIMERS_STALE, TIMERS_STARTED,
+    ApiMetricsMiddleware, HandlerProfiler, MetricsMiddleware, MetricsServer,
+)
+from parsing import TIMER_CALLBACK_PREFIX, build_callback_table, callback_duration, parse_duration
+from recurrence import (
+    ClockWatcher, CronRecurrence, IntervalRecurrence, Recurrence,
+    from_spec, next_deadlines, parse_calendar,
+)
+from rendering import (
+    TIMER_BUTTONS, WELCOME_TEXT, countdown_text, format_duration, format_time_description, help_text,
+    main_keyboard,
+)
+from runtime import LatencyWindow, LoopLagMonitor, SlowCallbackWatchdog, loop_name, run
+from scheduler import TimerScheduler
+from sender import OutboundQueue
+from storage import TimerRow, TimerStore, record_to_row, rows_to_records
+from timers import TimerIndex, TimerRecord
+
+if TYPE_CHECKING:
+    # Модули режимов работы (webhook, шардирование, передача работы, реплики)
+    # импортируются только при запуске своего режима
+    from coordination import CoordinationBackend, LeaderElector
+    from handoff import HandoffServer
+    from sharding import ShardRouter
+    from webhook import WebhookServer
 
-# Настройка логирования
-logging.basicConfig(
-    level=Config.LOG_LEVEL,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('bot.log', encoding='utf-8'),
-        logging.StreamHandler(sys.stdout)
-    ]
+# Настройка логирования: запись в файл и stdout идет в фоновом потоке
+log_listener = setup_logging(
+    Config.LOG_LEVEL,
+    Config.LOG_FILE,
+    max_bytes=Config.LOG_MAX_BYTES,
+    backup_count=Config.LOG_BACKUP_COUNT,
+    rotate_when=Config.LOG_ROTATE_WHEN,
+    json_format=Config.LOG_FORMAT == 'json',
 )
 logger = logging.getLogger(__name__)
 
 # Хранение активных таймеров
-# Ключ: (chat_id, user_id) для групп или user_id для приватных чатов
-# Значение: asyncio.Task
-active_timers: Dict[Tuple[int, int], asyncio.Task] = {}
+# Ключ владельца: (chat_id, user_id) для групп или (user_id, user_id) для приватных чатов
+# У владельца может быть несколько таймеров с разными именами
+active_timers = TimerIndex()
+
+# Имя таймера: буква или _, затем буквы, цифры, _ и -
+TIMER_NAME_PATTERN = re.compile(r'[^\W\d][\w-]{0,31}')
+
+# callback_data -> длительность в секундах, разобрано один раз
+TIMER_CALLBACKS = build_callback_table(data for _, data in TIMER_BUTTONS)
+
+# Опоздания последних срабатываний: в отчете о цикле событий они стоят рядом с его задержкой
+fire_drift = LatencyWindow()
 
 # Глобальные переменные для graceful shutdown
 bot: Optional[Bot] = None
 dp: Optional[Dispatcher] = None
+scheduler: Optional[TimerScheduler] = None
+store: Optional[TimerStore] = None
+outbound: Optional[OutboundQueue] = None
+editor: Optional[MessageEditor] = None
+admission: Optional[AdmissionMiddleware] = None
+lag_monitor: Optional[LoopLagMonitor] = None
+watchdog: Optional[SlowCallbackWatchdog] = None
+webhook_server: Optional['WebhookServer'] = None
+shard_router: Optional['ShardRouter'] = None
+handoff_server: Optional['HandoffServer'] = None
+# Выбор лидера среди реплик (HA_BACKEND)
+coordination: Optional['CoordinationBackend'] = None
+elector: Optional['LeaderElector'] = None
+# Прием обновлений (polling, webhook или соединение с фронтом шардирования)
+intake_task: Optional[asyncio.Task] = None
+polling = False
+# Последнее принятое обновление - подтверждается в Telegram при остановке polling
+last_update_id: Optional[int] = None
+# Восстановление таймеров при запуске: идет параллельно с запуском приема обновлений
+restoring: Optional[asyncio.Task] = None
+# Установлен - бот дорабатывает и завершается (сигнал, передача работы, ошибка приема)
+stop_requested: Optional[asyncio.Event] = None
+metrics_server: Optional[MetricsServer] = None
+clock_watcher: Optional[ClockWatcher] = None
+profiler: Optional[HandlerProfiler] = None
 
 
-def get_timer_key(message: Message) -> Tuple[int, int]:
-    """Получает ключ для хранения таймера в зависимости от типа чата"""
+def get_timer_key(message: Message, user: Optional[User] = None) -> Tuple[int, int]:
+    """
+    Получает ключ для хранения таймера в зависимости от типа чата
+    user - автор действия, если он не совпадает с автором сообщения (нажатие кнопки)
+    Ключ для сырых обновлений считает sharding.timer_key_for_update - держать в согласии
+    """
+    user = user or message.from_user
     if message.chat.type == 'private':
         # В приватном чате используем только user_id
-        return (message.from_user.id, message.from_user.id)
+        return (user.id, user.id)
     else:
         # В группе используем (chat_id, user_id)
-        return (message.chat.id, message.from_user.id)
+        return (message.chat.id, user.id)
 
 
-def parse_time_duration(time_str: str) -> Optional[int]:
+def get_owner_name(message: Message, user: Optional[User] = None) -> str:
     """
-    Парсит строку времени и возвращает количество секунд
-    
-    Поддерживаемые форматы:
-    - Простые: 10s, 30m, 1h
-    - Комбинированные: 1h30m, 2m30s, 1h15m20s
-    - С пробелами: 1 H 30 M, 90 s
+    Имя владельца таймера для упоминания в групповом уведомлении
+    В личном чате упоминание не нужно - имя не хранится
     """
-    if not time_str:
-        return None
-    
-    # Регулярное выражение для парсинга времени
-    # Поддерживает пробелы и любой регистр
-    pattern = r'^\s*(?:(\d+)\s*h\s*)?(?:(\d+)\s*m\s*)?(?:(\d+)\s*s\s*)?$'
-    match = re.match(pattern, time_str.lower().strip())
-    
-    if not match:
+    if message.chat.type == 'private':
+        return ''
+    return (user or message.from_user).first_name
+
+
+def parse_timer_args(args: List[str]) -> Tuple[str, Optional[int]]:
+    """
+    Разбирает аргументы /timer: [имя] время
+    Возвращает имя таймера ('' - без имени) и длительность в секундах или None
+    """
+    time_str = " ".join(args)
+    duration = parse_duration(time_str)
+    if duration is not None or len(args) < 2 or not TIMER_NAME_PATTERN.fullmatch(args[0]):
+        return '', duration
+    return args[0], parse_duration(" ".join(args[1:]))
+
+
+def parse_every_args(args: List[str]) -> Tuple[str, Optional[Recurrence]]:
+    """
+    Разбирает аргументы /every: [имя] расписание
+    Расписание - интервал (25m), "daily 09:00", "daily at 09:00" или "cron m h dom mon dow"
+    Возвращает имя напоминания и расписание или None
+    """
+    recurrence = parse_recurrence(" ".join(args))
+    if recurrence is not None or len(args) < 2 or not TIMER_NAME_PATTERN.fullmatch(args[0]):
+        return '', recurrence
+    return args[0], parse_recurrence(" ".join(args[1:]))
+
+
+def parse_recurrence(text: str) -> Optional[Recurrence]:
+    """Расписание повторяющегося таймера из текста пользователя"""
+    calendar = parse_calendar(text, Config.TIMEZONE)
+    if calendar is not None:
+        return calendar
+    interval = parse_duration(text)
+    if interval is None:
         return None
+    return from_spec(f'every {interval}', Config.TIMEZONE)
+
+
+def describe_recurrence(recurrence: Recurrence) -> str:
+    """Описание расписания на русском языке"""
+    if isinstance(recurrence, IntervalRecurrence):
+        return f"каждые {format_time_description(recurrence.interval)}"
+    kind, _, rest = recurrence.spec.partition(' ')
+    if kind == 'daily':
+        return f"ежедневно в {rest}"
+    return f"по расписанию cron «{rest}»"
+
+
+def timer_title(name: str) -> str:
+    """Название таймера для ответов пользователю"""
+    return f"«{name}»" if name else "без названия"
+
+
+def notice_line(record: TimerRecord) -> str:
+    """Строка уведомления о срабатывании таймера; в группе - с упоминанием владельца"""
+    if record.recurrence is not None:
+        text = f"🔔 Напоминание {timer_title(record.name)}" if record.name else "🔔 Напоминание!"
+    elif record.name:
+        text = f"⏰ Время вышло! Таймер {timer_title(record.name)}"
+    else:
+        text = "⏰ Время вышло!"
+    user_id = record.key[1]
+    if record.chat_id != user_id:
+        # Ключ группового таймера - (chat_id, user_id), личного - (user_id, user_id)
+        owner = html.escape(record.owner or "участник")
+        text += f' — <a href="tg://user?id={user_id}">{owner}</a>'
+    return text
+
+
+def on_timers_fired(records: List[TimerRecord]):
+    """
+    Обработчик срабатывания таймеров - вызывается планировщиком раз в тик
     
-    hours, minutes, seconds = match.groups()
+    Уведомления группируются по чатам: все таймеры чата, сработавшие в тике,
+    уходят одним сообщением (в группе - с упоминанием каждого владельца).
+    """
+    now = time.monotonic()
+    recurring = []
+    by_chat: Dict[int, List[TimerRecord]] = {}
+    for record in records:
+        # Запись отменена или заменена, а из колеса не убрана: срабатывание устарело
+        if not active_timers.is_current(record):
+            TIMERS_STALE.inc()
+            continue
+        drift = max(0.0, now - record.deadline)
+        FIRE_DRIFT.observe(drift)
+        fire_drift.add(drift)
+        TIMERS_FIRED.labels(record.source).inc()
+        by_chat.setdefault(record.chat_id, []).append(record)
+        
+        if record.recurrence is not None:
+            # Повторяющийся таймер остается активным и планируется заново
+            recurring.append(record)
+            continue
+        
+        active_timers.discard(record)
+        store.delete(record)
     
-    # Преобразуем в секунды
-    total_seconds = 0
-    if hours:
-        total_seconds += int(hours) * 3600
-    if minutes:
-        total_seconds += int(minutes) * 60
-    if seconds:
-        total_seconds += int(seconds)
+    # Уведомления уходят через очередь с лимитами, а не напрямую. Строки одного
+    # чата дописываются в одно сообщение, срок доставки - самый ранний дедлайн
+    for chat_id, fired in by_chat.items():
+        fired.sort(key=TimerRecord.sort_key)
+        for record in fired:
+            outbound.submit_line(chat_id, notice_line(record), record.deadline)
     
-    return total_seconds if total_seconds > 0 else None
+    if recurring:
+        reschedule_recurring(recurring)
 
 
-def format_duration(seconds: int) -> str:
-    """Форматирует количество секунд в читаемый формат"""
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    secs = seconds % 60
-    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+def advance_recurring(records: List[TimerRecord]) -> None:
+    """
+    Переносит дедлайны повторяющихся таймеров на ближайшее повторение
+    Для записей, которых еще нет в active_timers (восстановление после перезапуска)
+    """
+    recurring = [record for record in records if record.recurrence is not None]
+    for record, deadline in zip(recurring, next_deadlines(recurring, time.time(), time.monotonic())):
+        record.deadline = deadline
 
 
-def format_time_description(seconds: int) -> str:
-    """Форматирует время в описание на русском языке"""
-    hours = seconds // 3600
-    minutes = (seconds % 3600) // 60
-    secs = seconds % 60
-    
-    parts = []
-    if hours > 0:
-        if hours == 1:
-            parts.append("1 час")
-        elif hours < 5:
-            parts.append(f"{hours} часа")
-        else:
-            parts.append(f"{hours} часов")
-    
-    if minutes > 0:
-        if minutes == 1:
-            parts.append("1 минуту")
-        elif minutes < 5:
-            parts.append(f"{minutes} минуты")
-        else:
-            parts.append(f"{minutes} минут")
+def reschedule_recurring(records: List[TimerRecord]):
+    """Вычисляет следующие срабатывания активных повторяющихся таймеров пачкой и планирует их"""
+    deadlines = next_deadlines(records, time.time(), time.monotonic())
+    for record, deadline in zip(records, deadlines):
+        active_timers.move(record, deadline)
+        store.put(record)
+    scheduler.schedule_many(records)
+
+
+def on_clock_jump(shift: float):
+    """
+    Настенные часы переведены: календарные напоминания пересчитываются
+    Разовые и интервальные таймеры отсчитываются по monotonic и не меняются
+    """
+    calendar = [record for record in active_timers if isinstance(record.recurrence, CronRecurrence)]
+    if calendar:
+        reschedule_recurring(calendar)
+    # Дедлайны в хранилище записаны по настенным часам - перезаписываем
+    for record in active_timers:
+        store.put(record)
+    logger.info("После сдвига часов перепланировано календарных напоминаний: %s", len(calendar))
+
+
+def check_timer_quota(timer_key: Tuple[int, int], chat_id: int, name: str) -> Optional[str]:
+    """
+    Проверяет квоты на число таймеров
+    Возвращает текст отказа или None, если таймер можно запустить
+    """
+    # Замена таймера с тем же именем не увеличивает их число
+    if active_timers.get(timer_key, name) is not None:
+        return None
+    if active_timers.count_for_key(timer_key) >= Config.MAX_TIMERS_PER_USER:
+        return f"Достигнут лимит: не больше {Config.MAX_TIMERS_PER_USER} таймеров на пользователя."
+    if active_timers.count_for_chat(chat_id) >= Config.MAX_TIMERS_PER_CHAT:
+        return f"Достигнут лимит: не больше {Config.MAX_TIMERS_PER_CHAT} таймеров в этом чате."
+    return None
+
+
+def start_timer(
+    timer_key: Tuple[int, int],
+    chat_id: int,
+    duration: int,
+    source: str,
+    message_id: int,
+    name: str = '',
+    recurrence: Optional[Recurrence] = None,
+    owner: str = '',
+) -> Tuple[TimerRecord, bool]:
+    """
+    Запускает таймер для указанного ключа и имени, заменяя существующий с тем же именем
+    source - откуда запущен таймер (SOURCE_COMMAND или SOURCE_CALLBACK)
+    message_id - сообщение, которым запущен таймер
+    recurrence - расписание повторяющегося таймера (duration тогда игнорируется)
+    owner - имя владельца для упоминания в группе (см. get_owner_name)
+    Возвращает новую запись и True, если она заменила старый таймер
     
-    if secs > 0:
-        if secs == 1:
-            parts.append("1 секунду")
-        elif secs < 5:
-            parts.append(f"{secs} секунды")
-        else:
-            parts.append(f"{secs} секунд")
-    
-    return " ".join(parts)
-
-
-def create_main_keyboard() -> InlineKeyboardMarkup:
-    """Создает основную клавиатуру с кнопками для управления таймерами"""
-    keyboard = InlineKeyboardMarkup(inline_keyboard=[
-        [
-            InlineKeyboardButton(text="⏱️ 30 сек", callback_data="timer_30s"),
-            InlineKeyboardButton(text="⏱️ 1 мин", callback_data="timer_1m"),
-        ],
-        [
-            InlineKeyboardButton(text="⏱️ 5 мин", callback_data="timer_5m"),
-            InlineKeyboardButton(text="⏱️ 10 мин", callback_data="timer_10m"),
-        ],
-        [
-            InlineKeyboardButton(text="⏱️ 30 мин", callback_data="timer_30m"),
-            InlineKeyboardButton(text="⏱️ 1 час", callback_data="timer_1h"),
-        ],
-        [
-            InlineKeyboardButton(text="🛑 Отменить", callback_data="cancel_timer"),
-            InlineKeyboardButton(text="📊 Статус", callback_data="status_timer"),
-        ],
-        [
-            InlineKeyboardButton(text="❓ Помощь", callback_data="help_info"),
-        ]
-    ])
-    return keyboard
-
-
-async def timer_task(message: Message, duration: int):
-    """
-    Задача таймера - ждет указанное время и отправляет уведомление
+    Замена - одна операция индекса: новая запись занимает место старой, и нет
+    момента, когда активны обе или ни одной. Функция ничего не ждет, поэтому
+    обработчик, который проверил квоту и сразу вызвал start_timer без await
+    между ними, не пересекается с параллельными обновлениями того же пользователя.
     """
-    try:
-        # Ждем указанное время
-        await asyncio.sleep(duration)
-        
-        # Отправляем уведомление о завершении
-        await message.answer("⏰ Время вышло!")
-        
-    except asyncio.CancelledError:
-        # Таймер был отменен
-        logger.info(f"Таймер отменен для пользователя {message.from_user.id} в чате {message.chat.id}")
-        raise
-    except Exception as e:
-        logger.error(f"Ошибка в задаче таймера: {e}")
-        try:
-            await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
-        except:
-            pass
+    now_monotonic = time.monotonic()
+    record = TimerRecord(
+        timer_key, chat_id, duration, now_monotonic + duration, source, time.time(), message_id, name, recurrence,
+        owner,
+    )
+    if recurrence is not None:
+        record.deadline = now_monotonic
+        advance_recurring([record])
+    replaced = active_timers.add(record)
+    if replaced is not None:
+        scheduler.cancel(replaced)
+        TIMERS_CANCELLED.labels(source).inc()
+    scheduler.schedule(record)
+    # Запись с тем же ключом и именем перекрывает старую в буфере хранилища
+    store.put(record)
+    TIMERS_STARTED.labels(source).inc()
+    return record, replaced is not None
 
 
-async def cancel_existing_timer(timer_key: Tuple[int, int]) -> bool:
+def cancel_existing_timer(timer_key: Tuple[int, int], source: str, name: str = '') -> bool:
     """
-    Отменяет существующий таймер для указанного ключа
+    Отменяет таймер с указанным именем для указанного ключа
     Возвращает True если таймер был отменен, False если не было активного таймера
     """
-    if timer_key in active_timers:
-        task = active_timers[timer_key]
-        task.cancel()
-        try:
-            await task
-        except asyncio.CancelledError:
-            pass
-        del active_timers[timer_key]
-        return True
-    return False
+    record = active_timers.remove(timer_key, name)
+    if record is None:
+        return False
+
+    scheduler.cancel(record)
+    TIMERS_CANCELLED.labels(source).inc()
+    store.delete(record)
+    logger.info("Таймер %r отменен для ключа %s в чате %s", name, timer_key, record.chat_id)
+    return True
+
+
+def cancel_all_timers(timer_key: Tuple[int, int], source: str) -> int:
+    """Отменяет все таймеры ключа, возвращает их число"""
+    records = active_timers.pop_all(timer_key)
+    for record in records:
+        scheduler.cancel(record)
+        store.delete(record)
+    if records:
+        TIMERS_CANCELLED.labels(source).inc(len(records))
+        logger.info("Отменено %s таймеров для ключа %s", len(records), timer_key)
+    return len(records)
+
+
+def describe_cancel_all(cancelled: int) -> str:
+    """Ответ на отмену всех таймеров"""
+    if not cancelled:
+        return "У вас нет активных таймеров."
+    if cancelled == 1:
+        return "👉 Таймер отменён."
+    return f"👉 Отменено таймеров: {cancelled}."
+
+
+def describe_timer_status(timer_key: Tuple[int, int]) -> str:
+    """Текст статуса таймера с точным оставшимся временем"""
+    # Сработавшие таймеры удаляются из active_timers планировщиком
+    records = active_timers.list(timer_key)
+    if not records:
+        return "Таймер не запущен."
+    now = time.monotonic()
+    if len(records) == 1 and not records[0].name and records[0].recurrence is None:
+        return f"⏱️ Таймер активен. Осталось: {format_duration(records[0].remaining(now))}"
+    lines = ["⏱️ Активные таймеры:"]
+    for record in records:
+        title = timer_title(record.name)
+        if record.recurrence is not None:
+            title = f"{title} 🔁 {describe_recurrence(record.recurrence)}"
+        lines.append(f"• {title} - осталось {format_duration(record.remaining(now))}")
+    return "\n".join(lines)
 
 
 async def start_timer_command(message: Message):
@@ -205,11 +400,8 @@ async def start_timer_command(message: Message):
             )
             return
         
-        # Объединяем все аргументы в одну строку
-        time_str = " ".join(args)
-        
-        # Парсим время
-        duration = parse_time_duration(time_str)
+        # Первый аргумент может быть именем таймера: /timer tea 5m
+        name, duration = parse_timer_args(args)
         
         if duration is None:
             await message.answer(
@@ -227,48 +419,116 @@ async def start_timer_command(message: Message):
         # Получаем ключ для хранения таймера
         timer_key = get_timer_key(message)
         
-        # Отменяем существующий таймер если есть
-        had_existing = await cancel_existing_timer(timer_key)
+        refusal = check_timer_quota(timer_key, message.chat.id, name)
+        if refusal:
+            await message.answer(refusal)
+            return
         
-        # Создаем новую задачу таймера
-        task = asyncio.create_task(timer_task(message, duration))
-        active_timers[timer_key] = task
+        # Запускаем таймер, отменяя существующий с тем же именем
+        _, had_existing = start_timer(
+            timer_key, message.chat.id, duration, SOURCE_COMMAND, message.message_id, name,
+            owner=get_owner_name(message),
+        )
         
         # Формируем ответ
         time_desc = format_time_description(duration)
-        if had_existing:
+        if name and had_existing:
+            response = f"ℹ️ Старый таймер {timer_title(name)} отменён. Запущен новый на {time_desc}."
+        elif name:
+            response = f"👉 Таймер {timer_title(name)} на {time_desc} запущен!"
+        elif had_existing:
             response = f"ℹ️ Старый таймер отменён. Запущен новый таймер на {time_desc}."
         else:
             response = f"👉 Таймер на {time_desc} запущен!"
         
         await message.answer(response)
         
-        logger.info(f"Запущен таймер на {duration} секунд для пользователя {message.from_user.id} в чате {message.chat.id}")
+        logger.info("Запущен таймер на %s секунд для пользователя %s в чате %s", duration, message.from_user.id, message.chat.id)
         
     except TelegramAPIError as e:
-        logger.error(f"Ошибка Telegram API: {e}")
+        logger.error("Ошибка Telegram API: %s", e)
         if e.code == 429:  # Too Many Requests
             await message.answer("Слишком много запросов. Попробуйте позже.")
         else:
             await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
     except Exception as e:
-        logger.error(f"Неожиданная ошибка в start_timer_command: {e}", exc_info=True)
+        logger.error("Неожиданная ошибка в start_timer_command: %s", e, exc_info=True)
+        await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
+
+
+async def every_command(message: Message):
+    """Обработчик команды /every - повторяющееся напоминание"""
+    try:
+        args = message.text.split()[1:]
+        name, recurrence = parse_every_args(args)
+        
+        if recurrence is None:
+            await message.answer(
+                "Некорректный формат. Примеры: /every 25m, /every tea 1h, "
+                "/every daily 09:00, /every cron */15 9-18 * * 1-5"
+            )
+            return
+        
+        if isinstance(recurrence, IntervalRecurrence) and not (
+            Config.MIN_REPEAT_INTERVAL <= recurrence.interval <= Config.MAX_DURATION
+        ):
+            await message.answer(
+                f"Интервал повторения должен быть от {Config.MIN_REPEAT_INTERVAL} до {Config.MAX_DURATION} секунд."
+            )
+            return
+        
+        timer_key = get_timer_key(message)
+        refusal = check_timer_quota(timer_key, message.chat.id, name)
+        if refusal:
+            await message.answer(refusal)
+            return
+        
+        interval = recurrence.interval if isinstance(recurrence, IntervalRecurrence) else 0
+        record, had_existing = start_timer(
+            timer_key, message.chat.id, interval, SOURCE_COMMAND, message.message_id, name, recurrence,
+            get_owner_name(message),
+        )
+        
+        title = f" {timer_title(name)}" if name else ""
+        response = (
+            f"🔁 Напоминание{title} {describe_recurrence(recurrence)} запущено! "
+            f"Ближайшее через {format_duration(record.remaining(time.monotonic()))}."
+        )
+        if had_existing:
+            response = "ℹ️ Старый таймер с этим именем отменён. " + response
+        await message.answer(response)
+        
+        logger.info("Запущено напоминание %r (%s) для ключа %s", name, recurrence.spec, timer_key)
+        
+    except Exception as e:
+        logger.error("Ошибка в every_command: %s", e, exc_info=True)
         await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
 
 
 async def cancel_timer_command(message: Message):
-    """Обработчик команды /cancel"""
+    """Обработчик команды /cancel: /cancel имя отменяет один таймер, без имени - все"""
     try:
         timer_key = get_timer_key(message)
+        args = message.text.split()[1:]
         
-        if await cancel_existing_timer(timer_key):
-            await message.answer("👉 Таймер отменён.")
-            logger.info(f"Таймер отменен пользователем {message.from_user.id} в чате {message.chat.id}")
+        if args:
+            name = args[0]
+            # Такого имени у таймера быть не может, а эхо его в HTML-ответе сломало бы разметку
+            if not TIMER_NAME_PATTERN.fullmatch(name):
+                await message.answer(
+                    "Таймер с таким именем не найден: имя начинается с буквы или _ "
+                    "и содержит до 32 букв, цифр, _ и -."
+                )
+            elif cancel_existing_timer(timer_key, SOURCE_COMMAND, name):
+                await message.answer(f"👉 Таймер {timer_title(name)} отменён.")
+            else:
+                await message.answer(f"Таймер {timer_title(name)} не найден.")
         else:
-            await message.answer("У вас нет активных таймеров.")
+            await message.answer(describe_cancel_all(cancel_all_timers(timer_key, SOURCE_COMMAND)))
+        logger.info("Отмена таймеров пользователем %s в чате %s", message.from_user.id, message.chat.id)
             
     except Exception as e:
-        logger.error(f"Ошибка в cancel_timer_command: {e}", exc_info=True)
+        logger.error("Ошибка в cancel_timer_command: %s", e, exc_info=True)
         await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
 
 
@@ -276,78 +536,47 @@ async def status_command(message: Message):
     """Обработчик команды /status"""
     try:
         timer_key = get_timer_key(message)
-        
-        if timer_key in active_timers:
-            task = active_timers[timer_key]
-            if not task.done():
-                # Для демонстрации показываем что таймер активен
-                # В реальной реализации можно было бы отслеживать время начала
-                await message.answer("⏱️ Таймер активен. (Точное оставшееся время не отслеживается)")
-            else:
-                # Задача завершена, удаляем из активных
-                del active_timers[timer_key]
-                await message.answer("Таймер не запущен.")
-        else:
-            await message.answer("Таймер не запущен.")
+        await message.answer(describe_timer_status(timer_key))
             
     except Exception as e:
-        logger.error(f"Ошибка в status_command: {e}", exc_info=True)
+        logger.error("Ошибка в status_command: %s", e, exc_info=True)
         await message.answer("Произошла ошибка при обработке запроса. Попробуйте позже.")
 
 
 async def start_command(message: Message):
     """Обработчик команды /start"""
-    welcome_text = """
-🕒 Добро пожаловать в бота-таймер!
+    await message.answer(WELCOME_TEXT, reply_markup=main_keyboard())
 
-Этот бот поможет вам управлять таймерами в Telegram.
 
-Используйте кнопки ниже для быстрого запуска таймеров или команды:
-• /timer время - Запустить таймер
-• /cancel - Отменить активный таймер  
-• /status - Показать статус таймера
-• /help - Подробная справка
+async def help_command(message: Message):
+    """Обработчик команды /help"""
+    await message.answer(help_text(Config.MAX_TIMERS_PER_USER))
 
-Выберите время таймера или используйте команды! 🚀
-    """
-    keyboard = create_main_keyboard()
-    await message.answer(welcome_text, reply_markup=keyboard)
 
+def edit_inline(callback: CallbackQuery, text: str):
+    """
+    Ставит текст в сообщение с кнопками через MessageEditor
+    Правка без изменений не отправляется, частые нажатия сливаются
+    """
+    message = callback.message
+    editor.edit(message.chat.id, message.message_id, text, message.text)
 
-async def help_command(message: Message):
-    """Обработчик команды /help"""
-    help_text = """
-🕒 Команды бота:
 
-/start - Начать работу с ботом
-/timer время - Запустить таймер
-/cancel - Отменить активный таймер  
-/status - Показать статус таймера
-/help - Показать эту справку
+def is_timer_active(record: TimerRecord) -> bool:
+    return active_timers.is_current(record)
 
-Примеры использования:
-/timer 30s - таймер на 30 секунд
-/timer 5m - таймер на 5 минут
-/timer 1h - таймер на 1 час
-/timer 1h30m - таймер на 1 час 30 минут
-/timer 2m30s - таймер на 2 минуты 30 секунд
 
-Форматы времени:
-• s - секунды (10s)
-• m - минуты (5m)  
-• h - часы (2h)
-• Комбинации: 1h30m, 2m30s, 1h15m20s
-• Пробелы и регистр игнорируются: 1 H 30 M
+def countdown_for(record: TimerRecord, remaining: Optional[int]) -> str:
+    return countdown_text(record.duration, remaining)
 
-Ограничения:
-• Минимум: 1 секунда
-• Максимум: 24 часа (86400 секунд)
-• В группах: один таймер на пользователя
-• В приватных чатах: один таймер на пользователя
 
-⚠️ Важно: При перезапуске бота все таймеры сбрасываются!
-    """
-    await message.answer(help_text)
+def resume_countdowns(records: List[TimerRecord]):
+    """Возобновляет отсчет в сообщениях таймеров, запущенных кнопками"""
+    if not Config.LIVE_COUNTDOWN:
+        return
+    for record in records:
+        if record.source == SOURCE_CALLBACK and record.message_id is not None and record.recurrence is None:
+            editor.countdown(record)
 
 
 async def callback_handler(callback: CallbackQuery):
@@ -356,9 +585,9 @@ async def callback_handler(callback: CallbackQuery):
         data = callback.data
         
         # Обработка кнопок таймеров
-        if data.startswith("timer_"):
-            time_str = data.replace("timer_", "")
-            duration = parse_time_duration(time_str)
+        if data.startswith(TIMER_CALLBACK_PREFIX):
+            # Длительности кнопок клавиатуры разобраны заранее
+            duration = callback_duration(data, TIMER_CALLBACKS)
             
             if duration is None:
                 await callback.answer("Ошибка парсинга времени", show_alert=True)
@@ -370,14 +599,18 @@ async def callback_handler(callback: CallbackQuery):
                 return
             
             # Получаем ключ для хранения таймера
-            timer_key = get_timer_key(callback.message)
+            timer_key = get_timer_key(callback.message, callback.from_user)
             
-            # Отменяем существующий таймер если есть
-            had_existing = await cancel_existing_timer(timer_key)
+            refusal = check_timer_quota(timer_key, callback.message.chat.id, '')
+            if refusal:
+                await callback.answer(refusal, show_alert=True)
+                return
             
-            # Создаем новую задачу таймера
-            task = asyncio.create_task(timer_task(callback.message, duration))
-            active_timers[timer_key] = task
+            # Запускаем таймер без имени, отменяя существующий если есть
+            record, had_existing = start_timer(
+                timer_key, callback.message.chat.id, duration, SOURCE_CALLBACK, callback.message.message_id,
+                owner=get_owner_name(callback.message, callback.from_user),
+            )
             
             # Формируем ответ
             time_desc = format_time_description(duration)
@@ -387,92 +620,146 @@ async def callback_handler(callback: CallbackQuery):
                 response = f"👉 Таймер на {time_desc} запущен!"
             
             await callback.answer(response)
-            await callback.message.edit_text(response, reply_markup=create_main_keyboard())
+            # Отсчет привязан к запущенной здесь записи: если за время await ее заменило
+            # параллельное нажатие, в сообщении сразу покажется отмена
+            if Config.LIVE_COUNTDOWN:
+                editor.countdown(record, callback.message.text)
+            else:
+                edit_inline(callback, response)
             
         # Обработка кнопки отмены
         elif data == "cancel_timer":
-            timer_key = get_timer_key(callback.message)
-            
-            if await cancel_existing_timer(timer_key):
-                response = "👉 Таймер отменён."
-            else:
-                response = "У вас нет активных таймеров."
+            timer_key = get_timer_key(callback.message, callback.from_user)
+            response = describe_cancel_all(cancel_all_timers(timer_key, SOURCE_CALLBACK))
             
             await callback.answer(response)
-            await callback.message.edit_text(response, reply_markup=create_main_keyboard())
+            edit_inline(callback, response)
             
         # Обработка кнопки статуса
         elif data == "status_timer":
-            timer_key = get_timer_key(callback.message)
-            
-            if timer_key in active_timers:
-                task = active_timers[timer_key]
-                if not task.done():
-                    response = "⏱️ Таймер активен."
-                else:
-                    del active_timers[timer_key]
-                    response = "Таймер не запущен."
-            else:
-                response = "Таймер не запущен."
+            timer_key = get_timer_key(callback.message, callback.from_user)
+            response = describe_timer_status(timer_key)
             
             await callback.answer(response)
-            await callback.message.edit_text(response, reply_markup=create_main_keyboard())
+            edit_inline(callback, response)
             
         # Обработка кнопки помощи
         elif data == "help_info":
-            help_text = """
-🕒 Команды бота:
-
-/start - Начать работу с ботом
-/timer время - Запустить таймер
-/cancel - Отменить активный таймер  
-/status - Показать статус таймера
-/help - Показать эту справку
-
-Примеры использования:
-/timer 30s - таймер на 30 секунд
-/timer 5m - таймер на 5 минут
-/timer 1h - таймер на 1 час
-/timer 1h30m - таймер на 1 час 30 минут
-/timer 2m30s - таймер на 2 минуты 30 секунд
-
-Форматы времени:
-• s - секунды (10s)
-• m - минуты (5m)  
-• h - часы (2h)
-• Комбинации: 1h30m, 2m30s, 1h15m20s
-• Пробелы и регистр игнорируются: 1 H 30 M
-
-Ограничения:
-• Минимум: 1 секунда
-• Максимум: 24 часа (86400 секунд)
-• В группах: один таймер на пользователя
-• В приватных чатах: один таймер на пользователя
-
-⚠️ Важно: При перезапуске бота все таймеры сбрасываются!
-            """
             await callback.answer("Справка")
-            await callback.message.edit_text(help_text, reply_markup=create_main_keyboard())
+            edit_inline(callback, help_text(Config.MAX_TIMERS_PER_USER))
             
     except Exception as e:
-        logger.error(f"Ошибка в callback_handler: {e}", exc_info=True)
+        logger.error("Ошибка в callback_handler: %s", e, exc_info=True)
         await callback.answer("Произошла ошибка при обработке запроса. Попробуйте позже.", show_alert=True)
 
 
+def restore_records(records: List[TimerRecord]) -> int:
+    """
+    Поднимает пачку записей из хранилища или переданного снимка
+    Возвращает число разовых таймеров, истекших за время простоя
+    """
+    now_monotonic = time.monotonic()
+    overdue = sum(1 for record in records if record.deadline <= now_monotonic and record.recurrence is None)
+    # Повторяющиеся таймеры переносятся на ближайшее повторение без пропущенных
+    advance_recurring(records)
+    active_timers.update(records)
+    scheduler.schedule_many(records)
+    resume_countdowns(records)
+    return overdue
+
+
+async def restore_timers(rows: Optional[List[TimerRow]] = None):
+    """
+    Восстанавливает таймеры из хранилища после перезапуска
+    rows - снимок таймеров, переданный работающим экземпляром (handoff)
+    Хранилище читается пачками: между пачками цикл событий свободен, и прием
+    обновлений запускается, пока таймеры еще поднимаются
+    Таймеры, истекшие за время простоя, сработают на ближайшем тике планировщика
+    """
+    started = time.perf_counter()
+    restored = 0
+    overdue = 0
+    if rows is not None:
+        records = rows_to_records(rows, Config.TIMEZONE)
+        overdue = restore_records(records)
+        restored = len(records)
+        # Старый экземпляр мог писать в другую базу - снимок сохраняется и здесь
+        for record in records:
+            store.put(record)
+    else:
+        async for batch in store.load_batches():
+            overdue += restore_records(rows_to_records(batch, Config.TIMEZONE))
+            restored += len(batch)
+    
+    logger.info(
+        "Восстановлено %s таймеров (истекли во время простоя: %s) за %.3f с",
+        restored, overdue, time.perf_counter() - started,
+    )
+
+
+async def wait_restored(handler, event: Update, data):
+    """Обновления, принятые до конца восстановления, ждут его: /status и /cancel видят все таймеры"""
+    if restoring is not None and not restoring.done():
+        await asyncio.shield(restoring)
+    return await handler(event, data)
+
+
+async def track_update(handler, event: Update, data):
+    """Запоминает последнее принятое обновление, чтобы подтвердить его при остановке"""
+    global last_update_id
+    if last_update_id is None or event.update_id > last_update_id:
+        last_update_id = event.update_id
+    return await handler(event, data)
+
+
+# Команды и их обработчики
+COMMAND_HANDLERS = (
+    ("start", start_command),
+    ("timer", start_timer_command),
+    ("every", every_command),
+    ("cancel", cancel_timer_command),
+    ("status", status_command),
+    ("help", help_command),
+)
+
+
+def build_router() -> Router:
+    """
+    Роутер с обработчиками команд и кнопок, собирается один раз при запуске
+    Здесь же собираются готовые ответы, чтобы их не собирал первый пользователь
+    """
+    router = Router(name="timers")
+    for command, handler in COMMAND_HANDLERS:
+        router.message.register(handler, Command(command))
+    router.callback_query.register(callback_handler)
+    
+    # Время работы обработчиков и выборочное профилирование
+    handler_metrics = MetricsMiddleware(profiler)
+    router.message.middleware(handler_metrics)
+    router.callback_query.middleware(handler_metrics)
+    
+    main_keyboard()
+    help_text(Config.MAX_TIMERS_PER_USER)
+    return router
+
+
 async def on_startup():
-    """Функция запуска бота"""
-    logger.info("Бот запускается...")
-    logger.info("All timers reset on restart")  # Уведомление о сбросе таймеров
+    """Функция запуска бота: обработчики и middleware (таймеры поднимаются отдельно)"""
+    logger.info("Бот запускается (цикл событий %s)...", loop_name(asyncio.get_running_loop()))
     
-    # Регистрируем обработчики команд
-    dp.message.register(start_command, Command("start"))
-    dp.message.register(start_timer_command, Command("timer"))
-    dp.message.register(cancel_timer_command, Command("cancel"))
-    dp.message.register(status_command, Command("status"))
-    dp.message.register(help_command, Command("help"))
+    dp.include_router(build_router())
     
-    # Регистрируем обработчик callback-запросов (нажатий на кнопки)
-    dp.callback_query.register(callback_handler)
+    # Последнее принятое обновление подтверждается при остановке; принятые
+    # до конца восстановления таймеров обновления ждут его
+    dp.update.outer_middleware(track_update)
+    dp.update.outer_middleware(wait_restored)
+    
+    # Контроль допуска: спам и перегрузка отсекаются до фильтров и обработчиков
+    dp.message.outer_middleware(admission)
+    dp.callback_query.outer_middleware(admission)
+    HANDLERS_IN_FLIGHT.set_function(lambda: admission.in_flight)
+    ACTIVE_TIMERS.set_function(lambda: len(active_timers))
+    OUTBOUND_QUEUED.set_function(lambda: len(outbound))
     
     logger.info("Обработчики команд зарегистрированы")
     logger.info("Бот готов к работе!")
@@ -482,20 +769,52 @@ async def on_shutdown():
     """Функция остановки бота"""
     logger.info("Останавливаем бота...")
     
-    # Отменяем все активные таймеры
+    # Прекращаем прием обновлений и дорабатываем уже принятые
+    await stop_intake()
+    if handoff_server:
+        await handoff_server.stop()
+    
+    # Во фронте шардирования останавливаем воркеры
+    if shard_router:
+        await shard_router.stop()
+    
+    if metrics_server:
+        await metrics_server.stop()
+    
+    # Останавливаем планировщик, таймеры остаются в хранилище
+    if clock_watcher:
+        await clock_watcher.stop()
+    if scheduler:
+        await scheduler.stop()
+    # Аренда отдается, как только таймеры записаны в журнал: резерв не ждет ее истечения
+    if elector:
+        await store.flush()
+        await elector.stop()
     if active_timers:
-        logger.info(f"Отменяем {len(active_timers)} активных таймеров...")
-        
-        # Отменяем все задачи
-        for timer_key, task in active_timers.items():
-            task.cancel()
-        
-        # Ждем завершения всех задач
-        if active_timers:
-            await asyncio.gather(*active_timers.values(), return_exceptions=True)
-        
+        logger.info("Сохраняем %s активных таймеров...", len(active_timers))
         active_timers.clear()
     
+    if editor:
+        await editor.close()
+    
+    if watchdog:
+        watchdog.stop()
+    if lag_monitor:
+        lag_monitor.report()
+        await lag_monitor.stop()
+    if admission and any(admission.stats().values()):
+        logger.info("Отброшено обновлений контролем допуска: %s", admission.stats())
+    
+    # Дожидаемся отправки уже сработавших уведомлений
+    if outbound:
+        await outbound.close(Config.DRAIN_TIMEOUT)
+    
+    # Сбрасываем на диск последние изменения
+    if store:
+        await store.close()
+    if coordination:
+        await coordination.close()
+    
     # Закрываем сессию бота
     if bot:
         await bot.session.close()
@@ -503,46 +822,448 @@ async def on_shutdown():
     logger.info("Бот остановлен")
 
 
+async def run_webhook(process, drop_pending: bool = True):
+    """
+    Запускает прием обновлений через webhook и работает до остановки
+    drop_pending=False - обновления, накопленные в Telegram, не сбрасываются (смена экземпляра)
+    """
+    global webhook_server
+    from webhook import WebhookServer
+    
+    webhook_server = WebhookServer(
+        process,
+        path=Config.WEBHOOK_PATH,
+        secret=Config.WEBHOOK_SECRET,
+        queue_size=Config.WEBHOOK_QUEUE_SIZE,
+        workers=Config.WEBHOOK_WORKERS,
+    )
+    await webhook_server.start(Config.WEBHOOK_HOST, Config.WEBHOOK_PORT)
+    await bot.set_webhook(
+        url=Config.WEBHOOK_URL.rstrip('/') + Config.WEBHOOK_PATH,
+        secret_token=Config.WEBHOOK_SECRET,
+        drop_pending_updates=drop_pending,
+    )
+    logger.info("Webhook установлен: %s", Config.WEBHOOK_URL)
+    
+    # Обновления обрабатываются воркерами сервера
+    await asyncio.Event().wait()
+
+
+async def on_shard_assigned(shard: int):
+    """Воркер получил шард: поднимаем его таймеры"""
+    records = rows_to_records(await store.acquire(shard), Config.TIMEZONE)
+    restore_records(records)
+    logger.info("Получен шард %s, таймеров: %s", shard, len(records))
+
+
+async def on_shard_released(shard: int):
+    """Воркер отдает шард: таймеры остаются в базе шарда, из памяти их убираем"""
+    released = [record for record in active_timers if store.shard_of(record.key) == shard]
+    # Отсчет в сообщениях продолжит новый владелец шарда
+    editor.forget(released)
+    for record in released:
+        active_timers.discard(record)
+        scheduler.cancel(record)
+    await store.release(shard)
+    logger.info("Отдан шард %s, таймеров: %s", shard, len(released))
+
+
+async def run_shard_worker(worker_id: int):
+    """Воркер шардирования: обрабатывает обновления своих шардов от фронта"""
+    from sharding import ShardWorker
+    
+    worker = ShardWorker(
+        Config.SHARD_SOCKET,
+        worker_id,
+        on_assign=on_shard_assigned,
+        on_release=on_shard_released,
+        on_update=functools.partial(dp.feed_raw_update, bot),
+    )
+    await worker.run()
+
+
+async def run_shard_front():
+    """Фронт шардирования: принимает обновления и раздает их воркерам"""
+    global shard_router
+    from sharding import ShardRouter, poll_raw_updates, rehome_shards
+    
+    # Базы шардов прежней раскладки перекладываются по чатам до запуска воркеров
+    await asyncio.get_running_loop().run_in_executor(None, rehome_shards, Config.SHARD_DIR, Config.SHARD_COUNT)
+    shard_router = ShardRouter(
+        Config.SHARD_SOCKET,
+        Config.SHARD_COUNT,
+        Config.SHARD_WORKERS,
+        worker_command=[sys.executable, os.path.abspath(__file__), '--shard-worker'],
+    )
+    await shard_router.start()
+    
+    if Config.BOT_MODE == 'webhook':
+        async def route(update):
+            shard_router.route(update)
+            await shard_router.drain()
+        
+        await run_webhook(route)
+    else:
+        await bot.delete_webhook(drop_pending_updates=True)
+        await poll_raw_updates(
+            bot.session.api.api_url(token=bot.token, method='getUpdates'),
+            shard_router.route,
+            shard_router.drain,
+        )
+
+
+async def run_polling():
+    """Long polling getUpdates до остановки приема"""
+    global polling
+    
+    # Webhook и getUpdates взаимоисключающие; getMe, с которого начинает
+    # start_polling, идет параллельно (результат кешируется в bot.me())
+    await asyncio.gather(bot.delete_webhook(), bot.me())
+    polling = True
+    try:
+        # Сигналы обрабатывает main, сессию закрывает on_shutdown
+        await dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+    finally:
+        polling = False
+
+
+def start_intake(worker_id: Optional[int], keep_pending: bool = False):
+    """
+    Запускает прием обновлений фоновой задачей
+    keep_pending - не сбрасывать накопленные в Telegram обновления (работа передана другим экземпляром)
+    """
+    global intake_task
+    
+    if Config.SHARD_WORKERS and worker_id is None:
+        intake = run_shard_front()
+    elif worker_id is not None:
+        intake = run_shard_worker(worker_id)
+    elif Config.BOT_MODE == 'webhook':
+        intake = run_webhook(functools.partial(dp.feed_raw_update, bot), drop_pending=not keep_pending)
+    else:
+        intake = run_polling()
+    intake_task = asyncio.create_task(intake)
+    intake_task.add_done_callback(on_intake_done)
+
+
+def on_intake_done(task: asyncio.Task):
+    """Прием завершился сам (ошибка, фронт закрыл соединение) - бот останавливается"""
+    # Прием, остановленный stop_intake, уже не текущий
+    if task is not intake_task:
+        return
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Прием обновлений остановился с ошибкой: %s", task.exception(), exc_info=task.exception())
+    stop_requested.set()
+
+
+async def stop_intake():
+    """
+    Прекращает прием обновлений и дожидается обработчиков уже принятых (не дольше DRAIN_TIMEOUT)
+    При polling подтверждает принятые обновления, чтобы следующий экземпляр не получил их снова
+    """
+    global intake_task, webhook_server
+    
+    task, intake_task = intake_task, None
+    if task is None:
+        return
+    was_polling = polling
+    if was_polling:
+        await dp.stop_polling()
+    else:
+        if webhook_server:
+            # Сервер дорабатывает свою очередь обновлений
+            await webhook_server.stop(Config.DRAIN_TIMEOUT)
+            webhook_server = None
+        task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    
+    deadline = time.monotonic() + Config.DRAIN_TIMEOUT
+    while admission and admission.in_flight and time.monotonic() < deadline:
+        await asyncio.sleep(0.05)
+    if admission and admission.in_flight:
+        logger.warning("Не дождались обработчиков при остановке приема: %s", admission.in_flight)
+    
+    if was_polling and last_update_id is not None:
+        try:
+            await bot.get_updates(offset=last_update_id + 1, limit=1, timeout=0)
+        except Exception as e:
+            logger.warning("Не удалось подтвердить обработанные обновления: %s", e)
+    logger.info("Прием обновлений остановлен")
+
+
+async def hand_off_timers() -> List[TimerRow]:
+    """Новый экземпляр забирает работу: прием и планировщик останавливаются, таймеры отдаются снимком"""
+    await stop_intake()
+    await clock_watcher.stop()
+    await scheduler.stop()
+    await store.flush()
+    # Порт метрик переходит новому экземпляру вместе с таймерами
+    if metrics_server:
+        await metrics_server.stop()
+    return [record_to_row(record) for record in active_timers]
+
+
+def on_handoff_finished(ok: bool):
+    """Новый экземпляр ответил на передачу работы"""
+    if ok:
+        # Таймеры срабатывают в новом экземпляре, здесь остается дописать уведомления
+        stop_requested.set()
+        return
+    logger.warning("Новый экземпляр не принял работу, продолжаем сами")
+    if metrics_server:
+        asyncio.create_task(resume_metrics_server())
+    scheduler.start()
+    clock_watcher.start()
+    start_intake(None, keep_pending=True)
+
+
+async def on_elected(epoch: int, rows: List[TimerRow]):
+    """Реплика избрана лидером: поднимаем теплую копию таймеров из журнала и начинаем прием"""
+    store.epoch = epoch
+    restore_records(rows_to_records(rows, Config.TIMEZONE))
+    # Обновления, не обработанные прежним лидером, ждут в Telegram
+    start_intake(None, keep_pending=True)
+
+
+async def on_deposed():
+    """Аренда потеряна: таймеры срабатывают у нового лидера, здесь прием и планировщик останавливаются"""
+    store.discard()
+    await scheduler.stop()
+    await stop_intake()
+    # Отсчет в сообщениях продолжит новый лидер: здесь таймеры не отменены, а переехали
+    editor.forget(active_timers)
+    for record in active_timers:
+        scheduler.cancel(record)
+    active_timers.clear()
+    scheduler.start()
+
+
+def get_shard_worker_id() -> Optional[int]:
+    """Номер воркера, если процесс запущен фронтом как воркер шардирования"""
+    if len(sys.argv) == 3 and sys.argv[1] == '--shard-worker':
+        return int(sys.argv[2])
+    return None
+
+
+async def start_metrics_server(worker_id: Optional[int]):
+    """Поднимает эндпоинт /metrics, если задан METRICS_PORT"""
+    global metrics_server, profiler
+    
+    if Config.PROFILE_SAMPLE_EVERY:
+        profiler = HandlerProfiler(Config.PROFILE_SAMPLE_EVERY)
+    if not Config.METRICS_PORT:
+        return
+    
+    # У каждого воркера шардирования свой порт
+    port = Config.METRICS_PORT if worker_id is None else Config.METRICS_PORT + 1 + worker_id
+    metrics_server = MetricsServer(profiler=profiler)
+    await metrics_server.start(Config.METRICS_HOST, port)
+
+
+async def resume_metrics_server(attempts: int = 30):
+    """
+    Снова занимает порт метрик после неудачной передачи работы
+    Новый экземпляр мог успеть его занять: ждем, пока он завершится
+    """
+    for attempt in range(attempts):
+        try:
+            await metrics_server.start(Config.METRICS_HOST, Config.METRICS_PORT)
+            return
+        except OSError as e:
+            if attempt == attempts - 1:
+                logger.error("Порт метрик %s так и не освободился: %s", Config.METRICS_PORT, e)
+                return
+            await asyncio.sleep(1.0)
+
+
 def setup_signal_handlers():
-    """Настройка обработчиков сигналов для graceful shutdown"""
-    def signal_handler(signum, frame):
-        logger.info(f"Получен сигнал {signum}, инициируем graceful shutdown...")
-        asyncio.create_task(on_shutdown())
-        sys.exit(0)
+    """
+    Настройка обработчиков сигналов для graceful shutdown
+    SIGINT и SIGTERM не прерывают работу сразу: main прекращает прием обновлений,
+    дорабатывает принятые, дописывает уведомления и сохраняет таймеры.
+    Повторный сигнал обрабатывается по умолчанию и завершает процесс.
+    Где цикл событий не умеет обрабатывать сигналы (Windows), ставится
+    обычный обработчик signal.signal.
+    """
+    loop = asyncio.get_running_loop()
+    
+    def signal_handler(signum):
+        logger.info("Получен сигнал %s, плавная остановка...", signum)
+        loop.remove_signal_handler(signum)
+        stop_requested.set()
+    
+    def fallback_handler(signum, frame):
+        logger.info("Получен сигнал %s, плавная остановка...", signum)
+        signal.signal(signum, signal.default_int_handler if signum == signal.SIGINT else signal.SIG_DFL)
+        loop.call_soon_threadsafe(stop_requested.set)
     
-    signal.signal(signal.SIGINT, signal_handler)
-    signal.signal(signal.SIGTERM, signal_handler)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, signal_handler, signum)
+        except NotImplementedError:
+            signal.signal(signum, fallback_handler)
 
 
 async def main():
     """Основная функция"""
-    global bot, dp
+    global bot, dp, scheduler, store, outbound, editor, admission, lag_monitor, watchdog, clock_watcher, handoff_server
+    global coordination, elector, restoring, stop_requested
     
+    stop_requested = asyncio.Event()
     try:
         # Инициализируем бота и диспетчер
+        session = None
+        if Config.TELEGRAM_API_URL:
+            session = AiohttpSession(api=TelegramAPIServer.from_base(Config.TELEGRAM_API_URL))
         bot = Bot(
             token=Config.TELEGRAM_BOT_TOKEN,
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
-        dp = Dispatcher()
+        bot.session.middleware(ApiMetricsMiddleware())
         
         # Настраиваем обработчики сигналов
         setup_signal_handlers()
         
-        # Запускаем бота
+        # Фронт шардирования не обрабатывает обновления сам
+        worker_id = get_shard_worker_id()
+        # Порт метрик работающего экземпляра освобождается только вместе со снимком таймеров:
+        # экземпляр, который может забрать работу, поднимает метрики после передачи
+        takes_over = bool(Config.HANDOFF_SOCKET) and worker_id is None and not Config.SHARD_WORKERS and not Config.HA_BACKEND
+        if not takes_over:
+            await start_metrics_server(worker_id)
+        if Config.SHARD_WORKERS and worker_id is None:
+            start_intake(None)
+            await stop_requested.wait()
+            return
+        
+        dp = Dispatcher()
+        
+        # Очередь исходящих уведомлений с лимитами Telegram
+        # Глобальный лимит делится между воркерами шардирования
+        workers_count = Config.SHARD_WORKERS if worker_id is not None else 1
+        outbound = OutboundQueue(
+            bot,
+            workers=Config.OUTBOUND_WORKERS,
+            global_rate=Config.OUTBOUND_GLOBAL_RATE / workers_count,
+            chat_rate=Config.OUTBOUND_CHAT_RATE,
+            group_rate=Config.OUTBOUND_GROUP_RATE,
+            max_attempts=Config.OUTBOUND_MAX_ATTEMPTS,
+            burst=Config.OUTBOUND_BURST,
+        )
+        outbound.start()
+        
+        # Правки сообщений с кнопками и живой отсчет с общим лимитом правок
+        editor = MessageEditor(
+            bot,
+            main_keyboard(),
+            render=countdown_for,
+            is_active=is_timer_active,
+            rate=Config.MESSAGE_EDIT_RATE / workers_count,
+        )
+        editor.start()
+        
+        # Задержка цикла событий для сброса нагрузки и отчетов, поиск кода, который держит цикл,
+        # и лимиты на пользователя и чат
+        lag_monitor = LoopLagMonitor(report_interval=Config.LOOP_REPORT_INTERVAL, drift=fire_drift)
+        lag_monitor.start()
+        watchdog = SlowCallbackWatchdog(lag_monitor, Config.SLOW_CALLBACK_THRESHOLD)
+        watchdog.start()
+        admission = AdmissionMiddleware(
+            outbound,
+            lag_monitor,
+            user_limit=Config.ADMISSION_USER_LIMIT,
+            user_window=Config.ADMISSION_USER_WINDOW,
+            chat_limit=Config.ADMISSION_CHAT_LIMIT,
+            chat_window=Config.ADMISSION_CHAT_WINDOW,
+            max_in_flight=Config.ADMISSION_MAX_IN_FLIGHT,
+            lag_threshold=Config.ADMISSION_LAG_THRESHOLD,
+        )
+        
+        # Хранилище таймеров, переживающее перезапуск
+        # Воркер хранит таймеры по базе на каждый свой шард
+        if worker_id is not None:
+            from sharding import ShardedTimerStore
+            store = ShardedTimerStore(Config.SHARD_DIR, Config.SHARD_COUNT, Config.STORE_COMMIT_INTERVAL)
+        elif Config.HA_BACKEND:
+            # У реплик таймеры живут в общем журнале координации, а не в локальной базе
+            from coordination import LeaderElector, ReplicatedTimerStore, create_backend
+            coordination = create_backend(Config.HA_BACKEND)
+            await coordination.open()
+            store = ReplicatedTimerStore(coordination, Config.STORE_COMMIT_INTERVAL)
+        else:
+            store = TimerStore(Config.TIMERS_DB_PATH, Config.STORE_COMMIT_INTERVAL)
+        await store.open()
+        
+        # Один планировщик владеет дедлайнами всех таймеров
+        scheduler = TimerScheduler(on_timers_fired)
+        scheduler.start()
+        
+        # Календарные напоминания пересчитываются при переводе часов
+        clock_watcher = ClockWatcher(on_clock_jump)
+        clock_watcher.start()
+        
+        # Реплика: прием и таймеры только у лидера, резерв держит теплую копию журнала
+        if coordination:
+            await on_startup()
+            elector = LeaderElector(
+                coordination,
+                Config.HA_NODE_ID or f'{socket.gethostname()}:{os.getpid()}',
+                Config.HA_LEASE_TTL,
+                on_elected,
+                on_deposed,
+            )
+            elector.start()
+            await stop_requested.wait()
+            return
+        
+        # Если уже работает другой экземпляр, забираем у него таймеры без простоя
+        handoff = None
+        rows = None
+        if Config.HANDOFF_SOCKET and worker_id is None:
+            from handoff import HandoffClient, HandoffError, HandoffServer
+            handoff = HandoffClient(Config.HANDOFF_SOCKET, timeout=2 * Config.DRAIN_TIMEOUT + 10)
+            try:
+                rows = await handoff.take_over()
+            except HandoffError as e:
+                # Старый экземпляр продолжает работу: второй рядом с ним дублировал бы срабатывания
+                logger.error("Работа не передана (%s), экземпляр завершается", e)
+                raise SystemExit(1)
+            await start_metrics_server(worker_id)
+        
+        # Запускаем бота: таймеры, сохраненные до перезапуска или переданные при смене
+        # экземпляра, поднимаются параллельно с запуском приема обновлений
+        restoring = asyncio.create_task(restore_timers(rows))
         await on_startup()
-        await dp.start_polling(bot, skip_updates=True)
+        if rows is not None:
+            # Старый экземпляр завершается, когда таймеры уже в планировщике
+            await restoring
+            try:
+                await handoff.ready()
+            except HandoffError as e:
+                logger.error("Работа не передана (%s), экземпляр завершается", e)
+                raise SystemExit(1)
+        if handoff is not None:
+            handoff_server = HandoffServer(
+                Config.HANDOFF_SOCKET, hand_off_timers, on_handoff_finished, ready_timeout=2 * Config.DRAIN_TIMEOUT + 10
+            )
+            await handoff_server.start()
+        start_intake(worker_id, keep_pending=rows is not None)
+        await restoring
+        await stop_requested.wait()
         
     except Exception as e:
-        logger.error(f"Критическая ошибка при запуске бота: {e}", exc_info=True)
+        logger.error("Критическая ошибка при запуске бота: %s", e, exc_info=True)
     finally:
         await on_shutdown()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        run(main(), Config.EVENT_LOOP)
     except KeyboardInterrupt:
         logger.info("Получен сигнал прерывания")
     except Exception as e:
-        logger.error(f"Критическая ошибка: {e}", exc_info=True)
+        logger.error("Критическая ошибка: %s", e, exc_info=True)
+    finally:
+        stop_logging(log_listener)
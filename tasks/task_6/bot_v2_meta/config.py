@@ -0,0 +1,129 @@
+"""
+Конфигурация бота
+Значения читаются из переменных окружения и файла .env
+"""
+
+import os
+import socket
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class Config:
+    """Настройки бота"""
+
+    # Токен бота (поддерживается и старое имя переменной BOT_TOKEN)
+    TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN') or os.getenv('BOT_TOKEN')
+
+    # Адрес Bot API (например, локальный сервер или тестовый стенд)
+    TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+    # Уровень логирования
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+    # Файл лога и его ротация: по размеру или по времени (midnight, H, D...)
+    LOG_FILE = os.getenv('LOG_FILE', 'bot.log')
+    LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+    LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))
+    LOG_ROTATE_WHEN = os.getenv('LOG_ROTATE_WHEN', '')
+    # Формат записей: text или json (одна JSON-запись на строку)
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text')
+
+    # Ограничения длительности таймера в секундах
+    MIN_DURATION = 1
+    MAX_DURATION = 86400
+
+    # Повторяющиеся таймеры: минимальный интервал /every и часовой пояс
+    # для расписаний daily и cron
+    MIN_REPEAT_INTERVAL = int(os.getenv('MIN_REPEAT_INTERVAL', '60'))
+    TIMEZONE = os.getenv('TIMEZONE', 'Europe/Moscow')
+
+    # Квоты на число одновременных таймеров
+    MAX_TIMERS_PER_USER = int(os.getenv('MAX_TIMERS_PER_USER', '10'))
+    MAX_TIMERS_PER_CHAT = int(os.getenv('MAX_TIMERS_PER_CHAT', '200'))
+
+    # Хранилище таймеров (SQLite в режиме WAL)
+    TIMERS_DB_PATH = os.getenv('TIMERS_DB_PATH', 'timers.db')
+    # Интервал группового коммита записей в хранилище, секунды
+    STORE_COMMIT_INTERVAL = float(os.getenv('STORE_COMMIT_INTERVAL', '0.05'))
+
+    # Очередь исходящих сообщений
+    OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', '8'))
+    # Глобальный лимит Telegram - около 30 сообщений в секунду
+    OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '30'))
+    # Лимиты на один чат: личный - 1 сообщение в секунду, группа - 20 в минуту
+    OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))
+    OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', str(20 / 60)))
+    # Число попыток отправки при временных ошибках
+    OUTBOUND_MAX_ATTEMPTS = int(os.getenv('OUTBOUND_MAX_ATTEMPTS', '5'))
+    # Запас глобального лимита в секундах отправки: всплеск уведомлений
+    # растягивается на равномерную отправку, а не уходит пачкой
+    OUTBOUND_BURST = float(os.getenv('OUTBOUND_BURST', '0.1'))
+
+    # Живой отсчет в сообщении с кнопками (1 - включен, 0 - выключен)
+    LIVE_COUNTDOWN = os.getenv('LIVE_COUNTDOWN', '1') == '1'
+    # Общий лимит правок inline-сообщений в секунду, не зависит от числа отсчетов
+    MESSAGE_EDIT_RATE = float(os.getenv('MESSAGE_EDIT_RATE', '5'))
+
+    # Контроль допуска обновлений (0 - проверка выключена)
+    # Скользящие окна: не больше LIMIT обновлений за WINDOW секунд
+    ADMISSION_USER_LIMIT = int(os.getenv('ADMISSION_USER_LIMIT', '20'))
+    ADMISSION_USER_WINDOW = float(os.getenv('ADMISSION_USER_WINDOW', '10'))
+    ADMISSION_CHAT_LIMIT = int(os.getenv('ADMISSION_CHAT_LIMIT', '60'))
+    ADMISSION_CHAT_WINDOW = float(os.getenv('ADMISSION_CHAT_WINDOW', '10'))
+    # Предел одновременно работающих обработчиков. Обработчик, который ждет ответа
+    # Telegram, почти ничего не стоит: предел с запасом пропускает всплеск нажатий
+    # одной кнопки в тысяче чатов, а перегрузку процессора ловит задержка цикла
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '2048'))
+    # Задержка цикла событий в секундах, при которой обновления сбрасываются
+    ADMISSION_LAG_THRESHOLD = float(os.getenv('ADMISSION_LAG_THRESHOLD', '0.5'))
+
+    # Цикл событий: asyncio или uvloop (pip install uvloop, без пакета - asyncio)
+    EVENT_LOOP = os.getenv('EVENT_LOOP', 'asyncio')
+    # Остановка цикла дольше порога в секундах пишется в лог со стеком (0 - выключено)
+    SLOW_CALLBACK_THRESHOLD = float(os.getenv('SLOW_CALLBACK_THRESHOLD', '0.25'))
+    # Как часто писать в лог перцентили задержки цикла и опоздания срабатываний, секунды (0 - выключено)
+    LOOP_REPORT_INTERVAL = float(os.getenv('LOOP_REPORT_INTERVAL', '60'))
+
+    # Способ получения обновлений: polling или webhook
+    BOT_MODE = os.getenv('BOT_MODE', 'polling')
+    # Публичный адрес, на который Telegram будет слать обновления
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+    WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+    # Размер очереди необработанных обновлений и число обработчиков
+    WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+    WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))
+
+    # Шардирование таймеров между процессами (0 - один процесс)
+    SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '0'))
+    # Число шардов - не меняется без миграции баз шардов
+    SHARD_COUNT = int(os.getenv('SHARD_COUNT', '16'))
+    # Каталог с базами шардов и сокет для связи фронта с воркерами
+    SHARD_DIR = os.getenv('SHARD_DIR', 'shards')
+    SHARD_SOCKET = os.getenv('SHARD_SOCKET', 'bot_shards.sock')
+
+    # Плавная остановка: сколько ждать обработчиков принятых обновлений
+    # и отправки очереди уведомлений, секунды
+    DRAIN_TIMEOUT = float(os.getenv('DRAIN_TIMEOUT', '10'))
+    # Сокет передачи работы новому экземпляру при перезапуске ('' - выключено)
+    # Нужны unix-сокеты: без них (Windows) передача выключена
+    HANDOFF_SOCKET = os.getenv('HANDOFF_SOCKET', 'bot_handoff.sock') if hasattr(socket, 'AF_UNIX') else ''
+
+    # Реплики с выбором лидера: 'sqlite:путь' - аренда и журнал таймеров
+    # в общем для реплик файле ('' - одна реплика, передача через HANDOFF_SOCKET)
+    HA_BACKEND = os.getenv('HA_BACKEND', '')
+    # Срок аренды лидера, секунды: резерв забирает работу упавшего лидера не позже чем через 1.25 * TTL
+    HA_LEASE_TTL = float(os.getenv('HA_LEASE_TTL', '5'))
+    # Имя реплики в аренде (по умолчанию хост:pid)
+    HA_NODE_ID = os.getenv('HA_NODE_ID', '')
+
+    # Эндпоинт Prometheus /metrics (0 - выключен)
+    # Воркеры шардирования слушают METRICS_PORT + 1 + номер воркера
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    # Профилировать каждый N-й вызов обработчика (0 - профилировщик выключен)
+    PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', '0'))
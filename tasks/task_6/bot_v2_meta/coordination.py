@@ -0,0 +1,467 @@
+"""
+Отказоустойчивость: выбор лидера и реплицируемый журнал таймеров
+
+Несколько реплик бота работают одновременно, но обновления принимает и
+таймеры запускает только лидер - держатель аренды (lease) с конечным
+сроком. Лидер продлевает аренду каждые ttl/4 секунды; если продлить не
+удалось, он сам слагает полномочия раньше, чем аренда истечет у других.
+Резервная реплика пытается взять аренду с тем же периодом и все это
+время читает журнал таймеров, поэтому к моменту избрания таймеры уже
+лежат у нее в памяти. Смена лидера после падения занимает не больше
+ttl + ttl/4 секунд, после плавной остановки - не больше ttl/4.
+
+Журнал - последнее состояние каждого таймера с номером изменения (seq):
+резерв запрашивает изменения после последнего прочитанного номера.
+Удаления хранятся как надгробия и вычищаются через TOMBSTONE_TTL;
+резерв, отставший сильнее, заново читает снимок целиком. Каждая запись
+в журнал несет эпоху аренды: запись бывшего лидера после смены
+отвергается (fencing).
+
+Бэкенд координации - интерфейс CoordinationBackend; по умолчанию SQLite
+в общем для реплик файле (одна машина или общий том). Тот же интерфейс
+ложится на Redis-подобный сервис: аренда - SET NX PX и продление
+скриптом со сравнением держателя, эпоха - INCR, журнал - хеш последних
+состояний и сортированное множество номеров изменений.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import HA_ELECTIONS, HA_LEADER
+from storage import TimerRow, record_to_row
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Изменение таймера в журнале: (key_chat_id, key_user_id, name, строка или None для удаления)
+LogEntry = Tuple[int, int, str, Optional[TimerRow]]
+
+# Сколько хранятся надгробия удаленных таймеров, секунды
+TOMBSTONE_TTL = 3600.0
+
+
+class CoordinationBackend:
+    """
+    Аренда лидера и журнал таймеров, общие для всех реплик
+
+    Время аренды - по настенным часам: у реплик на разных машинах часы
+    должны быть синхронизированы с точностью заметно лучше ttl/4.
+    """
+
+    async def open(self) -> None:
+        pass
+
+    async def close(self) -> None:
+        pass
+
+    async def try_acquire(self, holder: str, ttl: float) -> Optional[int]:
+        """
+        Берет или продлевает аренду на ttl секунд
+        Возвращает эпоху аренды или None, если она у другого держателя
+        Эпоха растет при каждой смене держателя
+        """
+        raise NotImplementedError
+
+    async def release(self, holder: str) -> None:
+        """Отпускает аренду, если ее держит holder: резерв заберет ее сразу"""
+        raise NotImplementedError
+
+    async def append(self, epoch: int, entries: List[LogEntry]) -> bool:
+        """
+        Записывает пачку изменений одним номером seq
+        False - эпоха устарела, аренда уже у другого лидера
+        """
+        raise NotImplementedError
+
+    async def read(self, after: int) -> Optional[Tuple[int, List[LogEntry]]]:
+        """
+        Изменения с номером больше after: (последний номер, изменения)
+        None - нужные надгробия уже вычищены, читать снимок
+        """
+        raise NotImplementedError
+
+    async def snapshot(self) -> Tuple[int, List[TimerRow]]:
+        """Все живые таймеры и номер последнего изменения в снимке"""
+        raise NotImplementedError
+
+
+class SQLiteCoordination(CoordinationBackend):
+    """
+    Бэкенд координации в файле SQLite
+
+    Аренда, счетчик изменений и журнал - в одной базе, поэтому проверка
+    эпохи и запись пачки идут одной транзакцией BEGIN IMMEDIATE.
+    """
+
+    LEASE_NAME = 'leader'
+
+    def __init__(self, path: str, busy_timeout: float = 5.0):
+        self._path = path
+        self._busy_timeout = busy_timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='coordination')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._next_purge = 0.0
+
+    async def _run_in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        # Транзакции открываются явно: BEGIN IMMEDIATE сразу берет блокировку записи
+        self._conn = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(f'PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}')
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS lease (
+                name TEXT PRIMARY KEY,
+                holder TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                epoch INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS log_state (
+                id INTEGER PRIMARY KEY CHECK (id = 0),
+                seq INTEGER NOT NULL,
+                horizon INTEGER NOT NULL
+            );
+            INSERT OR IGNORE INTO log_state (id, seq, horizon) VALUES (0, 0, 0);
+            CREATE TABLE IF NOT EXISTS timer_log (
+                key_chat_id INTEGER NOT NULL,
+                key_user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                written_at REAL NOT NULL,
+                row TEXT,
+                PRIMARY KEY (key_chat_id, key_user_id, name)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS timer_log_seq ON timer_log (seq);
+            """
+        )
+
+    def _try_acquire(self, holder: str, ttl: float) -> Optional[int]:
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            current = conn.execute(
+                'SELECT holder, expires_at, epoch FROM lease WHERE name = ?', (self.LEASE_NAME,)
+            ).fetchone()
+            if current is None:
+                epoch = 1
+            elif current[0] == holder and current[1] > now:
+                epoch = current[2]
+            elif current[1] <= now:
+                epoch = current[2] + 1
+            else:
+                conn.execute('ROLLBACK')
+                return None
+            conn.execute(
+                'INSERT OR REPLACE INTO lease (name, holder, expires_at, epoch) VALUES (?, ?, ?, ?)',
+                (self.LEASE_NAME, holder, now + ttl, epoch),
+            )
+            conn.execute('COMMIT')
+            return epoch
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _release(self, holder: str) -> None:
+        self._conn.execute(
+            'UPDATE lease SET expires_at = 0 WHERE name = ? AND holder = ?', (self.LEASE_NAME, holder)
+        )
+
+    def _append(self, epoch: int, entries: List[LogEntry]) -> bool:
+        conn = self._conn
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            current = conn.execute('SELECT epoch FROM lease WHERE name = ?', (self.LEASE_NAME,)).fetchone()
+            if current is None or current[0] != epoch:
+                conn.execute('ROLLBACK')
+                return False
+            now = time.time()
+            seq = conn.execute('SELECT seq FROM log_state WHERE id = 0').fetchone()[0] + 1
+            conn.executemany(
+                'INSERT OR REPLACE INTO timer_log (key_chat_id, key_user_id, name, seq, written_at, row) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [
+                    (key_chat_id, key_user_id, name, seq, now, json.dumps(row) if row is not None else None)
+                    for key_chat_id, key_user_id, name, row in entries
+                ],
+            )
+            conn.execute('UPDATE log_state SET seq = ? WHERE id = 0', (seq,))
+            if now >= self._next_purge:
+                self._purge(now)
+            conn.execute('COMMIT')
+            return True
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _purge(self, now: float) -> None:
+        """Вычищает старые надгробия; горизонт - последний вычищенный номер"""
+        cutoff = now - TOMBSTONE_TTL
+        horizon = self._conn.execute(
+            'SELECT MAX(seq) FROM timer_log WHERE row IS NULL AND written_at < ?', (cutoff,)
+        ).fetchone()[0]
+        if horizon is not None:
+            self._conn.execute('DELETE FROM timer_log WHERE row IS NULL AND written_at < ?', (cutoff,))
+            self._conn.execute('UPDATE log_state SET horizon = MAX(horizon, ?) WHERE id = 0', (horizon,))
+        self._next_purge = now + TOMBSTONE_TTL / 10
+
+    def _read(self, after: int) -> Optional[Tuple[int, List[LogEntry]]]:
+        conn = self._conn
+        conn.execute('BEGIN')
+        try:
+            seq, horizon = conn.execute('SELECT seq, horizon FROM log_state WHERE id = 0').fetchone()
+            if after < horizon:
+                return None
+            rows = conn.execute(
+                'SELECT key_chat_id, key_user_id, name, row FROM timer_log WHERE seq > ? ORDER BY seq', (after,)
+            ).fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return seq, [
+            (key_chat_id, key_user_id, name, tuple(json.loads(row)) if row is not None else None)
+            for key_chat_id, key_user_id, name, row in rows
+        ]
+
+    def _snapshot(self) -> Tuple[int, List[TimerRow]]:
+        conn = self._conn
+        conn.execute('BEGIN')
+        try:
+            seq = conn.execute('SELECT seq FROM log_state WHERE id = 0').fetchone()[0]
+            rows = conn.execute('SELECT row FROM timer_log WHERE row IS NOT NULL').fetchall()
+        finally:
+            conn.execute('COMMIT')
+        return seq, [tuple(json.loads(row)) for row, in rows]
+
+    async def open(self) -> None:
+        await self._run_in_thread(self._open)
+        logger.info("База координации реплик открыта: %s", self._path)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            await self._run_in_thread(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+
+    async def try_acquire(self, holder: str, ttl: float) -> Optional[int]:
+        return await self._run_in_thread(self._try_acquire, holder, ttl)
+
+    async def release(self, holder: str) -> None:
+        await self._run_in_thread(self._release, holder)
+
+    async def append(self, epoch: int, entries: List[LogEntry]) -> bool:
+        return await self._run_in_thread(self._append, epoch, entries)
+
+    async def read(self, after: int) -> Optional[Tuple[int, List[LogEntry]]]:
+        return await self._run_in_thread(self._read, after)
+
+    async def snapshot(self) -> Tuple[int, List[TimerRow]]:
+        return await self._run_in_thread(self._snapshot)
+
+
+def create_backend(spec: str) -> CoordinationBackend:
+    """Бэкенд по строке вида 'sqlite:путь/к/базе.db'"""
+    kind, _, target = spec.partition(':')
+    if kind == 'sqlite' and target:
+        return SQLiteCoordination(target)
+    raise ValueError(f"Неизвестный бэкенд координации: {spec!r}")
+
+
+class ReplicatedTimerStore:
+    """
+    Хранилище таймеров лидера поверх журнала координации
+
+    Повторяет интерфейс TimerStore: put() и delete() копят изменения в
+    памяти, фоновая задача пишет их в журнал одной пачкой раз в
+    commit_interval. Пока epoch не задана (реплика в резерве), изменения
+    отбрасываются: таймерами владеет лидер.
+    """
+
+    def __init__(self, backend: CoordinationBackend, commit_interval: float = 0.05):
+        self._backend = backend
+        self._commit_interval = commit_interval
+        self._pending: Dict[Tuple[Tuple[int, int], str], Optional[TimerRow]] = {}
+        self._dirty = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.epoch: Optional[int] = None
+
+    async def open(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def load(self) -> List[TimerRow]:
+        return (await self._backend.snapshot())[1]
+
+    def put(self, record: TimerRecord) -> None:
+        if self.epoch is not None:
+            self._pending[(record.key, record.name)] = record_to_row(record)
+            self._dirty.set()
+
+    def delete(self, record: TimerRecord) -> None:
+        if self.epoch is not None:
+            self._pending[(record.key, record.name)] = None
+            self._dirty.set()
+
+    def discard(self) -> None:
+        """Реплика больше не лидер: несохраненные изменения уже не ее"""
+        self.epoch = None
+        self._pending.clear()
+
+    async def flush(self) -> None:
+        if not self._pending or self.epoch is None:
+            return
+        batch, self._pending = self._pending, {}
+        entries = [(key[0], key[1], name, row) for (key, name), row in batch.items()]
+        try:
+            if not await self._backend.append(self.epoch, entries):
+                logger.warning("Журнал отверг %s изменений: аренда лидера уже у другой реплики", len(entries))
+        except Exception as e:
+            logger.error("Ошибка записи %s изменений в журнал таймеров: %s", len(entries), e, exc_info=True)
+            for key, row in batch.items():
+                self._pending.setdefault(key, row)
+            self._dirty.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._dirty.wait()
+            await asyncio.sleep(self._commit_interval)
+            self._dirty.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+class LeaderElector:
+    """
+    Цикл аренды реплики
+
+    В резерве раз в ttl/4 пытается взять аренду и дочитывает журнал в
+    теплую копию таймеров. При избрании дочитывает журнал до конца и
+    вызывает on_elected(epoch, rows); при потере аренды - on_deposed(),
+    после чего копия заново собирается из снимка.
+    """
+
+    def __init__(
+        self,
+        backend: CoordinationBackend,
+        holder: str,
+        ttl: float,
+        on_elected: Callable[[int, List[TimerRow]], Awaitable[None]],
+        on_deposed: Callable[[], Awaitable[None]],
+    ):
+        self._backend = backend
+        self._holder = holder
+        self._ttl = ttl
+        self._interval = ttl / 4
+        self._on_elected = on_elected
+        self._on_deposed = on_deposed
+        self._warm: Dict[Tuple[int, int, str], TimerRow] = {}
+        # None - теплой копии нет, читать снимок
+        self._seq: Optional[int] = None
+        self._epoch: Optional[int] = None
+        # До какого момента (time.monotonic) аренда гарантированно наша
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._epoch is not None
+
+    async def _sync(self) -> None:
+        """Дочитывает журнал в теплую копию"""
+        changes = await self._backend.read(self._seq) if self._seq is not None else None
+        if changes is None:
+            seq, rows = await self._backend.snapshot()
+            self._warm = {(row[0], row[1], row[2]): row for row in rows}
+            self._seq = seq
+            return
+        self._seq, entries = changes
+        for key_chat_id, key_user_id, name, row in entries:
+            if row is None:
+                self._warm.pop((key_chat_id, key_user_id, name), None)
+            else:
+                self._warm[(key_chat_id, key_user_id, name)] = row
+
+    async def _step(self) -> None:
+        started = time.monotonic()
+        if self.is_leader:
+            # Продление не должно пережить аренду: иначе слагаем полномочия сами
+            try:
+                epoch = await asyncio.wait_for(
+                    self._backend.try_acquire(self._holder, self._ttl), max(0.0, self._valid_until - started)
+                )
+            except Exception as e:
+                logger.warning("Не удалось продлить аренду лидера: %s", e)
+                epoch = None
+            if epoch == self._epoch:
+                self._valid_until = started + self._ttl - self._interval
+                return
+            if epoch is None and time.monotonic() < self._valid_until:
+                return
+            logger.warning("Аренда лидера потеряна, реплика уходит в резерв")
+            self._epoch = None
+            HA_LEADER.set(0)
+            await self._on_deposed()
+            self._seq = None
+            return
+
+        await self._sync()
+        epoch = await self._backend.try_acquire(self._holder, self._ttl)
+        if epoch is None:
+            return
+        self._valid_until = started + self._ttl - self._interval
+        # Бывший лидер мог успеть дописать журнал между чтением и избранием
+        await self._sync()
+        self._epoch = epoch
+        HA_LEADER.set(1)
+        HA_ELECTIONS.inc()
+        rows = list(self._warm.values())
+        self._warm = {}
+        logger.info("Реплика %s избрана лидером (эпоха %s), таймеров: %s", self._holder, epoch, len(rows))
+        await self._on_elected(epoch, rows)
+
+    async def _run(self) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self._step()
+            except Exception as e:
+                logger.error("Ошибка цикла аренды: %s", e, exc_info=True)
+            await asyncio.sleep(max(0.0, started + self._interval - time.monotonic()))
+
+    def start(self) -> None:
+        HA_LEADER.set(0)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает цикл и отпускает аренду, если она наша: резерв заберет ее без ожидания ttl"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._epoch is not None:
+            self._epoch = None
+            HA_LEADER.set(0)
+            try:
+                await self._backend.release(self._holder)
+            except Exception as e:
+                logger.warning("Не удалось отпустить аренду лидера: %s", e)
@@ -0,0 +1,285 @@
+"""
+Правки inline-сообщений и живой обратный отсчет
+
+Обработчики не редактируют сообщение сами, а сообщают MessageEditor,
+какой текст должен быть в сообщении. На каждое сообщение хранится
+одна запись (слот) с последним желаемым состоянием:
+- правка с тем же текстом, что уже в сообщении, не отправляется
+  (Telegram все равно ответил бы "message is not modified");
+- частые нажатия на одно сообщение сливаются: уходит только последний
+  текст, не чаще раза в интервал чата;
+- отсчет таймера обновляется шагами, которые уменьшаются к концу:
+  раз в минуту для долгих таймеров, раз в секунду в последние секунды.
+  Показывается оставшееся время, округленное вверх до шага, поэтому
+  между обновлениями текст не отстает от действительности.
+
+Все правки проходят через общую корзину токенов, поэтому частота
+правок ограничена rate независимо от числа видимых отсчетов: при
+нехватке бюджета обновления откладываются, а не копятся.
+"""
+
+import asyncio
+import heapq
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardMarkup
+
+from metrics import MESSAGE_EDITS
+from sender import TokenBucket
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Шаг обновления отсчета: (оставшееся время не больше, шаг), секунды
+COUNTDOWN_STEPS = ((10, 1), (60, 5), (600, 15))
+COUNTDOWN_LONG_STEP = 60
+
+# Сколько раз повторять правку при временной ошибке
+MAX_EDIT_ATTEMPTS = 3
+
+
+def refresh_step(remaining: float) -> int:
+    """Шаг обновления отсчета для оставшегося времени"""
+    for limit, step in COUNTDOWN_STEPS:
+        if remaining <= limit:
+            return step
+    return COUNTDOWN_LONG_STEP
+
+
+class EditSlot:
+    """Желаемое состояние одного inline-сообщения"""
+
+    __slots__ = ('chat_id', 'message_id', 'text', 'record', 'sent', 'ready_at', 'due', 'in_flight', 'attempts')
+
+    def __init__(self, chat_id: int, message_id: int, sent: Optional[str]):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        # Текст, который надо поставить, или отсчет таймера record (одно из двух)
+        self.text: Optional[str] = None
+        self.record: Optional[TimerRecord] = None
+        # Текст, который сейчас в сообщении (None - неизвестно)
+        self.sent = sent
+        # Раньше этого времени сообщение не редактируется (лимит чата)
+        self.ready_at = 0.0
+        # Время, на которое слот стоит в куче (None - не стоит)
+        self.due: Optional[float] = None
+        self.in_flight = False
+        self.attempts = 0
+
+
+class MessageEditor:
+    """
+    Объединение правок inline-сообщений и живой отсчет таймеров
+
+    render(record, remaining) - текст сообщения с отсчетом: remaining -
+    показываемое оставшееся время, 0 - таймер сработал, None - отменен.
+    is_active(record) - таймер еще активен.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        reply_markup: InlineKeyboardMarkup,
+        render: Callable[[TimerRecord, Optional[int]], str],
+        is_active: Callable[[TimerRecord], bool],
+        rate: float = 5.0,
+        chat_interval: float = 1.0,
+        group_interval: float = 3.0,
+    ):
+        self._bot = bot
+        self._markup = reply_markup
+        self._render = render
+        self._is_active = is_active
+        self._bucket = TokenBucket(rate, max(1.0, rate))
+        self._chat_interval = chat_interval
+        self._group_interval = group_interval
+
+        self._slots: Dict[Tuple[int, int], EditSlot] = {}
+        # Куча (время, порядковый номер, ключ слота); записи с устаревшим временем пропускаются
+        self._heap: List[Tuple[float, int, Tuple[int, int]]] = []
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._edits: set = set()
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _slot(self, chat_id: int, message_id: int, current_text: Optional[str]) -> EditSlot:
+        key = (chat_id, message_id)
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = EditSlot(chat_id, message_id, current_text)
+        elif slot.text is not None or slot.record is not None:
+            MESSAGE_EDITS.labels('merged').inc()
+        return slot
+
+    def _schedule(self, slot: EditSlot, at: float) -> None:
+        self._seq += 1
+        slot.due = at
+        heapq.heappush(self._heap, (at, self._seq, (slot.chat_id, slot.message_id)))
+        self._wakeup.set()
+
+    def _request(self, slot: EditSlot) -> None:
+        if slot.due is None and not slot.in_flight:
+            self._schedule(slot, max(time.monotonic(), slot.ready_at))
+
+    def edit(self, chat_id: int, message_id: int, text: str, current_text: Optional[str] = None) -> None:
+        """
+        Ставит в сообщение текст и основную клавиатуру; отсчет в сообщении прекращается
+        current_text - текст сообщения, если он известен из обновления
+        """
+        slot = self._slot(chat_id, message_id, current_text)
+        slot.text = text
+        slot.record = None
+        slot.attempts = 0
+        self._request(slot)
+
+    def countdown(self, record: TimerRecord, current_text: Optional[str] = None) -> None:
+        """Показывает в сообщении record.message_id живой отсчет таймера"""
+        slot = self._slot(record.chat_id, record.message_id, current_text)
+        slot.text = None
+        slot.record = record
+        slot.attempts = 0
+        self._request(slot)
+
+    def forget(self, records: Iterable[TimerRecord]) -> None:
+        """
+        Прекращает отсчет таймеров, которые больше не живут в этом процессе
+        Сообщения не правятся: "Таймер отменён" в них показывать нельзя.
+        """
+        for record in records:
+            key = (record.chat_id, record.message_id)
+            slot = self._slots.get(key)
+            if slot is None or slot.record is not record:
+                continue
+            slot.record = None
+            # Слот с правкой в полете уберет _settle; запись в куче без слота пропускается
+            if slot.text is None and not slot.in_flight:
+                del self._slots[key]
+
+    def _next_text(self, slot: EditSlot, now: float) -> Tuple[Optional[str], Optional[float]]:
+        """Текст для отправки и время следующего обновления отсчета (None - отсчет окончен)"""
+        if slot.text is not None:
+            text, slot.text = slot.text, None
+            return text, None
+
+        record = slot.record
+        remaining = record.deadline - now
+        if remaining <= 0 or not self._is_active(record):
+            slot.record = None
+            return self._render(record, 0 if remaining <= 0 else None), None
+
+        step = refresh_step(remaining)
+        shown = math.ceil(remaining / step) * step
+        # Следующее обновление - когда показанное значение уменьшится на шаг
+        return self._render(record, shown), max(record.deadline - (shown - step), now + 0.05)
+
+    def _flush(self, slot: EditSlot, now: float) -> None:
+        if slot.in_flight:
+            return
+        delay = max(slot.ready_at - now, self._bucket.delay(now))
+        if delay > 0:
+            self._schedule(slot, now + delay)
+            return
+
+        text, refresh_at = self._next_text(slot, now)
+        if text == slot.sent:
+            MESSAGE_EDITS.labels('skipped').inc()
+            self._settle(slot, refresh_at)
+            return
+
+        self._bucket.take()
+        slot.in_flight = True
+        slot.ready_at = now + (self._group_interval if slot.chat_id < 0 else self._chat_interval)
+        task = asyncio.create_task(self._edit(slot, text, refresh_at))
+        self._edits.add(task)
+        task.add_done_callback(self._edits.discard)
+
+    def _settle(self, slot: EditSlot, refresh_at: Optional[float]) -> None:
+        """Ставит слот на следующее обновление или забывает его"""
+        if slot.due is not None or slot.in_flight:
+            return
+        if slot.text is not None:
+            self._schedule(slot, max(time.monotonic(), slot.ready_at))
+        elif slot.record is not None:
+            self._schedule(slot, max(refresh_at or time.monotonic(), slot.ready_at))
+        else:
+            self._slots.pop((slot.chat_id, slot.message_id), None)
+
+    async def _edit(self, slot: EditSlot, text: str, refresh_at: Optional[float]) -> None:
+        try:
+            await self._bot.edit_message_text(
+                text=text, chat_id=slot.chat_id, message_id=slot.message_id, reply_markup=self._markup
+            )
+            slot.sent = text
+            slot.attempts = 0
+            MESSAGE_EDITS.labels('sent').inc()
+        except TelegramRetryAfter as e:
+            slot.ready_at = time.monotonic() + e.retry_after
+            self._retry(slot, text)
+        except TelegramBadRequest as e:
+            if 'not modified' in str(e):
+                slot.sent = text
+                MESSAGE_EDITS.labels('skipped').inc()
+            else:
+                # Сообщение удалено или слишком старое - больше его не трогаем
+                logger.warning("Правка сообщения %s в чате %s отброшена: %s", slot.message_id, slot.chat_id, e)
+                MESSAGE_EDITS.labels('failed').inc()
+                slot.text = None
+                slot.record = None
+        except Exception as e:
+            logger.warning("Ошибка правки сообщения %s в чате %s: %s", slot.message_id, slot.chat_id, e)
+            self._retry(slot, text)
+        finally:
+            slot.in_flight = False
+            self._settle(slot, refresh_at)
+
+    def _retry(self, slot: EditSlot, text: str) -> None:
+        slot.sent = None
+        slot.attempts += 1
+        if slot.attempts >= MAX_EDIT_ATTEMPTS:
+            MESSAGE_EDITS.labels('failed').inc()
+            slot.text = None
+            slot.record = None
+        elif slot.text is None and slot.record is None:
+            # Новых правок не было - повторяем эту
+            slot.text = text
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            while self._heap and self._heap[0][0] <= now:
+                at, _, key = heapq.heappop(self._heap)
+                slot = self._slots.get(key)
+                # Запись устарела: слот забыт или перенесен на другое время
+                if slot is None or slot.due != at:
+                    continue
+                slot.due = None
+                try:
+                    self._flush(slot, now)
+                except Exception as e:
+                    logger.error("Ошибка обновления сообщения %s: %s", key, e, exc_info=True)
+
+            delay = self._heap[0][0] - now if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Останавливает обновления; отложенные правки не отправляются"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, *self._edits, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,179 @@
+"""
+Передача работы между экземплярами бота без простоя
+
+Работающий экземпляр слушает unix-сокет HANDOFF_SOCKET. Новый экземпляр
+при старте подключается к нему и забирает работу:
+1. старый перестает принимать обновления, дожидается обработчиков уже
+   принятых, подтверждает их в Telegram, останавливает планировщик и
+   сбрасывает хранилище;
+2. старый отправляет снимок живых таймеров пачками строк хранилища;
+3. новый поднимает таймеры, запускает планировщик и отвечает ready -
+   с этого момента таймеры срабатывают только в новом экземпляре;
+4. старый дописывает очередь уведомлений (не дольше DRAIN_TIMEOUT) и
+   завершается, новый начинает принимать обновления.
+
+Между остановкой планировщика в старом и запуском в новом проходят
+миллисекунды, а созревшие за это время таймеры срабатывают на первом
+тике нового: таймеры не теряются и не срабатывают дважды. Если новый
+не ответил ready, старый возвращается к работе. Если сокета нет или
+на нем никто не отвечает - обычный старт из хранилища. Если же старый
+экземпляр принял соединение, а снимок не дошел, новый не запускается
+(HandoffError): старый уже вернулся к работе или вернется по таймауту.
+
+Протокол - построчный JSON, как у шардирования:
+    новый -> старый: {"op": "takeover"}
+    старый -> новый: {"op": "timers", "rows": [...]} ... {"op": "end"}
+    новый -> старый: {"op": "ready"}
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from protocol import LINE_LIMIT, encode
+from storage import TimerRow
+
+logger = logging.getLogger(__name__)
+
+# Строк хранилища в одном сообщении снимка
+SNAPSHOT_CHUNK = 1000
+
+
+class HandoffError(Exception):
+    """Работающий экземпляр есть, но работу не отдал: запускаться рядом с ним нельзя"""
+
+
+class HandoffServer:
+    """
+    Сторона работающего экземпляра
+
+    on_takeover() останавливает прием и планировщик и возвращает строки
+    живых таймеров; on_finished(ok) вызывается после ответа нового
+    экземпляра: ok=False - передача не удалась, работа продолжается здесь.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        on_takeover: Callable[[], Awaitable[List[TimerRow]]],
+        on_finished: Callable[[bool], None],
+        ready_timeout: float = 30.0,
+    ):
+        self._socket_path = socket_path
+        self._on_takeover = on_takeover
+        self._on_finished = on_finished
+        self._ready_timeout = ready_timeout
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._inode: Optional[int] = None
+        self._busy = False
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        if self._busy:
+            logger.warning("Повторный запрос передачи работы отклонен: передача уже идет")
+            writer.close()
+            return
+        self._busy = True
+        taken = False
+        ok = False
+        try:
+            request = json.loads(await reader.readline() or b'{}')
+            if request.get('op') != 'takeover':
+                return
+            logger.info("Новый экземпляр забирает работу")
+            taken = True
+            rows = await self._on_takeover()
+            for start in range(0, len(rows), SNAPSHOT_CHUNK):
+                writer.write(encode({'op': 'timers', 'rows': rows[start:start + SNAPSHOT_CHUNK]}))
+                await writer.drain()
+            writer.write(encode({'op': 'end'}))
+            await writer.drain()
+
+            reply = json.loads(await asyncio.wait_for(reader.readline(), self._ready_timeout) or b'{}')
+            ok = reply.get('op') == 'ready'
+            logger.info("Передано таймеров: %s, новый экземпляр %s", len(rows), "готов" if ok else "не ответил")
+        except (ConnectionError, ValueError, asyncio.TimeoutError) as e:
+            logger.error("Передача работы не удалась: %s", e)
+        finally:
+            writer.close()
+            self._busy = False
+            if taken:
+                self._on_finished(ok)
+
+    async def start(self) -> None:
+        # Сокет мог остаться от старого экземпляра, который еще дописывает уведомления
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+        self._server = await asyncio.start_unix_server(self._on_connect, self._socket_path, limit=LINE_LIMIT)
+        self._inode = os.stat(self._socket_path).st_ino
+
+    async def stop(self) -> None:
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        # Путь мог уже занять новый экземпляр - удаляем только свой сокет
+        try:
+            if os.stat(self._socket_path).st_ino == self._inode:
+                os.unlink(self._socket_path)
+        except FileNotFoundError:
+            pass
+
+
+class HandoffClient:
+    """Сторона нового экземпляра: забирает таймеры у работающего"""
+
+    def __init__(self, socket_path: str, timeout: float = 30.0):
+        self._socket_path = socket_path
+        self._timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def take_over(self) -> Optional[List[TimerRow]]:
+        """
+        Строки живых таймеров работающего экземпляра
+        None - работающего экземпляра нет, обычный старт
+        HandoffError - экземпляр есть, но снимок не получен
+        """
+        if not os.path.exists(self._socket_path):
+            return None
+        try:
+            self._reader, self._writer = await asyncio.open_unix_connection(self._socket_path, limit=LINE_LIMIT)
+        except (ConnectionError, FileNotFoundError):
+            # Сокет остался от упавшего экземпляра
+            return None
+
+        rows: List[TimerRow] = []
+        try:
+            self._writer.write(encode({'op': 'takeover'}))
+            await self._writer.drain()
+            while True:
+                line = await asyncio.wait_for(self._reader.readline(), self._timeout)
+                if not line:
+                    raise ConnectionError("соединение закрыто до конца снимка")
+                message: Dict[str, Any] = json.loads(line)
+                if message['op'] == 'end':
+                    return [tuple(row) for row in rows]
+                rows.extend(message['rows'])
+        except (ConnectionError, ValueError, KeyError, asyncio.TimeoutError) as e:
+            self._writer.close()
+            self._writer = None
+            raise HandoffError(f"снимок таймеров не получен: {e!r}") from e
+
+    async def ready(self) -> None:
+        """
+        Таймеры подняты и планировщик запущен: старый экземпляр может завершаться
+        HandoffError - старый не дождался ответа и вернулся к работе
+        """
+        if self._writer is None:
+            return
+        try:
+            if self._reader.at_eof():
+                raise HandoffError("старый экземпляр закрыл соединение, не дождавшись ready")
+            self._writer.write(encode({'op': 'ready'}))
+            await self._writer.drain()
+        finally:
+            self._writer.close()
+            self._writer = None
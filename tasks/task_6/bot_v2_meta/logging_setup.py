@@ -0,0 +1,103 @@
+"""
+Логирование без ввода-вывода в потоке event loop
+
+Обработчики логгеров пишут записи в очередь (QueueHandler), а в файл
+и stdout их выводит отдельный поток (QueueListener). В потоке event loop
+остается только создание LogRecord и queue.put - форматирование строки
+и запись на диск уходят в фоновый поток.
+
+Файл лога ротируется по размеру (LOG_MAX_BYTES) или по времени
+(LOG_ROTATE_WHEN, например 'midnight'). LOG_FORMAT=json включает формат
+"одна JSON-запись на строку" для сборщиков логов.
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну строку JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))
+                    + f'.{int(record.msecs):03d}',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack_info'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _LazyQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler, который не форматирует запись в вызывающем потоке
+
+    Стандартный prepare() форматирует сообщение заранее, чтобы запись
+    можно было передать в другой процесс. Очередь здесь внутрипроцессная,
+    поэтому запись передается как есть, а строку собирает поток-слушатель.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _file_handler(path: str, max_bytes: int, backup_count: int, rotate_when: str) -> logging.Handler:
+    if rotate_when:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=rotate_when, backupCount=backup_count, encoding='utf-8'
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
+
+
+def setup_logging(
+    level: str,
+    path: str,
+    max_bytes: int,
+    backup_count: int,
+    rotate_when: str = '',
+    json_format: bool = False,
+) -> logging.handlers.QueueListener:
+    """
+    Настраивает корневой логгер на очередь и запускает поток-слушатель
+    Возвращает слушателя - его нужно остановить при выходе, чтобы дописать очередь
+    """
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [
+        _file_handler(path, max_bytes, backup_count, rotate_when),
+        logging.StreamHandler(sys.stdout),
+    ]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_LazyQueueHandler(log_queue))
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: Optional[logging.handlers.QueueListener]) -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает поток-слушатель"""
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
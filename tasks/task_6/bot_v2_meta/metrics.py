@@ -0,0 +1,430 @@
+"""
+Метрики бота в формате Prometheus
+
+Счетчики, датчики и гистограммы без внешних зависимостей. Обновление
+метрики - это инкремент поля или bisect по списку границ, поэтому их
+можно держать включенными в продакшене. Дочерние метрики с метками
+создаются один раз и кешируются: на горячем пути стоит держать ссылку
+на дочернюю метрику, а не вызывать labels() каждый раз.
+
+Для отладки есть выборочный профилировщик обработчиков: каждый N-й
+вызов обработчика выполняется под cProfile, статистика копится
+по имени обработчика и отдается на /debug/profile.
+"""
+
+import cProfile
+import io
+import logging
+import pstats
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+
+if TYPE_CHECKING:
+    # aiohttp.web нужен только эндпоинту /metrics и импортируется при его запуске
+    from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы гистограмм задержек по умолчанию, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Границы опозданий относительно срока (срабатывания таймеров, пульс цикла событий)
+DRIFT_BUCKETS = (0.01, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """Общая часть метрик: имя, описание, метки и дочерние метрики"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str):
+        """Дочерняя метрика для набора значений меток (кешируется)"""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class _CounterChild:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.value += amount
+
+    def _samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, values)} {child.value}'
+            for values, child in self._children.items()
+        ]
+
+
+class _GaugeChild:
+    __slots__ = ('value', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.value -= amount
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение вычисляется при каждом чтении метрики"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function is not None else self.value
+
+
+class Gauge(_Metric):
+    """Значение, которое может расти и убывать"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        self._default.set(value)
+
+    def inc(self, amount: float = 1) -> None:
+        self._default.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._default.dec(amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        self._default.set_function(function)
+
+    def _samples(self) -> List[str]:
+        return [
+            f'{self.name}{_format_labels(self.labelnames, values)} {child.get()}'
+            for values, child in self._children.items()
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # Последняя ячейка - значения больше верхней границы (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._default = self.labels()
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._default.observe(value)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for values, child in self._children.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), child.counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound}"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}')
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f'{self.name}_sum{labels} {child.sum}')
+            lines.append(f'{self.name}_count{labels} {child.count}')
+        return lines
+
+
+class Registry:
+    """Набор метрик, отдаваемых на /metrics"""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# --- Метрики бота ---
+
+TIMERS_STARTED = counter('timer_bot_timers_started_total', 'Запущено таймеров', ['source'])
+TIMERS_CANCELLED = counter('timer_bot_timers_cancelled_total', 'Отменено таймеров', ['source'])
+TIMERS_FIRED = counter('timer_bot_timers_fired_total', 'Сработало таймеров', ['source'])
+TIMERS_STALE = counter('timer_bot_timers_stale_total', 'Срабатываний отмененных или замененных таймеров, отброшенных')
+ACTIVE_TIMERS = gauge('timer_bot_active_timers', 'Активных таймеров')
+HANDLER_LATENCY = histogram('timer_bot_handler_seconds', 'Время работы обработчика', ['handler'])
+FIRE_DRIFT = histogram(
+    'timer_bot_fire_drift_seconds',
+    'Опоздание срабатывания таймера относительно дедлайна',
+    buckets=DRIFT_BUCKETS,
+)
+# Те же границы, что у опоздания срабатываний: видно, какая часть опоздания - от цикла событий
+LOOP_LAG_HEARTBEAT = histogram(
+    'timer_bot_loop_lag_heartbeat_seconds', 'Опоздание пульса цикла событий', buckets=DRIFT_BUCKETS
+)
+# Точные перцентили по последним замерам (считаются при чтении /metrics), метка quantile - 0.5, 0.9, 0.99, 1
+LOOP_LAG_QUANTILES = gauge(
+    'timer_bot_loop_lag_quantile_seconds', 'Перцентили опоздания пульса цикла событий за 10 минут', ['quantile']
+)
+FIRE_DRIFT_QUANTILES = gauge(
+    'timer_bot_fire_drift_quantile_seconds', 'Перцентили опоздания последних срабатываний таймеров', ['quantile']
+)
+SLOW_CALLBACKS = counter('timer_bot_slow_callbacks_total', 'Остановок цикла событий дольше SLOW_CALLBACK_THRESHOLD')
+API_LATENCY = histogram('timer_bot_api_seconds', 'Время запроса к Bot API', ['method'])
+API_THROTTLED = counter('timer_bot_api_throttled_total', 'Ответов 429 от Bot API', ['method'])
+OUTBOUND_QUEUED = gauge('timer_bot_outbound_queued', 'Сообщений в очереди отправки')
+OUTBOUND_LAG = histogram('timer_bot_outbound_lag_seconds', 'Время от постановки в очередь до доставки')
+OUTBOUND_COALESCED = counter(
+    'timer_bot_outbound_coalesced_total', 'Уведомлений, дописанных в уже ждущее сообщение чата'
+)
+MESSAGE_EDITS = counter(
+    'timer_bot_message_edits_total', 'Правки inline-сообщений: sent, skipped, merged, failed', ['result']
+)
+UPDATES_SHED = counter(
+    'timer_bot_updates_shed_total', 'Обновлений, отброшенных контролем допуска: user, chat, lag, concurrency', ['reason']
+)
+HANDLERS_IN_FLIGHT = gauge('timer_bot_handlers_in_flight', 'Обработчиков, работающих одновременно')
+LOOP_LAG = gauge('timer_bot_loop_lag_seconds', 'Задержка цикла событий')
+HA_LEADER = gauge('timer_bot_ha_leader', 'Реплика - лидер (1) или в резерве (0)')
+HA_ELECTIONS = counter('timer_bot_ha_elections_total', 'Сколько раз реплика избиралась лидером')
+NOTICE_LATENESS = histogram(
+    'timer_bot_notice_lateness_seconds',
+    'Опоздание доставки уведомления относительно дедлайна таймера',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+# Источник таймера: команда /timer или callback_data inline-кнопки
+SOURCE_COMMAND = 'command'
+SOURCE_CALLBACK = 'callback'
+
+
+# --- Выборочный профилировщик обработчиков ---
+
+class HandlerProfiler:
+    """
+    Профилирует каждый sample_every-й вызов обработчика под cProfile
+
+    cProfile видит все, что выполняется в потоке, пока обработчик ждет
+    await, поэтому статистика - оценка сверху для конкретного обработчика.
+    """
+
+    def __init__(self, sample_every: int):
+        self._sample_every = sample_every
+        self._calls: Dict[str, int] = {}
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._active = False
+
+    def should_sample(self, handler: str) -> bool:
+        calls = self._calls.get(handler, 0) + 1
+        self._calls[handler] = calls
+        # Один профилировщик на поток: вложенные выборки пропускаем
+        return not self._active and calls % self._sample_every == 0
+
+    async def run(self, handler: str, call: Awaitable[Any]) -> Any:
+        profile = cProfile.Profile()
+        self._active = True
+        profile.enable()
+        try:
+            return await call
+        finally:
+            profile.disable()
+            self._active = False
+            stats = self._stats.get(handler)
+            if stats is None:
+                self._stats[handler] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+
+    def report(self, handler: Optional[str] = None, limit: int = 30) -> str:
+        output = io.StringIO()
+        for name, stats in self._stats.items():
+            if handler and name != handler:
+                continue
+            output.write(f'=== {name} ===\n')
+            stats.stream = output
+            stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue() or 'Нет данных профилирования\n'
+
+
+class MetricsMiddleware:
+    """
+    Middleware aiogram: время работы обработчиков и выборочное профилирование
+    Подключается как внутренний middleware, чтобы знать имя обработчика
+    """
+
+    def __init__(self, profiler: Optional[HandlerProfiler] = None):
+        self._profiler = profiler
+        self._histograms: Dict[Any, Any] = {}
+
+    async def __call__(self, handler: Callable, event: Any, data: Dict[str, Any]) -> Any:
+        callback = data['handler'].callback
+        child = self._histograms.get(callback)
+        if child is None:
+            child = self._histograms[callback] = HANDLER_LATENCY.labels(callback.__name__)
+
+        started = time.perf_counter()
+        try:
+            if self._profiler is not None and self._profiler.should_sample(callback.__name__):
+                return await self._profiler.run(callback.__name__, handler(event, data))
+            return await handler(event, data)
+        finally:
+            child.observe(time.perf_counter() - started)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: время запросов к Bot API и ответы 429
+    getUpdates не меряется - это long polling, его время равно таймауту
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Any] = {}
+
+    async def __call__(self, make_request: Callable, bot: Any, method: Any) -> Any:
+        name = method.__api_method__
+        if name == 'getUpdates':
+            return await make_request(bot, method)
+
+        child = self._histograms.get(name)
+        if child is None:
+            child = self._histograms[name] = API_LATENCY.labels(name)
+
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            API_THROTTLED.labels(name).inc()
+            raise
+        finally:
+            child.observe(time.perf_counter() - started)
+
+
+class MetricsServer:
+    """HTTP-эндпоинт /metrics (и /debug/profile, если включен профилировщик)"""
+
+    def __init__(self, registry: Registry = REGISTRY, profiler: Optional[HandlerProfiler] = None):
+        self._registry = registry
+        self._profiler = profiler
+        self._runner: Optional['web.AppRunner'] = None
+
+    async def _metrics(self, request: 'web.Request') -> 'web.Response':
+        from aiohttp import web
+        return web.Response(text=self._registry.render(), content_type='text/plain', charset='utf-8')
+
+    async def _profile(self, request: 'web.Request') -> 'web.Response':
+        from aiohttp import web
+        if self._profiler is None:
+            return web.Response(status=404, text='Профилировщик выключен\n')
+        return web.Response(text=self._profiler.report(request.query.get('handler')))
+
+    async def start(self, host: str, port: int) -> None:
+        from aiohttp import web
+        app = web.Application()
+        app.router.add_get('/metrics', self._metrics)
+        app.router.add_get('/debug/profile', self._profile)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, host, port).start()
+        except OSError:
+            await self._runner.cleanup()
+            self._runner = None
+            raise
+        logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,171 @@
+"""
+Разбор длительностей из команд и callback_data кнопок
+
+Длительность - последовательность "число единица" в порядке убывания
+единиц, каждая не больше одного раза: 10s, 5m, 1h30m, 1d2h, 1.5h, 2,5m.
+Единицы: d - дни, h - часы, m - минуты, s - секунды. Дробная часть -
+до трех знаков, итог округляется до целых секунд.
+
+Частую форму без пробелов и дробей ("5m", "1h30m") разбирает ручной
+сканер за один проход по строке. Все остальное (пробелы, заглавные
+буквы, дроби) - заранее скомпилированная грамматика; длинную строку
+перед ней сжимают (пробелы до одного, числа до MAX_DIGITS + 1 значащих
+цифр), чтобы грамматике не на чем было долго откатываться. int()
+получает не больше MAX_DIGITS значащих цифр: правильно записанная
+длительность с числом длиннее дает OVERSIZED, и бот отвечает, что время
+вне допустимых границ, как и раньше, а не что формат неверен.
+
+Длительности известных кнопок разбираются один раз при старте
+(build_callback_table), нажатие кнопки - поиск в словаре.
+"""
+
+import re
+import sys
+from typing import Dict, Iterable, Optional
+
+# Секунд в единице; единицы в длительности идут в порядке убывания
+UNIT_SECONDS = {'d': 86400, 'h': 3600, 'm': 60, 's': 1}
+
+# Ограничения входа: длиннее не бывает сообщение Telegram
+MAX_INPUT_LENGTH = 4096
+# Строки длиннее сжимаются перед грамматикой
+COMPACT_LENGTH = 64
+# Значащих цифр в числе, которое еще переводится в секунды; дробная часть дальше
+# MAX_FRACTION_DIGITS знаков отбрасывается
+MAX_DIGITS = 6
+MAX_FRACTION_DIGITS = 3
+# Длительность с числом длиннее MAX_DIGITS значащих цифр - больше любой допустимой
+OVERSIZED = sys.maxsize
+
+# Префикс callback_data кнопок запуска таймера
+TIMER_CALLBACK_PREFIX = 'timer_'
+
+# Числа без ограничения длины: по одной единице на группу, поэтому разбор линейный
+_NUMBER = r'(\d+(?:[.,]\d+)?)'
+DURATION_GRAMMAR = re.compile(
+    r'\s*' + ''.join(rf'(?:{_NUMBER}\s*{unit}\s*)?' for unit in UNIT_SECONDS),
+    re.IGNORECASE | re.ASCII,
+)
+
+# Сжатие длинной строки: результат разбора тот же
+_SPACES = re.compile(r'\s{2,}')
+_LONG_DIGITS = re.compile(rf'\d{{{MAX_DIGITS + 2},}}')
+
+# Результат сканера: строку должна разобрать грамматика
+_FALLBACK = -1
+_FRACTION_SCALE = 10 ** MAX_FRACTION_DIGITS
+
+# Таблица сканера: символ -> секунд в единице, для цифры d - отрицательное -(d + 1)
+_SCAN_TABLE = {str(digit): -digit - 1 for digit in range(10)}
+_SCAN_TABLE.update(UNIT_SECONDS)
+
+
+def _scan(text: str) -> Optional[int]:
+    """
+    Разбор частой формы за один проход: цифры и строчная единица без пробелов
+    Возвращает секунды, None для некорректной строки или _FALLBACK
+    """
+    total = 0
+    value = 0
+    digits = 0
+    previous = 0
+    for char in text:
+        unit = _SCAN_TABLE.get(char)
+        if unit is None:
+            return _FALLBACK
+        if unit < 0:
+            digits += 1
+            # Длинное число (или ведущие нули) разбирает грамматика
+            if digits > MAX_DIGITS:
+                return _FALLBACK
+            value = value * 10 - unit - 1
+            continue
+        # Единица без числа или не в порядке убывания
+        if not digits or (previous and unit >= previous):
+            return None
+        total += value * unit
+        previous = unit
+        value = 0
+        digits = 0
+    # Число без единицы в конце
+    if digits or not previous:
+        return None
+    return total
+
+
+def _shorten(match: re.Match) -> str:
+    digits = match.group()
+    start = match.start()
+    # Дробная часть - первые знаки, целая - значащие цифры
+    if start and match.string[start - 1] in '.,':
+        return digits[:MAX_FRACTION_DIGITS]
+    return digits.lstrip('0')[:MAX_DIGITS + 1] or '0'
+
+
+def _compact(text: str) -> str:
+    # Грамматика доходит не дальше четвертого числа, остальные можно не трогать
+    return _LONG_DIGITS.sub(_shorten, _SPACES.sub(' ', text), count=len(UNIT_SECONDS))
+
+
+def _parse_grammar(text: str) -> Optional[int]:
+    match = DURATION_GRAMMAR.fullmatch(text)
+    if match is None:
+        return None
+    scaled = 0
+    for number, unit in zip(match.groups(), UNIT_SECONDS.values()):
+        if number is None:
+            continue
+        whole, _, fraction = number.replace(',', '.').partition('.')
+        whole = whole.lstrip('0')
+        if len(whole) > MAX_DIGITS:
+            return OVERSIZED
+        fraction = fraction[:MAX_FRACTION_DIGITS].ljust(MAX_FRACTION_DIGITS, '0')
+        scaled += (int(whole or '0') * _FRACTION_SCALE + int(fraction)) * unit
+    # Округление до целых секунд (половина - вверх)
+    return (scaled + _FRACTION_SCALE // 2) // _FRACTION_SCALE
+
+
+def parse_duration(text: str) -> Optional[int]:
+    """
+    Длительность в секундах или None, если строка некорректна или дает ноль
+    OVERSIZED - формат верный, но число длиннее MAX_DIGITS значащих цифр
+
+    Поддерживаемые форматы:
+    - Простые: 10s, 30m, 1h, 1d
+    - Комбинированные: 1h30m, 2m30s, 1d2h
+    - Дробные: 1.5h, 2,5m
+    - С пробелами и в любом регистре: 1 H 30 M, 90 s
+    """
+    if not text or len(text) > MAX_INPUT_LENGTH:
+        return None
+    seconds = _scan(text)
+    if seconds == _FALLBACK:
+        seconds = _parse_grammar(_compact(text) if len(text) > COMPACT_LENGTH else text)
+    return seconds or None
+
+
+def build_callback_table(callback_data: Iterable[str]) -> Dict[str, int]:
+    """
+    Длительности кнопок таймеров по их callback_data
+    Набор кнопок фиксирован, поэтому таблица строится один раз при старте
+    """
+    table = {}
+    for data in callback_data:
+        if not data.startswith(TIMER_CALLBACK_PREFIX):
+            continue
+        duration = parse_duration(data[len(TIMER_CALLBACK_PREFIX):])
+        if duration is None:
+            raise ValueError(f"некорректная длительность в callback_data: {data}")
+        table[data] = duration
+    return table
+
+
+def callback_duration(data: str, table: Dict[str, int]) -> Optional[int]:
+    """
+    Длительность кнопки таймера: из таблицы, а для кнопок старых
+    клавиатур, которых уже нет в таблице, - разбором строки
+    """
+    duration = table.get(data)
+    if duration is None and data.startswith(TIMER_CALLBACK_PREFIX):
+        duration = parse_duration(data[len(TIMER_CALLBACK_PREFIX):])
+    return duration
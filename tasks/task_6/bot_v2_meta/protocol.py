@@ -0,0 +1,17 @@
+"""
+Построчный JSON для unix-сокетов
+
+Общий формат сообщений шардирования (фронт и воркеры) и передачи работы
+между экземплярами: одна строка - один JSON-объект. Модуль без
+зависимостей, чтобы передача работы не тянула за собой шардирование.
+"""
+
+import json
+from typing import Any, Dict
+
+# Максимальная длина строки протокола (одно обновление Telegram)
+LINE_LIMIT = 4 * 1024 * 1024
+
+
+def encode(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
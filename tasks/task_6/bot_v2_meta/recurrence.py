@@ -0,0 +1,286 @@
+"""
+Повторяющиеся таймеры
+
+Повторяющийся таймер - это обычная запись в планировщике со следующим
+временем срабатывания. После срабатывания следующее время вычисляется
+заранее и запись планируется снова: отдельной корутины на напоминание нет.
+
+Виды повторения (в хранилище - строка spec):
+- интервал: "every 1500" - каждые 1500 секунд от предыдущего срабатывания;
+- ежедневно: "daily 09:00" - каждый день в 09:00 по Config.TIMEZONE;
+- cron: "cron */15 9-18 * * 1-5" - пять полей: минута, час, день месяца,
+  месяц, день недели (0 и 7 - воскресенье).
+
+Следующие дедлайны считаются пачкой (next_deadlines): календарное
+расписание вычисляется один раз на каждый различный spec, интервалы -
+арифметикой без обращения к календарю. Пропущенные за время простоя
+повторения не присылаются - таймер переносится на ближайшее будущее.
+"""
+
+import asyncio
+import logging
+import math
+import re
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Union
+from zoneinfo import ZoneInfo
+
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Насколько далеко вперед искать срабатывание cron (для выражений вроде 31 февраля)
+CRON_SEARCH_YEARS = 5
+
+DAILY_PATTERN = re.compile(r'daily\s+(?:at\s+)?(\d{1,2}):(\d{2})')
+
+# Поле cron: допустимый диапазон значений
+CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7),
+)
+CRON_DAYS = 31
+CRON_WEEKDAYS = 7
+
+
+class IntervalRecurrence:
+    """Повторение через равные промежутки времени"""
+
+    __slots__ = ('spec', 'interval')
+
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.spec = f'every {interval}'
+
+    def __repr__(self) -> str:
+        return f"IntervalRecurrence({self.interval})"
+
+
+class CronRecurrence:
+    """Повторение по календарю: cron-выражение из пяти полей"""
+
+    __slots__ = ('spec', 'tz', 'minutes', 'hours', 'days', 'months', 'weekdays', 'any_day', 'any_weekday')
+
+    def __init__(self, spec: str, fields: Sequence[str], tz: ZoneInfo):
+        self.spec = spec
+        self.tz = tz
+        minutes, hours, days, months, weekdays = (
+            _parse_cron_field(field, low, high) for field, (_, low, high) in zip(fields, CRON_FIELDS)
+        )
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.days = days
+        self.months = sorted(months)
+        # 7 - тоже воскресенье
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        # Если ограничены и день месяца, и день недели, подходит любой из них.
+        # Поле не ограничено, если покрывает весь диапазон: */2 в дне месяца - ограничение
+        self.any_day = len(days) == CRON_DAYS
+        self.any_weekday = len(self.weekdays) == CRON_WEEKDAYS
+
+    def _day_matches(self, day: datetime) -> bool:
+        day_ok = day.day in self.days
+        # datetime.weekday(): понедельник - 0, в cron понедельник - 1
+        weekday_ok = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_after(self, now: float) -> float:
+        """Ближайшее время срабатывания строго после now (time.time())"""
+        start = datetime.fromtimestamp(now, self.tz).replace(tzinfo=None, second=0, microsecond=0)
+        moment = start + timedelta(minutes=1)
+        last_year = start.year + CRON_SEARCH_YEARS
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                month = _next_value(self.months, moment.month)
+                if month is None:
+                    moment = datetime(moment.year + 1, self.months[0], 1)
+                else:
+                    moment = datetime(moment.year, month, 1)
+                continue
+            if not self._day_matches(moment):
+                moment = datetime(moment.year, moment.month, moment.day) + timedelta(days=1)
+                continue
+            if moment.hour not in self.hours:
+                hour = _next_value(self.hours, moment.hour)
+                if hour is None:
+                    moment = datetime(moment.year, moment.month, moment.day) + timedelta(days=1)
+                else:
+                    moment = moment.replace(hour=hour, minute=0)
+                continue
+            if moment.minute not in self.minutes:
+                minute = _next_value(self.minutes, moment.minute)
+                if minute is None:
+                    moment = moment.replace(minute=0) + timedelta(hours=1)
+                else:
+                    moment = moment.replace(minute=minute)
+                continue
+
+            fire_at = moment.replace(tzinfo=self.tz).timestamp()
+            # Время внутри перевода часов может оказаться в прошлом
+            if fire_at > now:
+                return fire_at
+            moment += timedelta(minutes=1)
+        raise ValueError(f"cron-выражение не срабатывает в ближайшие {CRON_SEARCH_YEARS} лет: {self.spec}")
+
+    def __repr__(self) -> str:
+        return f"CronRecurrence({self.spec!r})"
+
+
+Recurrence = Union[IntervalRecurrence, CronRecurrence]
+
+
+def _next_value(values: List[int], current: int) -> Optional[int]:
+    """Наименьшее значение из отсортированного списка больше current"""
+    for value in values:
+        if value > current:
+            return value
+    return None
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> FrozenSet[int]:
+    """Разбирает поле cron: *, 5, 1-5, */15, 1-30/2 и списки через запятую"""
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"шаг должен быть положительным: {field}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = int(part)
+            # "5/15" - с 5 до конца диапазона с шагом 15
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"значение вне диапазона {low}-{high}: {field}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@lru_cache(maxsize=4096)
+def from_spec(spec: str, timezone: str) -> Recurrence:
+    """
+    Объект повторения по строке из хранилища
+    Кешируется: таймеры с одинаковым расписанием делят один объект
+    """
+    kind, _, rest = spec.partition(' ')
+    if kind == 'every':
+        return IntervalRecurrence(int(rest))
+    tz = ZoneInfo(timezone)
+    if kind == 'daily':
+        hour, minute = rest.split(':')
+        return CronRecurrence(spec, (str(int(minute)), str(int(hour)), '*', '*', '*'), tz)
+    if kind == 'cron':
+        return CronRecurrence(spec, rest.split(), tz)
+    raise ValueError(f"неизвестный вид повторения: {spec}")
+
+
+def parse_calendar(text: str, timezone: str) -> Optional[CronRecurrence]:
+    """
+    Разбирает календарное расписание от пользователя:
+    "daily 09:00", "daily at 09:00" или "cron m h dom mon dow"
+    Возвращает None, если текст не является корректным расписанием
+    """
+    text = ' '.join(text.lower().split())
+    match = DAILY_PATTERN.fullmatch(text)
+    if match:
+        hour, minute = int(match.group(1)), int(match.group(2))
+        if hour > 23 or minute > 59:
+            return None
+        spec = f'daily {hour:02d}:{minute:02d}'
+    elif text.startswith('cron '):
+        fields = text[5:].split()
+        if len(fields) != 5:
+            return None
+        spec = 'cron ' + ' '.join(fields)
+    else:
+        return None
+
+    try:
+        recurrence = from_spec(spec, timezone)
+        # Выражение должно хотя бы раз сработать
+        recurrence.next_after(time.time())
+    except ValueError:
+        return None
+    return recurrence
+
+
+def next_deadlines(records: Sequence[TimerRecord], now: float, now_monotonic: float) -> List[float]:
+    """
+    Следующие дедлайны (по monotonic) повторяющихся таймеров, пачкой
+
+    Интервальный таймер с дедлайном в будущем остается на месте, иначе
+    переносится на ближайшее кратное интервалу время после now_monotonic.
+    Календарный таймер получает ближайшее срабатывание после now; оно
+    считается один раз на каждое различное расписание.
+    """
+    calendar: Dict[str, float] = {}
+    deadlines = []
+    for record in records:
+        recurrence = record.recurrence
+        if type(recurrence) is IntervalRecurrence:
+            deadline = record.deadline
+            if deadline <= now_monotonic:
+                interval = recurrence.interval
+                deadline += (math.floor((now_monotonic - deadline) / interval) + 1) * interval
+            deadlines.append(deadline)
+        else:
+            fire_at = calendar.get(recurrence.spec)
+            if fire_at is None:
+                fire_at = calendar[recurrence.spec] = recurrence.next_after(now)
+            deadlines.append(now_monotonic + (fire_at - now))
+    return deadlines
+
+
+class ClockWatcher:
+    """
+    Следит за переводом настенных часов
+
+    Раз в interval секунд сравнивает смещение time.time() относительно
+    time.monotonic() и при скачке больше threshold вызывает on_jump(сдвиг).
+    """
+
+    def __init__(self, on_jump: Callable[[float], None], interval: float = 10.0, threshold: float = 1.0):
+        self._on_jump = on_jump
+        self._interval = interval
+        self._threshold = threshold
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        offset = time.time() - time.monotonic()
+        while True:
+            await asyncio.sleep(self._interval)
+            current = time.time() - time.monotonic()
+            shift = current - offset
+            if abs(shift) > self._threshold:
+                offset = current
+                logger.warning("Настенные часы сдвинулись на %.1f с", shift)
+                try:
+                    self._on_jump(shift)
+                except Exception as e:
+                    logger.error("Ошибка при переносе таймеров после сдвига часов: %s", e, exc_info=True)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
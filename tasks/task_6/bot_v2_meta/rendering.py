@@ -0,0 +1,167 @@
+"""
+Тексты ответов и клавиатура
+
+Неизменные ответы (клавиатура, приветствие, справка) собираются один
+раз и дальше отдаются готовыми объектами: aiogram только сериализует
+разметку при отправке и не меняет ее, поэтому один объект можно
+передавать во все ответы.
+
+Описание длительности по-русски ("1 час 30 минут") складывается из
+заранее построенных таблиц частей для часов, минут и секунд, а готовые
+строки запоминаются: кнопки и частые команды дают небольшой набор
+длительностей.
+"""
+
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+# Кнопки запуска таймера: (текст, callback_data), по две в ряд
+TIMER_BUTTONS = (
+    ("⏱️ 30 сек", "timer_30s"),
+    ("⏱️ 1 мин", "timer_1m"),
+    ("⏱️ 5 мин", "timer_5m"),
+    ("⏱️ 10 мин", "timer_10m"),
+    ("⏱️ 30 мин", "timer_30m"),
+    ("⏱️ 1 час", "timer_1h"),
+)
+
+# Формы слова для 1, 2 и 5 (винительный падеж: "на 1 минуту")
+HOUR_FORMS = ("час", "часа", "часов")
+MINUTE_FORMS = ("минуту", "минуты", "минут")
+SECOND_FORMS = ("секунду", "секунды", "секунд")
+
+WELCOME_TEXT = """
+🕒 Добро пожаловать в бота-таймер!
+
+Этот бот поможет вам управлять таймерами в Telegram.
+
+Используйте кнопки ниже для быстрого запуска таймеров или команды:
+• /timer [имя] время - Запустить таймер
+• /every [имя] расписание - Повторяющееся напоминание
+• /cancel [имя] - Отменить таймер (без имени - все)
+• /status - Показать активные таймеры
+• /help - Подробная справка
+
+Выберите время таймера или используйте команды! 🚀
+"""
+
+# Готовые ответы на отброшенные обновления (admission)
+RATE_LIMITED_TEXT = "⏳ Слишком много запросов. Подождите несколько секунд."
+OVERLOADED_TEXT = "⏳ Бот сейчас перегружен. Попробуйте через минуту."
+
+HELP_TEMPLATE = """
+🕒 Команды бота:
+
+/start - Начать работу с ботом
+/timer [имя] время - Запустить таймер
+/every [имя] расписание - Повторяющееся напоминание
+/cancel [имя] - Отменить таймер (без имени - все)
+/status - Показать активные таймеры
+/help - Показать эту справку
+
+Примеры использования:
+/timer 30s - таймер на 30 секунд
+/timer 5m - таймер на 5 минут
+/timer 1h - таймер на 1 час
+/timer 1h30m - таймер на 1 час 30 минут
+/timer 2m30s - таймер на 2 минуты 30 секунд
+/timer tea 5m - таймер «tea» на 5 минут, работает параллельно с другими
+/every water 25m - напоминание каждые 25 минут
+/every daily 09:00 - напоминание каждый день в 09:00
+/every cron */15 9-18 * * 1-5 - cron: минута, час, день, месяц, день недели
+
+Форматы времени:
+• s - секунды (10s)
+• m - минуты (5m)
+• h - часы (2h)
+• d - дни (1d)
+• Комбинации: 1h30m, 2m30s, 1h15m20s
+• Дробные значения: 1.5h, 2,5m
+• Пробелы и регистр игнорируются: 1 H 30 M
+
+Ограничения:
+• Минимум: 1 секунда
+• Максимум: 24 часа (86400 секунд)
+• До {max_timers} таймеров на пользователя
+• Таймер с тем же именем заменяет предыдущий
+
+💾 Таймеры сохраняются и продолжают работать после перезапуска бота
+"""
+
+
+def plural(number: int, forms: Tuple[str, str, str]) -> str:
+    """Форма слова для числа: plural(21, MINUTE_FORMS) -> "минуту" """
+    if number % 10 == 1 and number % 100 != 11:
+        return forms[0]
+    if 2 <= number % 10 <= 4 and not 12 <= number % 100 <= 14:
+        return forms[1]
+    return forms[2]
+
+
+def _parts(limit: int, forms: Tuple[str, str, str]) -> Tuple[str, ...]:
+    """Таблица частей описания "N слово" для 0..limit-1 (для нуля - пустая строка)"""
+    return ('',) + tuple(f"{number} {plural(number, forms)}" for number in range(1, limit))
+
+
+# Часы - до суток включительно (Config.MAX_DURATION)
+_HOUR_PARTS = _parts(25, HOUR_FORMS)
+_MINUTE_PARTS = _parts(60, MINUTE_FORMS)
+_SECOND_PARTS = _parts(60, SECOND_FORMS)
+
+
+def format_duration(seconds: int) -> str:
+    """Форматирует количество секунд в читаемый формат"""
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+@lru_cache(maxsize=4096)
+def format_time_description(seconds: int) -> str:
+    """Форматирует время в описание на русском языке"""
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours < len(_HOUR_PARTS):
+        hour_part = _HOUR_PARTS[hours]
+    else:
+        hour_part = f"{hours} {plural(hours, HOUR_FORMS)}"
+    return " ".join(part for part in (hour_part, _MINUTE_PARTS[minutes], _SECOND_PARTS[secs]) if part)
+
+
+def countdown_text(duration: int, remaining: Optional[int]) -> str:
+    """
+    Текст inline-сообщения с живым отсчетом таймера на duration секунд
+    remaining - показываемое оставшееся время, 0 - время вышло, None - таймер отменен
+    """
+    header = f"👉 Таймер на {format_time_description(duration)} запущен!"
+    if remaining is None:
+        return f"{header}\n🛑 Таймер отменён."
+    if remaining == 0:
+        return f"{header}\n⏰ Время вышло!"
+    return f"{header}\n⏱️ Осталось: {format_duration(remaining)}"
+
+
+@lru_cache(maxsize=None)
+def main_keyboard() -> InlineKeyboardMarkup:
+    """Основная клавиатура с кнопками для управления таймерами (один объект на процесс)"""
+    timer_rows = [
+        [InlineKeyboardButton(text=text, callback_data=data) for text, data in TIMER_BUTTONS[i:i + 2]]
+        for i in range(0, len(TIMER_BUTTONS), 2)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=timer_rows + [
+        [
+            InlineKeyboardButton(text="🛑 Отменить", callback_data="cancel_timer"),
+            InlineKeyboardButton(text="📊 Статус", callback_data="status_timer"),
+        ],
+        [
+            InlineKeyboardButton(text="❓ Помощь", callback_data="help_info"),
+        ]
+    ])
+
+
+@lru_cache(maxsize=None)
+def help_text(max_timers: int) -> str:
+    """Текст справки для /help и кнопки «Помощь»"""
+    return HELP_TEMPLATE.format(max_timers=max_timers)
@@ -0,0 +1,266 @@
+"""
+Цикл событий бота и наблюдение за ним
+
+Опоздание "Время вышло!" складывается из трех частей: планировщик
+проснулся позже дедлайна, цикл событий был занят чужим кодом или
+медленно ответил Telegram. Этот модуль отвечает за вторую часть:
+- run() запускает main() на стандартном цикле asyncio или на uvloop
+  (EVENT_LOOP=uvloop, пакет ставится отдельно). Цикл задается явно:
+  aiogram при импорте сам включает uvloop, если пакет установлен;
+- LoopLagMonitor - пульс раз в interval секунд: насколько позже
+  положенного проснулся цикл. Текущая оценка идет в контроль допуска,
+  каждый пульс - в гистограмму timer_bot_loop_lag_heartbeat_seconds,
+  а точные перцентили за последние минуты - рядом с перцентилями
+  опоздания срабатываний: в /metrics (timer_bot_loop_lag_quantile_seconds
+  и timer_bot_fire_drift_quantile_seconds) и раз в report_interval в лог;
+- SlowCallbackWatchdog - поток, который замечает, что пульс не пришел
+  вовремя, и пишет в лог стек цикла в этот момент: видно, какой код
+  держит цикл. В отличие от отладочного режима asyncio
+  (slow_callback_duration) работает и с uvloop и ничего не стоит, пока
+  цикл успевает.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Callable, Coroutine, Deque, Dict, Optional, Sequence
+
+from metrics import FIRE_DRIFT_QUANTILES, LOOP_LAG, LOOP_LAG_HEARTBEAT, LOOP_LAG_QUANTILES, SLOW_CALLBACKS, Gauge
+
+logger = logging.getLogger(__name__)
+
+LOOP_ASYNCIO = 'asyncio'
+LOOP_UVLOOP = 'uvloop'
+
+# Перцентили в отчетах
+REPORT_QUANTILES = (50, 90, 99, 100)
+# Кадры самого цикла событий в стеке медленного колбэка не нужны
+ASYNCIO_DIR = os.path.dirname(asyncio.__file__)
+
+
+def loop_factory(name: str) -> Callable[[], asyncio.AbstractEventLoop]:
+    """Фабрика цикла событий по имени; без uvloop - стандартный цикл asyncio"""
+    if name == LOOP_UVLOOP:
+        try:
+            import uvloop
+            return uvloop.new_event_loop
+        except ImportError:
+            logger.warning("uvloop не установлен (pip install uvloop), используется asyncio")
+    elif name != LOOP_ASYNCIO:
+        logger.warning("Неизвестный цикл событий %r, используется asyncio", name)
+    # Стандартный цикл платформы: Proactor в Windows, selector в остальных
+    return getattr(asyncio, 'ProactorEventLoop', asyncio.SelectorEventLoop)
+
+
+def run(main: Coroutine, name: str = LOOP_ASYNCIO) -> None:
+    """asyncio.run(main) на цикле событий name"""
+    factory = loop_factory(name)
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=factory) as runner:
+            runner.run(main)
+        return
+
+    # До Python 3.11 asyncio.run берет цикл у политики
+    class Policy(asyncio.DefaultEventLoopPolicy):
+        def new_event_loop(self):
+            return factory()
+
+    asyncio.set_event_loop_policy(Policy())
+    asyncio.run(main)
+
+
+def loop_name(loop: asyncio.AbstractEventLoop) -> str:
+    """Имя цикла для логов: uvloop или asyncio"""
+    return LOOP_UVLOOP if type(loop).__module__.startswith('uvloop') else LOOP_ASYNCIO
+
+
+class LatencyWindow:
+    """
+    Последние size замеров (секунды) и их перцентили
+
+    Хранит отсчеты, а не границы гистограммы: перцентили точные, а не
+    с точностью до ячейки.
+    """
+
+    def __init__(self, size: int = 6000):
+        self._values: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def add(self, value: float) -> None:
+        self._values.append(value)
+
+    def expose(self, metric: Gauge) -> None:
+        """Перцентили окна в метрике с меткой quantile (0.5, 0.9, 0.99, 1)"""
+        for q in REPORT_QUANTILES:
+            metric.labels(f'{q / 100:g}').set_function(lambda q=q: self.percentiles((q,)).get(q, 0.0))
+
+    def percentiles(self, quantiles: Sequence[float] = REPORT_QUANTILES) -> Dict[float, float]:
+        """Перцентиль q (0..100) -> значение, пусто без замеров"""
+        if not self._values:
+            return {}
+        ordered = sorted(self._values)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, max(0, int(round(q / 100 * last))))] for q in quantiles}
+
+    def describe(self) -> str:
+        """Строка p50=... p90=... p99=... max=... в миллисекундах"""
+        values = self.percentiles()
+        if not values:
+            return 'нет данных'
+        return ' '.join(
+            f"{'max' if q == 100 else f'p{q:g}'}={value * 1000:.1f}" for q, value in values.items()
+        )
+
+
+class LoopLagMonitor:
+    """
+    Задержка цикла событий
+
+    Раз в interval секунд засыпает на interval и меряет, насколько позже
+    проснулся. Пока пульс не пришел вовремя, текущая задержка - время
+    с момента, когда он должен был прийти.
+
+    drift - окно опозданий срабатываний таймеров (заполняет бот): раз в
+    report_interval секунд (0 - без отчетов) в лог пишутся перцентили
+    задержки пульса за последние 10 минут рядом с перцентилями последних
+    срабатываний.
+    """
+
+    def __init__(self, interval: float = 0.1, report_interval: float = 0.0, drift: Optional[LatencyWindow] = None):
+        self._interval = interval
+        self._report_interval = report_interval
+        self._expected = 0.0
+        self._lag = 0.0
+        self._task: Optional[asyncio.Task] = None
+        # Отсчеты пульса за последние 10 минут
+        self.samples = LatencyWindow(int(600 / interval))
+        self.drift = drift
+        self.slow_callbacks = 0
+        self.samples.expose(LOOP_LAG_QUANTILES)
+        if drift is not None:
+            drift.expose(FIRE_DRIFT_QUANTILES)
+
+    @property
+    def lag(self) -> float:
+        """Текущая оценка задержки цикла, секунды"""
+        if self._task is None:
+            return 0.0
+        return max(self._lag, time.monotonic() - self._expected)
+
+    @property
+    def expected(self) -> float:
+        """Когда должен прийти следующий пульс (time.monotonic), 0 - монитор не запущен"""
+        return self._expected if self._task is not None else 0.0
+
+    async def _run(self) -> None:
+        next_report = time.monotonic() + self._report_interval
+        while True:
+            self._expected = time.monotonic() + self._interval
+            await asyncio.sleep(self._interval)
+            now = time.monotonic()
+            lag = max(0.0, now - self._expected)
+            # Быстро растет и плавно спадает: одиночный пульс вовремя не снимает перегрузку
+            self._lag = max(lag, self._lag * 0.5)
+            LOOP_LAG.set(self._lag)
+            LOOP_LAG_HEARTBEAT.observe(lag)
+            self.samples.add(lag)
+            if self._report_interval > 0 and now >= next_report:
+                self.report()
+                next_report = now + self._report_interval
+
+    def report(self) -> None:
+        """Пишет в лог перцентили задержки пульса рядом с опозданием срабатываний"""
+        if not len(self.samples):
+            return
+        drift = self.drift.describe() if self.drift is not None else 'нет данных'
+        logger.info(
+            "Цикл событий %s: задержка пульса, мс: %s; опоздание срабатываний, мс: %s; остановок цикла: %s",
+            loop_name(asyncio.get_running_loop()), self.samples.describe(), drift, self.slow_callbacks,
+        )
+
+    def start(self) -> None:
+        if self._task is None:
+            self._expected = time.monotonic() + self._interval
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class SlowCallbackWatchdog:
+    """
+    Поиск кода, который держит цикл событий
+
+    Отдельный поток раз в threshold / 2 секунд смотрит на пульс
+    LoopLagMonitor. Если пульс опоздал больше чем на threshold, поток
+    снимает стек потока цикла и пишет его в лог - один раз на остановку
+    цикла. Стек снимается в момент остановки, поэтому указывает на
+    виновника, даже если это синхронный вызов внутри корутины.
+    """
+
+    def __init__(self, monitor: LoopLagMonitor, threshold: float = 0.25):
+        self._monitor = monitor
+        self._threshold = threshold
+        self._loop_thread_id: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Вызывается из потока цикла событий"""
+        if self._thread is not None or self._threshold <= 0:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='slow-callback-watchdog', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _watch(self) -> None:
+        reported = 0.0
+        while not self._stop.wait(self._threshold / 2):
+            expected = self._monitor.expected
+            if not expected or expected == reported:
+                continue
+            stalled = time.monotonic() - expected
+            if stalled < self._threshold:
+                continue
+            # Пульс с этим сроком так и не пришел: остановка цикла, о ней пишем один раз
+            reported = expected
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            self._monitor.slow_callbacks += 1
+            SLOW_CALLBACKS.inc()
+            logger.warning("Цикл событий занят дольше %.3f с, стек:\n%s", stalled, format_callback_stack(frame))
+
+
+def format_callback_stack(frame) -> str:
+    """Стек потока цикла начиная с вызванного циклом колбэка, без кадров самого цикла"""
+    stack = traceback.extract_stack(frame)
+    # Снаружи внутрь: запуск программы, кадры asyncio (у uvloop - только Runner), затем колбэк
+    start = 0
+    for i, entry in enumerate(stack):
+        if entry.filename.startswith(ASYNCIO_DIR):
+            start = i + 1
+        elif start:
+            break
+    return ''.join(traceback.format_list(stack[start:])).rstrip()
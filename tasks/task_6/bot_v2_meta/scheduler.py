@@ -0,0 +1,163 @@
+"""
+Планировщик таймеров на основе хешированного колеса времени
+
+Вместо отдельной asyncio.Task на каждый таймер все дедлайны хранятся
+в корзинах по номеру тика, а один фоновый цикл раз в тик забирает
+созревшие корзины и передает их обработчику пачкой.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Длительность одного тика колеса в секундах
+DEFAULT_TICK = 0.1
+
+
+class TimerScheduler:
+    """
+    Хешированное колесо времени с одним управляющим циклом
+
+    Вставка и отмена работают за O(1): запись кладется в множество-корзину
+    по номеру тика, в котором она должна сработать. Все таймеры, созревшие
+    за один проход цикла, передаются в on_fire одним списком.
+    """
+
+    def __init__(self, on_fire: Callable[[List[TimerRecord]], None], tick: float = DEFAULT_TICK):
+        self._on_fire = on_fire
+        self._tick = tick
+        self._origin = time.monotonic()
+        # Номер тика -> записи, которые должны сработать в этом тике
+        self._buckets: Dict[int, Set[TimerRecord]] = {}
+        # Последний обработанный тик
+        self._current = 0
+        self._count = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _tick_for(self, deadline: float) -> int:
+        """Возвращает номер тика, не раньше которого истекает дедлайн"""
+        tick = math.ceil((deadline - self._origin) / self._tick)
+        return max(tick, self._current + 1)
+
+    def schedule(self, record: TimerRecord) -> None:
+        """Добавляет таймер в колесо"""
+        if record.tick is not None:
+            self.cancel(record)
+        tick = self._tick_for(record.deadline)
+        bucket = self._buckets.get(tick)
+        if bucket is None:
+            bucket = self._buckets[tick] = set()
+        bucket.add(record)
+        record.tick = tick
+        self._count += 1
+        self._wakeup.set()
+
+    def schedule_many(self, records: Iterable[TimerRecord]) -> None:
+        """
+        Добавляет пачку таймеров
+        Быстрый путь для восстановления: без вызова schedule() на каждую запись
+        """
+        buckets = self._buckets
+        origin = self._origin
+        tick_size = self._tick
+        first = self._current + 1
+        ceil = math.ceil
+        count = 0
+        for record in records:
+            if record.tick is not None:
+                self.cancel(record)
+            tick = ceil((record.deadline - origin) / tick_size)
+            if tick < first:
+                tick = first
+            bucket = buckets.get(tick)
+            if bucket is None:
+                bucket = buckets[tick] = set()
+            bucket.add(record)
+            record.tick = tick
+            count += 1
+        if count:
+            self._count += count
+            self._wakeup.set()
+
+    def cancel(self, record: TimerRecord) -> bool:
+        """
+        Убирает таймер из колеса
+        Возвращает True если таймер был запланирован
+        """
+        bucket = self._buckets.get(record.tick) if record.tick is not None else None
+        if bucket is None or record not in bucket:
+            return False
+        bucket.discard(record)
+        if not bucket:
+            del self._buckets[record.tick]
+        record.tick = None
+        self._count -= 1
+        return True
+
+    def pending(self) -> List[TimerRecord]:
+        """Возвращает все запланированные таймеры"""
+        return [record for bucket in self._buckets.values() for record in bucket]
+
+    def _collect_due(self, target: int) -> List[TimerRecord]:
+        """Забирает все корзины с номерами тиков до target включительно"""
+        if target - self._current > len(self._buckets):
+            # После долгого простоя дешевле пройтись по корзинам, чем по тикам
+            ticks = sorted(tick for tick in self._buckets if tick <= target)
+        else:
+            ticks = range(self._current + 1, target + 1)
+
+        due: List[TimerRecord] = []
+        for tick in ticks:
+            bucket = self._buckets.pop(tick, None)
+            if bucket:
+                due.extend(bucket)
+        self._current = target
+        return due
+
+    async def _run(self) -> None:
+        """Управляющий цикл колеса"""
+        while True:
+            if not self._count:
+                # Нет таймеров - спим до первого schedule()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            target = int((time.monotonic() - self._origin) / self._tick)
+            if target > self._current:
+                due = self._collect_due(target)
+                if due:
+                    self._count -= len(due)
+                    for record in due:
+                        record.tick = None
+                    try:
+                        self._on_fire(due)
+                    except Exception as e:
+                        logger.error("Ошибка в обработчике срабатывания таймеров: %s", e, exc_info=True)
+
+            next_at = self._origin + (self._current + 1) * self._tick
+            await asyncio.sleep(max(0.0, next_at - time.monotonic()))
+
+    def start(self) -> None:
+        """Запускает управляющий цикл"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает управляющий цикл, не трогая запланированные таймеры"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
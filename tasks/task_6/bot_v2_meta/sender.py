@@ -0,0 +1,382 @@
+"""
+Очередь исходящих сообщений
+
+Уведомления не отправляются напрямую из планировщика: они попадают
+в очередь, которую разбирают несколько воркеров. Очередь соблюдает
+глобальный лимит сообщений в секунду и лимиты на отдельный чат,
+учитывает retry_after из ответов 429 и повторяет временные ошибки
+с экспоненциальной задержкой.
+
+Уведомления о срабатывании таймеров ставятся строками (submit_line):
+если в чате уже ждет неотправленное уведомление, строка дописывается
+в него. Поэтому при массовом срабатывании чат получает одно сообщение,
+а не по сообщению на таймер, и опоздание в группе не растет с числом
+таймеров. Готовые к отправке чаты выдаются в порядке самого раннего
+дедлайна (EDF), а глобальная корзина с маленьким запасом растягивает
+всплеск на равномерную отправку с частотой global_rate.
+
+Объединение идет внутри процесса. В режиме шардов это не мешает:
+шард выбирается по чату, и все срабатывания чата приходят в очередь
+одного воркера. Лимиты же считаются каждым воркером отдельно.
+"""
+
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramRetryAfter,
+)
+
+from metrics import NOTICE_LATENESS, OUTBOUND_COALESCED, OUTBOUND_LAG
+
+logger = logging.getLogger(__name__)
+
+# Максимальная задержка между повторами при временных ошибках, секунды
+MAX_BACKOFF = 30.0
+# Лимит Telegram на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не больше capacity про запас"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Возвращает, сколько секунд ждать до появления токена (0 - токен есть)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Забирает токен (вызывать после delay() == 0)"""
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """Корзина полностью восстановилась и ее можно забыть"""
+        self._refill(now)
+        return self.tokens >= self.capacity
+
+
+class OutboundMessage:
+    """Сообщение в очереди на отправку"""
+
+    __slots__ = ('chat_id', 'text', 'lines', 'length', 'kwargs', 'enqueued_at', 'due', 'attempts')
+
+    def __init__(self, chat_id: int, text: str, kwargs: Dict[str, Any], due: Optional[float] = None):
+        self.chat_id = chat_id
+        self.text = text
+        # Строки уведомлений, которые можно дописывать до отправки (None - обычное сообщение)
+        self.lines: Optional[List[str]] = None
+        self.length = len(text)
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        # Срок, к которому сообщение должно уйти: дедлайн таймера или время постановки
+        self.due = self.enqueued_at if due is None else due
+        self.attempts = 0
+
+    def render(self) -> str:
+        if self.lines is not None:
+            return '\n'.join(self.lines)
+        return self.text
+
+
+class ChatQueue:
+    """Очередь сообщений одного чата и его лимит"""
+
+    __slots__ = ('messages', 'bucket')
+
+    def __init__(self, bucket: TokenBucket):
+        self.messages: Deque[OutboundMessage] = deque()
+        self.bucket = bucket
+
+
+class OutboundQueue:
+    """
+    Очередь исходящих сообщений с ограничением частоты
+
+    Чаты, ожидающие своего лимита, лежат в куче по времени готовности,
+    готовые - в куче по сроку первого сообщения. Воркер дожидается токена
+    глобальной корзины, забирает готовый чат с самым ранним сроком,
+    отправляет одно сообщение и возвращает чат в кучу, если в нем еще
+    что-то есть. Пока сообщение чата в полете, чат не выдается другим
+    воркерам, поэтому порядок сообщений внутри чата сохраняется.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        workers: int = 8,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate: float = 20 / 60,
+        max_attempts: int = 5,
+        report_interval: float = 60.0,
+        burst: float = 0.1,
+    ):
+        self._bot = bot
+        self._workers_count = workers
+        # Запас глобальной корзины - burst секунд отправки: всплеск уходит равномерно
+        self._global = TokenBucket(global_rate, max(1.0, global_rate * burst))
+        self._chat_rate = chat_rate
+        self._group_rate = group_rate
+        self._max_attempts = max_attempts
+        self._report_interval = report_interval
+
+        self._chats: Dict[int, ChatQueue] = {}
+        # Куча (время готовности, порядковый номер, chat_id) чатов, ждущих своего лимита
+        self._waiting: List[Tuple[float, int, int]] = []
+        # Куча (срок первого сообщения, порядковый номер, chat_id) готовых чатов
+        self._ready: List[Tuple[float, int, int]] = []
+        # Чаты, которые сейчас в куче или в руках воркера
+        self._owned: Set[int] = set()
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: List[asyncio.Task] = []
+        self._reporter: Optional[asyncio.Task] = None
+
+        # Статистика
+        self.queued = 0
+        self.in_flight = 0
+        self.delivered = 0
+        self.dropped = 0
+        self.retried = 0
+        self.throttled = 0
+        self.coalesced = 0
+        self._lag_sum = 0.0
+        self._lag_max = 0.0
+        self._lag_count = 0
+
+    def __len__(self) -> int:
+        return self.queued
+
+    def _new_bucket(self, chat_id: int) -> TokenBucket:
+        # У групп и каналов отрицательный chat_id и более строгий лимит
+        if chat_id < 0:
+            return TokenBucket(self._group_rate, 3)
+        return TokenBucket(self._chat_rate, 3)
+
+    def _push(self, chat_id: int, ready_at: float) -> None:
+        self._seq += 1
+        if ready_at <= time.monotonic():
+            due = self._chats[chat_id].messages[0].due
+            heapq.heappush(self._ready, (due, self._seq, chat_id))
+        else:
+            heapq.heappush(self._waiting, (ready_at, self._seq, chat_id))
+        self._wakeup.set()
+
+    def _enqueue(self, chat_id: int, message: OutboundMessage) -> None:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = ChatQueue(self._new_bucket(chat_id))
+        chat.messages.append(message)
+        self.queued += 1
+        self._idle.clear()
+        if chat_id not in self._owned:
+            self._owned.add(chat_id)
+            self._push(chat_id, time.monotonic())
+
+    def submit(self, chat_id: int, text: str, **kwargs: Any) -> None:
+        """Ставит сообщение в очередь, не дожидаясь отправки"""
+        self._enqueue(chat_id, OutboundMessage(chat_id, text, kwargs))
+
+    def submit_line(self, chat_id: int, line: str, due: float) -> None:
+        """
+        Ставит строку уведомления со сроком due (time.monotonic())
+        Если последнее сообщение чата - еще не отправленное уведомление
+        и строка в него помещается, она дописывается туда
+        """
+        chat = self._chats.get(chat_id)
+        if chat is not None and chat.messages:
+            tail = chat.messages[-1]
+            if tail.lines is not None and tail.length + 1 + len(line) <= MAX_MESSAGE_LENGTH:
+                tail.lines.append(line)
+                tail.length += 1 + len(line)
+                self.coalesced += 1
+                OUTBOUND_COALESCED.inc()
+                return
+        message = OutboundMessage(chat_id, '', {}, due)
+        message.lines = [line]
+        message.length = len(line)
+        self._enqueue(chat_id, message)
+
+    async def _next_chat(self) -> int:
+        """Ждет готовый чат с самым ранним сроком и токен глобальной корзины"""
+        while True:
+            now = time.monotonic()
+            waiting = self._waiting
+            while waiting and waiting[0][0] <= now:
+                _, seq, chat_id = heapq.heappop(waiting)
+                heapq.heappush(self._ready, (self._chats[chat_id].messages[0].due, seq, chat_id))
+
+            if self._ready:
+                delay = self._global.delay(now)
+                if delay <= 0:
+                    return heapq.heappop(self._ready)[2]
+            elif waiting:
+                delay = waiting[0][0] - now
+            else:
+                delay = None
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _release(self, chat_id: int, ready_at: float) -> None:
+        """Возвращает чат в кучу или отпускает его, если очередь чата пуста"""
+        chat = self._chats[chat_id]
+        if chat.messages:
+            self._push(chat_id, ready_at)
+            return
+        self._owned.discard(chat_id)
+        if chat.bucket.is_full(time.monotonic()):
+            del self._chats[chat_id]
+        if not self.queued and not self.in_flight:
+            self._idle.set()
+
+    def _backoff(self, attempts: int) -> float:
+        return min(MAX_BACKOFF, 0.5 * 2 ** attempts) * random.uniform(0.8, 1.2)
+
+    async def _send(self, chat_id: int) -> None:
+        """Отправляет одно сообщение чата с учетом лимитов"""
+        chat = self._chats[chat_id]
+        now = time.monotonic()
+        delay = max(chat.bucket.delay(now), self._global.delay(now))
+        if delay > 0:
+            self._push(chat_id, now + delay)
+            return
+
+        chat.bucket.take()
+        self._global.take()
+        message = chat.messages.popleft()
+        self.queued -= 1
+        self.in_flight += 1
+        ready_at = 0.0
+        try:
+            message.attempts += 1
+            await self._bot.send_message(message.chat_id, message.render(), **message.kwargs)
+            self._on_delivered(message)
+        except TelegramRetryAfter as e:
+            self.throttled += 1
+            logger.warning("Telegram ограничил отправку в чат %s, повтор через %s с", chat_id, e.retry_after)
+            chat.messages.appendleft(message)
+            self.queued += 1
+            ready_at = time.monotonic() + e.retry_after
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Бот заблокирован или запрос некорректен - повтор не поможет
+            self.dropped += 1
+            logger.error("Сообщение в чат %s отброшено: %s", chat_id, e)
+        except Exception as e:
+            if message.attempts >= self._max_attempts:
+                self.dropped += 1
+                logger.error("Сообщение в чат %s отброшено после %s попыток: %s", chat_id, message.attempts, e)
+            else:
+                self.retried += 1
+                logger.warning("Ошибка отправки в чат %s (попытка %s): %s", chat_id, message.attempts, e)
+                chat.messages.appendleft(message)
+                self.queued += 1
+                ready_at = time.monotonic() + self._backoff(message.attempts)
+        finally:
+            self.in_flight -= 1
+            self._release(chat_id, ready_at)
+
+    def _on_delivered(self, message: OutboundMessage) -> None:
+        self.delivered += 1
+        now = time.monotonic()
+        lag = now - message.enqueued_at
+        OUTBOUND_LAG.observe(lag)
+        if message.lines is not None:
+            NOTICE_LATENESS.observe(now - message.due)
+        self._lag_sum += lag
+        self._lag_count += 1
+        if lag > self._lag_max:
+            self._lag_max = lag
+
+    async def _worker(self) -> None:
+        while True:
+            chat_id = await self._next_chat()
+            try:
+                await self._send(chat_id)
+            except Exception as e:
+                logger.error("Ошибка воркера очереди отправки: %s", e, exc_info=True)
+
+    def stats(self) -> Dict[str, float]:
+        """Возвращает текущую статистику очереди и сбрасывает окно задержек"""
+        lag_avg = self._lag_sum / self._lag_count if self._lag_count else 0.0
+        result = {
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'chats': len(self._owned),
+            'delivered': self.delivered,
+            'dropped': self.dropped,
+            'retried': self.retried,
+            'throttled': self.throttled,
+            'coalesced': self.coalesced,
+            'lag_avg': lag_avg,
+            'lag_max': self._lag_max,
+        }
+        self._lag_sum = 0.0
+        self._lag_max = 0.0
+        self._lag_count = 0
+        return result
+
+    async def _report(self) -> None:
+        """Периодически пишет в лог глубину очереди и задержку доставки"""
+        last_delivered = 0
+        while True:
+            await asyncio.sleep(self._report_interval)
+            if not self.queued and self.delivered == last_delivered:
+                continue
+            last_delivered = self.delivered
+            stats = self.stats()
+            logger.info(
+                "Очередь отправки: в очереди %(queued)s, в полете %(in_flight)s, чатов %(chats)s, "
+                "доставлено %(delivered)s, отброшено %(dropped)s, 429 %(throttled)s, "
+                "объединено %(coalesced)s, "
+                "задержка ср. %(lag_avg).3f с / макс. %(lag_max).3f с",
+                stats,
+            )
+
+    def start(self) -> None:
+        """Запускает воркеры"""
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+            self._reporter = asyncio.create_task(self._report())
+
+    async def close(self, timeout: float = 5.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout) и останавливает воркеры"""
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Очередь отправки не успела опустеть, потеряно сообщений: %s", self.queued)
+
+        tasks = self._workers + ([self._reporter] if self._reporter else [])
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._reporter = None
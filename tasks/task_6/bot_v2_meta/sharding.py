@@ -0,0 +1,470 @@
+"""
+Шардирование таймеров между процессами
+
+Фронт-процесс принимает обновления, не разбирая их в объекты aiogram,
+вычисляет ключ таймера и пересылает обновление воркеру, владеющему
+шардом этого ключа. Шард выбирается по чату ключа: все таймеры чата
+живут в одном шарде, а шард в каждый момент принадлежит ровно одному
+воркеру. Поэтому /cancel и /status видят те же таймеры, что и /timer,
+квота MAX_TIMERS_PER_CHAT считается по всему чату, а срабатывания чата
+в одном тике объединяются в одно сообщение.
+
+Базы шардов, разложенные по прежней схеме (по паре чат и пользователь),
+фронт при старте перекладывает по чатам (rehome_shards).
+
+Шарды распределяются между живыми воркерами rendezvous-хешированием:
+при подключении или потере воркера переезжает минимум шардов. На время
+переезда обновления шарда буферизуются во фронте, старый владелец
+сохраняет таймеры шарда в его базу и отпускает его, новый поднимает их.
+
+Фронт и воркеры общаются через unix-сокет построчным JSON.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import struct
+import zlib
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from aiohttp import ClientError, ClientSession
+
+from protocol import LINE_LIMIT, encode
+from storage import COLUMNS, TimerRow, TimerStore, apply_migrations
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Сколько ждать, пока воркер отпустит шард, прежде чем считать его мертвым
+RELEASE_TIMEOUT = 30.0
+
+# Пауза перед перезапуском упавшего воркера
+RESPAWN_DELAY = 1.0
+
+# Раскладка таймеров по базам шардов: шард выбирается по чату ключа
+SHARD_LAYOUT = 'chat'
+LAYOUT_FILE = 'layout'
+
+
+def shard_for_key(key: Tuple[int, int], shard_count: int) -> int:
+    """
+    Номер шарда для ключа таймера (стабилен между процессами и запусками)
+    Зависит только от чата ключа: все таймеры чата - в одном шарде
+    """
+    return zlib.crc32(struct.pack('<q', key[0])) % shard_count
+
+
+def shard_path(directory: str, shard: int) -> str:
+    return os.path.join(directory, f'timers_shard_{shard:03d}.db')
+
+
+def rehome_shards(directory: str, shard_count: int) -> int:
+    """
+    Переносит таймеры в базы шардов их чатов, если базы разложены по
+    прежней схеме. Вызывается фронтом до запуска воркеров; возвращает
+    число перенесенных таймеров.
+
+    Сначала строки пишутся в базы назначения, потом удаляются из старых:
+    после сбоя посередине повторный запуск доводит перенос до конца.
+    """
+    os.makedirs(directory, exist_ok=True)
+    marker = os.path.join(directory, LAYOUT_FILE)
+    if os.path.exists(marker):
+        with open(marker, encoding='utf-8') as layout:
+            if layout.read().strip() == SHARD_LAYOUT:
+                return 0
+
+    connections: Dict[int, sqlite3.Connection] = {}
+    # База -> строки, которые должны жить в другом шарде
+    misplaced: Dict[int, List[tuple]] = {}
+    try:
+        for shard in range(shard_count):
+            path = shard_path(directory, shard)
+            if not os.path.exists(path):
+                continue
+            connections[shard] = conn = sqlite3.connect(path)
+            apply_migrations(conn)
+            rows = [
+                row for row in conn.execute(f'SELECT {COLUMNS} FROM timers')
+                if shard_for_key((row[0], row[1]), shard_count) != shard
+            ]
+            if rows:
+                misplaced[shard] = rows
+
+        targets: Dict[int, List[tuple]] = {}
+        for rows in misplaced.values():
+            for row in rows:
+                targets.setdefault(shard_for_key((row[0], row[1]), shard_count), []).append(row)
+        placeholders = ', '.join('?' * len(COLUMNS.split(',')))
+        for shard, rows in targets.items():
+            conn = connections.get(shard)
+            if conn is None:
+                connections[shard] = conn = sqlite3.connect(shard_path(directory, shard))
+                apply_migrations(conn)
+            with conn:
+                conn.executemany(f'INSERT OR REPLACE INTO timers ({COLUMNS}) VALUES ({placeholders})', rows)
+        for shard, rows in misplaced.items():
+            with connections[shard]:
+                connections[shard].executemany(
+                    'DELETE FROM timers WHERE key_chat_id = ? AND key_user_id = ? AND name = ?',
+                    [row[:3] for row in rows],
+                )
+    finally:
+        for conn in connections.values():
+            conn.close()
+
+    with open(marker, 'w', encoding='utf-8') as layout:
+        layout.write(SHARD_LAYOUT)
+    moved = sum(len(rows) for rows in misplaced.values())
+    if moved:
+        logger.info("Таймеры перенесены в шарды по чатам: %s", moved)
+    return moved
+
+
+def timer_key_for_update(update: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """
+    Ключ таймера для сырого обновления
+    Совпадает с get_timer_key() из обработчиков для сообщений и нажатий кнопок
+    """
+    message = update.get('message')
+    if message is not None:
+        user = message.get('from')
+    else:
+        callback = update.get('callback_query')
+        if callback is None:
+            return None
+        message = callback.get('message')
+        user = callback.get('from')
+    if message is None or user is None:
+        return None
+
+    chat = message['chat']
+    if chat['type'] == 'private':
+        return (user['id'], user['id'])
+    return (chat['id'], user['id'])
+
+
+def owner_for_shard(shard: int, workers: List[int]) -> int:
+    """Владелец шарда по rendezvous-хешированию среди живых воркеров"""
+    return max(workers, key=lambda worker: zlib.crc32(struct.pack('<ii', shard, worker)))
+
+
+class ShardedTimerStore:
+    """
+    Хранилище таймеров воркера: по отдельной базе SQLite на каждый шард
+
+    Повторяет интерфейс TimerStore, направляя put() и delete() в базу
+    шарда ключа. Воркер открывает базы только тех шардов, которыми владеет.
+    """
+
+    def __init__(self, directory: str, shard_count: int, commit_interval: float = 0.05):
+        self._directory = directory
+        self._shard_count = shard_count
+        self._commit_interval = commit_interval
+        self._stores: Dict[int, TimerStore] = {}
+
+    def path_for(self, shard: int) -> str:
+        return shard_path(self._directory, shard)
+
+    def shard_of(self, key: Tuple[int, int]) -> int:
+        return shard_for_key(key, self._shard_count)
+
+    async def open(self) -> None:
+        os.makedirs(self._directory, exist_ok=True)
+
+    async def load(self) -> List[TimerRow]:
+        # При старте воркер не владеет ни одним шардом, их выдает фронт
+        return []
+
+    async def load_batches(self, size: int = 0) -> AsyncIterator[List[TimerRow]]:
+        rows = await self.load()
+        if rows:
+            yield rows
+
+    def put(self, record: TimerRecord) -> None:
+        self._stores[self.shard_of(record.key)].put(record)
+
+    def delete(self, record: TimerRecord) -> None:
+        self._stores[self.shard_of(record.key)].delete(record)
+
+    async def acquire(self, shard: int) -> List[TimerRow]:
+        """Открывает базу шарда и возвращает его таймеры"""
+        store = TimerStore(self.path_for(shard), self._commit_interval)
+        await store.open()
+        self._stores[shard] = store
+        return await store.load()
+
+    async def release(self, shard: int) -> None:
+        """Сбрасывает изменения шарда на диск и закрывает его базу"""
+        store = self._stores.pop(shard, None)
+        if store is not None:
+            await store.close()
+
+    async def close(self) -> None:
+        for shard in list(self._stores):
+            await self.release(shard)
+
+
+class WorkerLink:
+    """Соединение фронта с одним воркером"""
+
+    def __init__(self, worker_id: int, writer: asyncio.StreamWriter):
+        self.worker_id = worker_id
+        self.writer = writer
+        self.shards: Set[int] = set()
+        # Шард -> ожидание подтверждения release
+        self.releasing: Dict[int, asyncio.Future] = {}
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self.writer.write(encode(message))
+
+
+class ShardRouter:
+    """Фронт: раздает шарды воркерам и маршрутизирует обновления"""
+
+    def __init__(self, socket_path: str, shard_count: int, worker_count: int, worker_command: List[str]):
+        self._socket_path = socket_path
+        self._shard_count = shard_count
+        self._worker_count = worker_count
+        self._worker_command = worker_command
+        self._links: Dict[int, WorkerLink] = {}
+        # Шард -> текущий владелец (нет ключа - шард без владельца или переезжает)
+        self._owners: Dict[int, WorkerLink] = {}
+        # Обновления шардов без владельца, ждущие окончания переезда
+        self._buffered: Dict[int, List[Dict[str, Any]]] = {}
+        self._rebalance_lock = asyncio.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._processes: Dict[int, asyncio.subprocess.Process] = {}
+        self._supervisors: List[asyncio.Task] = []
+        self._stopping = False
+
+        self.routed = 0
+
+    # --- Маршрутизация ---
+
+    def route(self, update: Dict[str, Any]) -> None:
+        """Отправляет обновление владельцу шарда или буферизует его на время переезда"""
+        key = timer_key_for_update(update)
+        if key is not None:
+            shard = shard_for_key(key, self._shard_count)
+        else:
+            # Обновления без ключа таймера не зависят от состояния шарда
+            shard = update.get('update_id', 0) % self._shard_count
+
+        link = self._owners.get(shard)
+        if link is None:
+            self._buffered.setdefault(shard, []).append(update)
+        else:
+            link.send({'op': 'update', 'shard': shard, 'update': update})
+        self.routed += 1
+
+    async def drain(self) -> None:
+        """Ждет, пока данные уйдут в сокеты воркеров"""
+        for link in list(self._links.values()):
+            try:
+                await link.writer.drain()
+            except ConnectionError:
+                pass
+
+    # --- Распределение шардов ---
+
+    async def _move(self, shard: int, target: WorkerLink) -> None:
+        current = self._owners.pop(shard, None)
+        if current is not None and current.worker_id in self._links:
+            # Старый владелец должен сохранить таймеры шарда и отпустить его
+            waiter = asyncio.get_running_loop().create_future()
+            current.releasing[shard] = waiter
+            current.send({'op': 'release', 'shard': shard})
+            try:
+                await asyncio.wait_for(waiter, RELEASE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.error("Воркер %s не отпустил шард %s за %s с", current.worker_id, shard, RELEASE_TIMEOUT)
+            current.shards.discard(shard)
+
+        if target.worker_id not in self._links:
+            return
+        target.send({'op': 'assign', 'shard': shard})
+        target.shards.add(shard)
+        for update in self._buffered.pop(shard, []):
+            target.send({'op': 'update', 'shard': shard, 'update': update})
+        self._owners[shard] = target
+
+    async def _rebalance(self) -> None:
+        """Приводит владение шардами в соответствие с составом живых воркеров"""
+        async with self._rebalance_lock:
+            if not self._links:
+                logger.warning("Нет живых воркеров, обновления буферизуются")
+                return
+            workers = sorted(self._links)
+            moves = []
+            for shard in range(self._shard_count):
+                target = self._links[owner_for_shard(shard, workers)]
+                if self._owners.get(shard) is not target:
+                    moves.append(self._move(shard, target))
+            if moves:
+                await asyncio.gather(*moves)
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(
+                        "Перераспределено шардов: %s, воркеры: %s",
+                        len(moves), ", ".join(f"{w}={len(self._links[w].shards)}" for w in workers),
+                    )
+
+    # --- Соединения воркеров ---
+
+    async def _on_connect(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        link: Optional[WorkerLink] = None
+        try:
+            hello = json.loads(await reader.readline())
+            link = WorkerLink(int(hello['worker']), writer)
+            self._links[link.worker_id] = link
+            logger.info("Воркер %s подключился", link.worker_id)
+            asyncio.create_task(self._rebalance())
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message['op'] == 'released':
+                    waiter = link.releasing.pop(message['shard'], None)
+                    if waiter is not None and not waiter.done():
+                        waiter.set_result(None)
+        except (ConnectionError, ValueError) as e:
+            logger.error("Ошибка соединения с воркером: %s", e)
+        finally:
+            if link is not None and self._links.get(link.worker_id) is link:
+                del self._links[link.worker_id]
+                # Шарды мертвого воркера остаются без владельца до перебалансировки
+                for shard in link.shards:
+                    if self._owners.get(shard) is link:
+                        del self._owners[shard]
+                for waiter in link.releasing.values():
+                    if not waiter.done():
+                        waiter.set_result(None)
+                logger.warning("Воркер %s отключился, шардов без владельца: %s", link.worker_id, len(link.shards))
+                if not self._stopping:
+                    asyncio.create_task(self._rebalance())
+            writer.close()
+
+    async def _supervise(self, worker_id: int) -> None:
+        """Запускает воркер и перезапускает его после падения"""
+        while not self._stopping:
+            process = await asyncio.create_subprocess_exec(*self._worker_command, str(worker_id))
+            self._processes[worker_id] = process
+            code = await process.wait()
+            if self._stopping:
+                return
+            logger.error("Воркер %s завершился с кодом %s, перезапуск через %s с", worker_id, code, RESPAWN_DELAY)
+            await asyncio.sleep(RESPAWN_DELAY)
+
+    async def start(self) -> None:
+        """Открывает сокет для воркеров и запускает их"""
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+        self._server = await asyncio.start_unix_server(self._on_connect, self._socket_path, limit=LINE_LIMIT)
+        self._supervisors = [asyncio.create_task(self._supervise(i)) for i in range(self._worker_count)]
+        logger.info("Фронт запущен: воркеров %s, шардов %s", self._worker_count, self._shard_count)
+
+    async def stop(self) -> None:
+        """Останавливает воркеры (они сохраняют свои шарды) и закрывает сокет"""
+        self._stopping = True
+        for process in self._processes.values():
+            if process.returncode is None:
+                process.terminate()
+        await asyncio.gather(*(p.wait() for p in self._processes.values()), return_exceptions=True)
+        for task in self._supervisors:
+            task.cancel()
+        await asyncio.gather(*self._supervisors, return_exceptions=True)
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+
+
+class ShardWorker:
+    """Сторона воркера: получает шарды и обновления от фронта"""
+
+    def __init__(
+        self,
+        socket_path: str,
+        worker_id: int,
+        on_assign: Callable[[int], Awaitable[None]],
+        on_release: Callable[[int], Awaitable[None]],
+        on_update: Callable[[Dict[str, Any]], Awaitable[Any]],
+    ):
+        self._socket_path = socket_path
+        self._worker_id = worker_id
+        self._on_assign = on_assign
+        self._on_release = on_release
+        self._on_update = on_update
+        # Шард -> обработчики его обновлений, которые еще выполняются
+        self._in_flight: Dict[int, Set[asyncio.Task]] = {}
+
+    async def _process(self, update: Dict[str, Any]) -> None:
+        try:
+            await self._on_update(update)
+        except Exception as e:
+            logger.error("Ошибка обработки обновления %s: %s", update.get('update_id'), e, exc_info=True)
+
+    async def run(self) -> None:
+        """Работает, пока фронт не закроет соединение"""
+        reader, writer = await asyncio.open_unix_connection(self._socket_path, limit=LINE_LIMIT)
+        writer.write(encode({'op': 'hello', 'worker': self._worker_id}))
+        logger.info("Воркер %s подключен к фронту", self._worker_id)
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            op = message['op']
+            shard = message['shard']
+
+            if op == 'update':
+                task = asyncio.create_task(self._process(message['update']))
+                tasks = self._in_flight.setdefault(shard, set())
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            elif op == 'assign':
+                # Обрабатываем синхронно: следующие обновления шарда должны видеть его таймеры
+                await self._on_assign(shard)
+            elif op == 'release':
+                tasks = self._in_flight.pop(shard, set())
+                if tasks:
+                    await asyncio.gather(*tasks, return_exceptions=True)
+                await self._on_release(shard)
+                writer.write(encode({'op': 'released', 'shard': shard}))
+                await writer.drain()
+
+        writer.close()
+        logger.info("Фронт закрыл соединение с воркером %s", self._worker_id)
+
+
+async def poll_raw_updates(url: str, on_update: Callable[[Dict[str, Any]], None], drain: Callable[[], Awaitable[None]], timeout: int = 30) -> None:
+    """
+    Long polling getUpdates без разбора обновлений в объекты aiogram
+    Каждое обновление передается в on_update как словарь
+    """
+    offset = 0
+    async with ClientSession() as session:
+        while True:
+            try:
+                async with session.post(url, json={'offset': offset, 'timeout': timeout}) as response:
+                    data = await response.json(loads=json.loads)
+            except (ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.error("Ошибка getUpdates: %s", e)
+                await asyncio.sleep(1)
+                continue
+
+            if not data.get('ok'):
+                logger.error("getUpdates вернул ошибку: %s", data.get('description'))
+                await asyncio.sleep(data.get('parameters', {}).get('retry_after', 1))
+                continue
+
+            for update in data['result']:
+                offset = update['update_id'] + 1
+                on_update(update)
+            await drain()
@@ -0,0 +1,260 @@
+"""
+Долговременное хранилище таймеров
+
+Таймеры хранятся в SQLite в режиме WAL. Изменения из обработчиков
+не пишутся на диск сразу: они копятся в памяти и фиксируются одной
+транзакцией раз в STORE_COMMIT_INTERVAL (групповой коммит), поэтому
+команда /timer не ждет fsync.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from recurrence import from_spec
+from timers import TimerRecord
+
+logger = logging.getLogger(__name__)
+
+# Строк в пачке при чтении таймеров на старте
+LOAD_BATCH = 10000
+
+# Строка таймера в хранилище:
+# (key_chat_id, key_user_id, name, chat_id, deadline, duration, source, created_at, message_id, recurrence, owner)
+# deadline и created_at - по настенным часам (time.time())
+# recurrence - spec повторяющегося таймера (см. recurrence.py) или NULL для разового
+# owner - имя владельца для упоминания в группе
+TimerRow = Tuple[int, int, str, int, float, int, str, float, Optional[int], Optional[str], str]
+
+COLUMNS = (
+    'key_chat_id, key_user_id, name, chat_id, deadline, duration, source, created_at, message_id, recurrence, owner'
+)
+
+# Миграции схемы: элемент i переводит базу с PRAGMA user_version = i на i + 1
+# Миграция - SQL-выражение или кортеж выражений, выполняемых в одной транзакции
+MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS timers (
+        key_chat_id INTEGER NOT NULL,
+        key_user_id INTEGER NOT NULL,
+        chat_id INTEGER NOT NULL,
+        deadline REAL NOT NULL,
+        duration INTEGER NOT NULL,
+        PRIMARY KEY (key_chat_id, key_user_id)
+    ) WITHOUT ROWID
+    """,
+    "ALTER TABLE timers ADD COLUMN source TEXT NOT NULL DEFAULT 'command'",
+    # Для таймеров, сохраненных до этой миграции, время создания неизвестно
+    "ALTER TABLE timers ADD COLUMN created_at REAL NOT NULL DEFAULT 0",
+    "ALTER TABLE timers ADD COLUMN message_id INTEGER",
+    # Несколько именованных таймеров на ключ: имя входит в первичный ключ,
+    # поэтому таблица пересоздается
+    (
+        """
+        CREATE TABLE timers_named (
+            key_chat_id INTEGER NOT NULL,
+            key_user_id INTEGER NOT NULL,
+            name TEXT NOT NULL DEFAULT '',
+            chat_id INTEGER NOT NULL,
+            deadline REAL NOT NULL,
+            duration INTEGER NOT NULL,
+            source TEXT NOT NULL DEFAULT 'command',
+            created_at REAL NOT NULL DEFAULT 0,
+            message_id INTEGER,
+            PRIMARY KEY (key_chat_id, key_user_id, name)
+        ) WITHOUT ROWID
+        """,
+        """
+        INSERT INTO timers_named
+        SELECT key_chat_id, key_user_id, '', chat_id, deadline, duration, source, created_at, message_id
+        FROM timers
+        """,
+        "DROP TABLE timers",
+        "ALTER TABLE timers_named RENAME TO timers",
+    ),
+    "ALTER TABLE timers ADD COLUMN recurrence TEXT",
+    "ALTER TABLE timers ADD COLUMN owner TEXT NOT NULL DEFAULT ''",
+]
+
+
+def apply_migrations(conn: sqlite3.Connection) -> None:
+    """Доводит схему базы до последней версии"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        statements = (migration,) if isinstance(migration, str) else migration
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+
+
+def record_to_row(record: TimerRecord) -> TimerRow:
+    """Переводит запись таймера в строку хранилища"""
+    deadline = time.time() + (record.deadline - time.monotonic())
+    return (
+        record.key[0], record.key[1], record.name, record.chat_id, deadline, record.duration,
+        record.source, record.created_at, record.message_id,
+        record.recurrence.spec if record.recurrence is not None else None, record.owner,
+    )
+
+
+def rows_to_records(rows: List[TimerRow], timezone: str) -> List[TimerRecord]:
+    """
+    Восстанавливает пачку записей таймеров с единой точкой отсчета времени
+    timezone - часовой пояс календарных повторяющихся таймеров
+    """
+    now = time.time()
+    now_monotonic = time.monotonic()
+    return [
+        TimerRecord(
+            (key_chat_id, key_user_id), chat_id, duration, now_monotonic + (deadline - now),
+            source, created_at, message_id, name,
+            from_spec(recurrence, timezone) if recurrence is not None else None, owner,
+        )
+        for (
+            key_chat_id, key_user_id, name, chat_id, deadline, duration, source, created_at, message_id, recurrence,
+            owner,
+        ) in rows
+    ]
+
+
+class TimerStore:
+    """
+    Хранилище таймеров с групповым коммитом
+
+    put() и delete() только обновляют буфер в памяти, поэтому их можно
+    вызывать прямо из обработчиков. Буфер сбрасывается фоновой задачей
+    в отдельном потоке, последнее изменение ключа перекрывает предыдущие.
+    """
+
+    def __init__(self, path: str, commit_interval: float = 0.05):
+        self._path = path
+        self._commit_interval = commit_interval
+        # (ключ, имя) таймера -> строка для записи или None для удаления
+        self._pending: Dict[Tuple[Tuple[int, int], str], Optional[TimerRow]] = {}
+        self._dirty = asyncio.Event()
+        # Все обращения к соединению идут через один поток
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='timer-store')
+        self._conn: Optional[sqlite3.Connection] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run_in_thread(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _open(self) -> None:
+        self._conn = sqlite3.connect(self._path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        # В режиме WAL синхронизация на диск происходит на чекпоинтах,
+        # зафиксированные транзакции переживают падение процесса
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        apply_migrations(self._conn)
+
+    def _snapshot(self) -> sqlite3.Cursor:
+        """
+        Курсор по снимку таблицы на момент вызова
+        Отдельное соединение в транзакции чтения: групповой коммит пишет
+        в основное соединение, а курсор не видит его изменений (WAL)
+        """
+        reader = sqlite3.connect(self._path, check_same_thread=False, isolation_level=None)
+        try:
+            reader.execute('BEGIN')
+            return reader.execute(f'SELECT {COLUMNS} FROM timers')
+        except Exception:
+            reader.close()
+            raise
+
+    def _load(self) -> List[TimerRow]:
+        return self._conn.execute(f'SELECT {COLUMNS} FROM timers').fetchall()
+
+    def _write(self, batch: Dict[Tuple[Tuple[int, int], str], Optional[TimerRow]]) -> None:
+        upserts = [row for row in batch.values() if row is not None]
+        deletes = [(key[0], key[1], name) for (key, name), row in batch.items() if row is None]
+        with self._conn:
+            if deletes:
+                self._conn.executemany(
+                    'DELETE FROM timers WHERE key_chat_id = ? AND key_user_id = ? AND name = ?', deletes
+                )
+            if upserts:
+                self._conn.executemany(
+                    f'INSERT OR REPLACE INTO timers ({COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', upserts
+                )
+
+    async def open(self) -> None:
+        """Открывает базу и запускает фоновый групповой коммит"""
+        await self._run_in_thread(self._open)
+        self._task = asyncio.create_task(self._run())
+        logger.info("Хранилище таймеров открыто: %s", self._path)
+
+    async def load(self) -> List[TimerRow]:
+        """Читает все сохраненные таймеры"""
+        return await self._run_in_thread(self._load)
+
+    async def load_batches(self, size: int = LOAD_BATCH) -> AsyncIterator[List[TimerRow]]:
+        """
+        Читает сохраненные таймеры пачками по size строк
+        Пока вызывающий разбирает пачку, поток хранилища уже читает следующую
+        Пачки берутся из одного снимка: таймеры, которые успели сработать
+        и сохраниться заново за время чтения, не читаются второй раз
+        """
+        cursor = await self._run_in_thread(self._snapshot)
+        try:
+            batch = await self._run_in_thread(cursor.fetchmany, size)
+            while batch:
+                following = asyncio.ensure_future(self._run_in_thread(cursor.fetchmany, size))
+                yield batch
+                batch = await following
+        finally:
+            await self._run_in_thread(cursor.connection.close)
+
+    def put(self, record: TimerRecord) -> None:
+        """Сохраняет таймер (запись попадет на диск со следующим коммитом)"""
+        self._pending[(record.key, record.name)] = record_to_row(record)
+        self._dirty.set()
+
+    def delete(self, record: TimerRecord) -> None:
+        """Удаляет таймер (удаление попадет на диск со следующим коммитом)"""
+        self._pending[(record.key, record.name)] = None
+        self._dirty.set()
+
+    async def flush(self) -> None:
+        """Фиксирует все накопленные изменения одной транзакцией"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self._run_in_thread(self._write, batch)
+        except Exception as e:
+            logger.error("Ошибка записи %s таймеров в хранилище: %s", len(batch), e, exc_info=True)
+            # Возвращаем изменения в буфер, не перекрывая более новые
+            for key, row in batch.items():
+                self._pending.setdefault(key, row)
+            self._dirty.set()
+
+    async def _run(self) -> None:
+        """Фоновый цикл группового коммита"""
+        while True:
+            await self._dirty.wait()
+            # Даем изменениям накопиться, чтобы заплатить за один коммит
+            await asyncio.sleep(self._commit_interval)
+            self._dirty.clear()
+            await self.flush()
+
+    async def close(self) -> None:
+        """Сбрасывает буфер на диск и закрывает базу"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            await self.flush()
+            await self._run_in_thread(self._conn.close)
+            self._conn = None
+        self._executor.shutdown(wait=True)
+        logger.info("Хранилище таймеров закрыто")
@@ -0,0 +1,193 @@
+"""
+Записи активных таймеров и их индекс
+
+У пользователя может быть несколько таймеров одновременно: таймер
+определяется ключом владельца (chat_id, user_id) и именем. Таймер без
+имени (пустая строка) - это прежний единственный таймер /timer 5m.
+"""
+
+import math
+from bisect import bisect_left, insort
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class TimerRecord:
+    """
+    Легковесная запись таймера
+
+    Хранит только то, что нужно для срабатывания и /status: ключ владельца,
+    чат для уведомления, дедлайн по monotonic-часам, время создания
+    (time.time()), id сообщения, которым запущен таймер, и источник
+    (команда или inline-кнопка) для метрик. Объект Message не хранится.
+    В группе хранится еще имя владельца для упоминания в уведомлении.
+    """
+
+    __slots__ = (
+        'key', 'name', 'chat_id', 'duration', 'deadline', 'created_at', 'message_id', 'source', 'recurrence', 'owner',
+        'tick',
+    )
+
+    def __init__(
+        self,
+        key: Tuple[int, int],
+        chat_id: int,
+        duration: int,
+        deadline: float,
+        source: str,
+        created_at: float,
+        message_id: Optional[int] = None,
+        name: str = '',
+        recurrence: Any = None,
+        owner: str = '',
+    ):
+        self.key = key
+        self.name = name
+        self.chat_id = chat_id
+        self.duration = duration
+        self.deadline = deadline
+        self.source = source
+        self.created_at = created_at
+        self.message_id = message_id
+        # Расписание повторяющегося таймера (recurrence.Recurrence) или None для разового
+        self.recurrence = recurrence
+        # Имя владельца для упоминания в групповом чате ('' - в личном чате)
+        self.owner = owner
+        # Номер тика планировщика, в корзине которого лежит запись
+        self.tick: Optional[int] = None
+
+    def remaining(self, now: float) -> int:
+        """Оставшееся время в целых секундах (с округлением вверх) на момент now по monotonic"""
+        return max(0, math.ceil(self.deadline - now))
+
+    def sort_key(self) -> Tuple[float, str]:
+        return (self.deadline, self.name)
+
+    def __repr__(self) -> str:
+        return f"TimerRecord(key={self.key}, name={self.name!r}, chat_id={self.chat_id}, deadline={self.deadline:.3f})"
+
+
+class TimerIndex:
+    """
+    Индекс активных таймеров
+
+    - (ключ, имя) -> запись: поиск и замена за O(1);
+    - ключ -> список записей, упорядоченный по дедлайну: /status отдает
+      его без сортировки, вставка - бинарный поиск по таймерам одного
+      пользователя, которых не больше квоты;
+    - счетчики таймеров на пользователя и на чат для проверки квот за O(1).
+
+    Ни одна операция не просматривает таймеры других пользователей.
+    """
+
+    def __init__(self):
+        self._records: Dict[Tuple[Tuple[int, int], str], TimerRecord] = {}
+        self._by_key: Dict[Tuple[int, int], List[TimerRecord]] = {}
+        self._per_chat: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[TimerRecord]:
+        return iter(list(self._records.values()))
+
+    def get(self, key: Tuple[int, int], name: str = '') -> Optional[TimerRecord]:
+        return self._records.get((key, name))
+
+    def list(self, key: Tuple[int, int]) -> List[TimerRecord]:
+        """Таймеры ключа по возрастанию дедлайна"""
+        return list(self._by_key.get(key, ()))
+
+    def count_for_key(self, key: Tuple[int, int]) -> int:
+        return len(self._by_key.get(key, ()))
+
+    def count_for_chat(self, chat_id: int) -> int:
+        return self._per_chat.get(chat_id, 0)
+
+    def add(self, record: TimerRecord) -> Optional[TimerRecord]:
+        """Добавляет запись, возвращает вытесненную запись с тем же ключом и именем"""
+        replaced = self.remove(record.key, record.name)
+        self._records[(record.key, record.name)] = record
+        insort(self._by_key.setdefault(record.key, []), record, key=TimerRecord.sort_key)
+        self._per_chat[record.chat_id] = self._per_chat.get(record.chat_id, 0) + 1
+        return replaced
+
+    def update(self, records: List[TimerRecord]) -> None:
+        """
+        Добавляет пачку записей (восстановление после перезапуска)
+        Записи дописываются в списки ключей, и затронутые списки сортируются
+        один раз в конце, а не вставкой на каждую запись
+        """
+        touched = set()
+        for record in records:
+            name_key = (record.key, record.name)
+            replaced = self._records.get(name_key)
+            if replaced is not None:
+                self._by_key[record.key].remove(replaced)
+                self._dec_chat(replaced.chat_id)
+            self._records[name_key] = record
+            bucket = self._by_key.get(record.key)
+            if bucket is None:
+                self._by_key[record.key] = [record]
+            else:
+                bucket.append(record)
+                touched.add(record.key)
+            self._per_chat[record.chat_id] = self._per_chat.get(record.chat_id, 0) + 1
+        for key in touched:
+            self._by_key[key].sort(key=TimerRecord.sort_key)
+
+    def remove(self, key: Tuple[int, int], name: str = '') -> Optional[TimerRecord]:
+        """Удаляет таймер по ключу и имени, возвращает удаленную запись"""
+        record = self._records.pop((key, name), None)
+        if record is not None:
+            self._unlink(record)
+        return record
+
+    def is_current(self, record: TimerRecord) -> bool:
+        """Запись все еще активна: не отменена и не заменена новой с тем же ключом и именем"""
+        return self._records.get((record.key, record.name)) is record
+
+    def discard(self, record: TimerRecord) -> bool:
+        """Удаляет именно эту запись, если она еще активна (не заменена новой)"""
+        if not self.is_current(record):
+            return False
+        del self._records[(record.key, record.name)]
+        self._unlink(record)
+        return True
+
+    def pop_all(self, key: Tuple[int, int]) -> List[TimerRecord]:
+        """Удаляет и возвращает все таймеры ключа"""
+        records = self._by_key.pop(key, [])
+        for record in records:
+            del self._records[(record.key, record.name)]
+            self._dec_chat(record.chat_id)
+        return records
+
+    def move(self, record: TimerRecord, deadline: float) -> None:
+        """Переносит дедлайн активной записи, сохраняя порядок списка ключа"""
+        self._unlink(record)
+        record.deadline = deadline
+        insort(self._by_key.setdefault(record.key, []), record, key=TimerRecord.sort_key)
+        self._per_chat[record.chat_id] = self._per_chat.get(record.chat_id, 0) + 1
+
+    def clear(self) -> None:
+        self._records.clear()
+        self._by_key.clear()
+        self._per_chat.clear()
+
+    def _unlink(self, record: TimerRecord) -> None:
+        records = self._by_key[record.key]
+        if len(records) == 1:
+            del self._by_key[record.key]
+        else:
+            index = bisect_left(records, record.sort_key(), key=TimerRecord.sort_key)
+            while records[index] is not record:
+                index += 1
+            del records[index]
+        self._dec_chat(record.chat_id)
+
+    def _dec_chat(self, chat_id: int) -> None:
+        count = self._per_chat[chat_id] - 1
+        if count:
+            self._per_chat[chat_id] = count
+        else:
+            del self._per_chat[chat_id]
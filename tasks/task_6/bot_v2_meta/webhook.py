@@ -0,0 +1,117 @@
+"""
+Прием обновлений через webhook
+
+aiohttp-сервер принимает обновления от Telegram, проверяет секретный
+токен и кладет сырые обновления в ограниченную очередь. Очередь
+разбирают воркеры, которые передают обновления в Dispatcher. Если
+очередь переполнена, сервер отвечает 503 и Telegram повторит доставку.
+
+Обработчик обновления задается снаружи: в обычном режиме это
+Dispatcher.feed_raw_update, во фронте шардирования - маршрутизация
+обновления воркеру.
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token из setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """Webhook-сервер с ограниченной очередью и пулом обработчиков"""
+
+    def __init__(
+        self,
+        process: Callable[[Dict[str, Any]], Awaitable[Any]],
+        path: str = '/webhook',
+        secret: Optional[str] = None,
+        queue_size: int = 1000,
+        workers: int = 16,
+    ):
+        self._process = process
+        self._path = path
+        self._secret = secret
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._workers_count = workers
+        self._workers: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+
+        # Статистика
+        self.received = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def _check_secret(self, request: web.Request) -> bool:
+        if not self._secret:
+            return True
+        token = request.headers.get(SECRET_HEADER, '')
+        return hmac.compare_digest(token, self._secret)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        """Принимает одно обновление от Telegram"""
+        if not self._check_secret(request):
+            logger.warning("Отклонен webhook-запрос с неверным секретом от %s", request.remote)
+            return web.Response(status=401)
+
+        try:
+            update: Dict[str, Any] = json.loads(await request.read())
+        except ValueError:
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            self.rejected += 1
+            return web.Response(status=503)
+
+        self.received += 1
+        return web.Response()
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                await self._process(update)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error("Ошибка обработки обновления %s: %s", update.get('update_id'), e, exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    async def start(self, host: str, port: int) -> None:
+        """Запускает HTTP-сервер и воркеры"""
+        app = web.Application()
+        app.router.add_post(self._path, self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self._workers_count)]
+        logger.info("Webhook-сервер слушает %s:%s%s, воркеров: %s", host, port, self._path, self._workers_count)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает прием, дорабатывает очередь (не дольше timeout) и гасит воркеры"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Не обработано обновлений при остановке webhook: %s", self._queue.qsize())
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []